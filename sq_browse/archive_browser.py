@@ -0,0 +1,420 @@
+"""Offline browsing of responses archived in WARC and HAR files, for reprocessing pages without the network.
+
+WARC files are memory-mapped. An index from the canonical url to the offset and length of the latest response record
+is built once per file and stored in the user's cache directory, keyed by the size and modification time of the file,
+so later runs start right away. Compressed WARC files have to compress every record as a gzip member of its own, as
+the WARC standard recommends; only the member of a requested record is decompressed. `revisit` records of
+deduplicated crawls are served with the payload of the record they refer to, found by its `WARC-Payload-Digest` or
+else by `WARC-Refers-To-Target-URI`; revisits whose original is in another file are skipped.
+
+HAR files are JSON, they are loaded and indexed in memory.
+"""
+import base64
+import hashlib
+import json
+import mmap
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Tuple
+from urllib.parse import urljoin
+
+from sq_browse.browser import Browser
+from sq_browse.encoding import declared_encoding
+from sq_browse.errors import ResponseTooLargeError
+from sq_browse.instrumentation import Timer
+from sq_browse.structs import BrowserResponse
+from sq_browse.utils import atomic_write, cache_dir, canonicalize_url
+
+REDIRECTS = {301, 302, 303, 307, 308}
+EPOCH = datetime(1970, 1, 1)
+
+
+def url_key(url: str) -> str:
+    return canonicalize_url(url) or url
+
+
+def parse_date(value: str | None) -> datetime:
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None) if value else EPOCH
+    except ValueError:
+        return EPOCH
+
+
+def parse_headers(lines: Iterable[str]) -> Dict[str, str]:
+    """Header lines as a dict with lowercase names, repeated headers are joined."""
+    headers = {}
+
+    for line in lines:
+        name, _, value = line.partition(":")
+
+        if name := name.strip().lower():
+            headers[name] = f"{headers[name]}, {value.strip()}" if name in headers else value.strip()
+
+    return headers
+
+
+def dechunk(body: bytes) -> bytes:
+    """Decode a body with chunked transfer encoding, as some archives store it."""
+    chunks = []
+    position = 0
+
+    while True:
+        line_end = body.find(b"\r\n", position)
+
+        if line_end < 0:
+            break
+
+        size = int(body[position:line_end].split(b";")[0].strip() or b"0", 16)
+
+        if size == 0:
+            break
+
+        chunks.append(body[line_end + 2:line_end + 2 + size])
+        position = line_end + 2 + size + 2
+
+    return b"".join(chunks)
+
+
+def decode_body(body: bytes, headers: Dict[str, str]) -> bytes:
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = dechunk(body)
+
+    content_encoding = headers.get("content-encoding", "").lower()
+
+    if content_encoding in ("gzip", "x-gzip", "deflate"):
+        try:
+            # gzip or zlib wrapped, raw deflate as a fallback
+            body = zlib.decompress(body, 47) if content_encoding != "deflate" else zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -15)
+
+    return body
+
+
+def parse_http(block: bytes) -> Tuple[int, str, Dict[str, str], bytes]:
+    """Status code, reason, headers and the still encoded payload of an HTTP response."""
+    http_end = block.find(b"\r\n\r\n")
+    http_end = len(block) if http_end < 0 else http_end
+    lines = block[:http_end].decode("iso-8859-1").split("\r\n")
+    _, status_code, reason = (lines[0].split(" ", 2) + ["", ""])[:3]
+
+    return int(status_code), reason, parse_headers(lines[1:]), block[http_end + 4:]
+
+
+class WarcArchive(object):
+    """Response and resource records of a WARC file, which may be gzip compressed."""
+    SCAN_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.compressed = self._map[:2] == b"\x1f\x8b"
+        # revisit records are indexed with the offset and length of their original
+        self.records: Dict[str, Tuple] = self.load_index()
+
+    def index_path(self) -> str:
+        name = hashlib.sha1(os.path.abspath(self.path).encode("utf-8", errors="surrogateescape")).hexdigest()
+
+        return os.path.join(cache_dir(), "archive_index", f"{name}.json")
+
+    def fingerprint(self) -> str:
+        stat = os.stat(self.path)
+
+        # the version changes with the format of the index
+        return f"2:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def load_index(self) -> Dict[str, Tuple]:
+        path = self.index_path()
+        fingerprint = self.fingerprint()
+
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+
+            if cached["fingerprint"] == fingerprint:
+                return cached["records"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        records = self.scan()
+
+        # a failing index cache only costs scanning again
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, json.dumps({"fingerprint": fingerprint, "records": records}))
+        except OSError:
+            pass
+
+        return records
+
+    def scan(self) -> Dict[str, Tuple]:
+        """Index the latest response of every url as `(offset, length, date)`.
+
+        Revisits are indexed as `(offset, length, date, original offset, original length)`.
+        """
+        records = {}
+        payloads = {}
+        revisits = []
+
+        for offset, length, headers in self.iter_records():
+            if headers.get("warc-type") not in ("response", "resource", "revisit") or "warc-target-uri" not in headers:
+                continue
+
+            # WARC 1.0 allowed the uri in angle brackets
+            key = url_key(headers["warc-target-uri"].strip("<>"))
+            date = headers.get("warc-date", "")
+
+            if headers["warc-type"] == "revisit":
+                revisits.append((key, (offset, length, date), headers))
+                continue
+
+            if digest := headers.get("warc-payload-digest"):
+                payloads.setdefault(digest, (offset, length))
+
+            if key not in records or records[key][2] <= date:
+                records[key] = (offset, length, date)
+
+        originals = dict(records)
+
+        for key, record, headers in revisits:
+            if (original := payloads.get(headers.get("warc-payload-digest"))) is None:
+                referred = originals.get(url_key(headers.get("warc-refers-to-target-uri", "").strip("<>")))
+                original = referred and referred[:2]
+
+            if original and (key not in records or records[key][2] <= record[2]):
+                records[key] = (*record, *original)
+
+        return records
+
+    def iter_records(self) -> Iterator[Tuple[int, int, Dict[str, str]]]:
+        offset = 0
+
+        while offset < len(self._map):
+            if self.compressed:
+                length, record = self._scan_member(offset)
+                headers, _, _ = self.parse_record(record, 0, len(record))
+            else:
+                headers, _, end = self.parse_record(self._map, offset, len(self._map))
+
+                # records are followed by two newlines
+                while end < len(self._map) and self._map[end:end + 1] in (b"\r", b"\n"):
+                    end += 1
+
+                length = end - offset
+
+            yield offset, length, headers
+            offset += length
+
+    def _scan_member(self, offset: int) -> Tuple[int, bytes]:
+        """Compressed length and content of the gzip member at the offset."""
+        decompressor = zlib.decompressobj(31)
+        position = offset
+        parts = []
+
+        while not decompressor.eof:
+            if position >= len(self._map):
+                raise ValueError(f"Truncated gzip member at offset {offset} of {self.path}")
+
+            chunk = self._map[position:position + self.SCAN_CHUNK_SIZE]
+            parts.append(decompressor.decompress(chunk))
+            position += len(chunk)
+
+        return position - offset - len(decompressor.unused_data), b"".join(parts)
+
+    def _inflate(self, offset: int, length: int) -> bytes:
+        return zlib.decompress(self._map[offset:offset + length], 31)
+
+    def read(self, offset: int, length: int) -> Tuple[Dict[str, str], bytes]:
+        """Headers and block of the WARC record."""
+        if self.compressed:
+            buffer, start = self._inflate(offset, length), 0
+        else:
+            buffer, start = self._map, offset
+
+        headers, block_start, block_end = self.parse_record(buffer, start, start + length)
+
+        return headers, bytes(buffer[block_start:block_end])
+
+    @staticmethod
+    def parse_block(headers: Dict[str, str], block: bytes) -> Tuple[int, str, Dict[str, str], bytes]:
+        """Status code, reason, headers and decoded body of a response or resource record."""
+        if headers["warc-type"] == "resource":
+            return 200, "OK", {"content-type": headers.get("content-type", "")}, block
+
+        status_code, reason, response_headers, payload = parse_http(block)
+
+        return status_code, reason, response_headers, decode_body(payload, response_headers)
+
+    @staticmethod
+    def parse_record(buffer, start: int, end: int) -> Tuple[Dict[str, str], int, int]:
+        """Headers of the WARC record at `start`, and the start and end of its block."""
+        header_end = buffer.find(b"\r\n\r\n", start, end)
+        lines = bytes(buffer[start:max(header_end, start)]).decode("utf-8", errors="replace").split("\r\n")
+
+        if header_end < 0 or not lines[0].startswith("WARC/"):
+            raise ValueError(f"No WARC record at offset {start}")
+
+        headers = parse_headers(lines[1:])
+        block_start = header_end + 4
+
+        return headers, block_start, block_start + int(headers.get("content-length") or 0)
+
+    def get(self, key: str) -> Tuple[str, BrowserResponse] | None:
+        """The date and the response archived for the canonical url, None if it is not archived."""
+        if (record := self.records.get(key)) is None:
+            return None
+
+        date = record[2]
+        headers, block = self.read(*record[:2])
+        url = headers["warc-target-uri"].strip("<>")
+
+        if headers["warc-type"] == "revisit":
+            status_code, reason, response_headers, body = self.parse_block(*self.read(*record[3:]))
+
+            # the revisit may repeat the HTTP headers, unless the server only answered "not modified"
+            if block.startswith(b"HTTP/") and (revisit := parse_http(block))[0] != 304:
+                status_code, reason, response_headers = revisit[:3]
+        else:
+            status_code, reason, response_headers, body = self.parse_block(headers, block)
+
+        return date, BrowserResponse(
+            url=url,
+            requested_url=url,
+            status_code=status_code,
+            reason=reason,
+            response_headers=response_headers,
+            content=body,
+            timestamp_start=parse_date(headers.get("warc-date")),
+            elapsed=timedelta(0),
+            meta={"archive": self.path, "received_bytes": 0},
+            encoding=declared_encoding(response_headers, body),
+        )
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+        self._file.close()
+
+
+class HarArchive(object):
+    """Entries of a HAR file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.entries = json.load(f)["log"]["entries"]
+
+        self.records: Dict[str, int] = {}
+
+        for position, entry in enumerate(self.entries):
+            key = url_key(entry["request"]["url"])
+
+            if key not in self.records or self.entries[self.records[key]]["startedDateTime"] <= \
+                    entry["startedDateTime"]:
+                self.records[key] = position
+
+    def get(self, key: str) -> Tuple[str, BrowserResponse] | None:
+        if (position := self.records.get(key)) is None:
+            return None
+
+        entry = self.entries[position]
+        response = entry["response"]
+        content = response.get("content", {})
+        headers = parse_headers(f"{header['name']}:{header['value']}" for header in response.get("headers", []))
+
+        if content.get("encoding") == "base64":
+            body, encoding = base64.b64decode(content.get("text", "")), None
+        else:
+            # browsers store the decoded text
+            body, encoding = content.get("text", "").encode("utf-8"), "utf-8"
+
+        return entry["startedDateTime"], BrowserResponse(
+            url=entry["request"]["url"],
+            requested_url=entry["request"]["url"],
+            status_code=response["status"],
+            reason=response.get("statusText", ""),
+            response_headers=headers,
+            content=body,
+            timestamp_start=parse_date(entry["startedDateTime"]),
+            elapsed=timedelta(milliseconds=max(entry.get("time") or 0, 0)),
+            meta={"archive": self.path, "received_bytes": 0},
+            encoding=encoding or declared_encoding(headers, body),
+        )
+
+    def close(self):
+        pass
+
+
+class ArchiveBrowser(Browser):
+    """Serves responses from WARC and HAR files instead of the network.
+
+    The latest archived response of a url is returned, redirects are followed within the archives. Archives are
+    opened once per process and shared by all archive browsers, so every fetcher thread may have its own browser.
+    """
+    _archives: Dict[str, WarcArchive | HarArchive] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, archives: List[str] = (), max_redirects: int = 10, max_bytes: int = None,
+                 truncate: bool = True, **config):
+        super().__init__(**config)
+
+        if not archives:
+            raise ValueError("ArchiveBrowser needs at least one WARC or HAR file")
+
+        self.archives = [self.open_archive(path) for path in archives]
+        self.max_redirects = max_redirects
+        self.max_bytes = max_bytes
+        self.truncate = truncate
+
+    @classmethod
+    def open_archive(cls, path: str) -> WarcArchive | HarArchive:
+        path = os.path.abspath(path)
+
+        with cls._lock:
+            if path not in cls._archives:
+                cls._archives[path] = HarArchive(path) if path.endswith(".har") else WarcArchive(path)
+
+            return cls._archives[path]
+
+    def lookup(self, url: str) -> BrowserResponse | None:
+        found = [result for archive in self.archives if (result := archive.get(url_key(url))) is not None]
+
+        return max(found, key=lambda result: result[0])[1] if found else None
+
+    def browse(self, url, headers: Dict[str, str] = None) -> BrowserResponse:
+        with Timer() as fetch_timer:
+            candidates = list(self.possible_urls(url))
+            requested_url, response = next(
+                ((candidate, response) for candidate in candidates if (response := self.lookup(candidate))),
+                (None, None),
+            )
+
+            if response is None:
+                raise IOError(f"No archived response for {url}")
+
+            for _ in range(self.max_redirects):
+                if response.status_code not in REDIRECTS or "location" not in response.response_headers:
+                    break
+
+                if (target := self.lookup(urljoin(response.url, response.response_headers["location"]))) is None:
+                    break
+
+                response = target
+
+        if self.max_bytes is not None and len(response.content) > self.max_bytes:
+            if not self.truncate:
+                raise ResponseTooLargeError(f"Response exceeds {self.max_bytes} bytes")
+
+            response.content = response.content[:self.max_bytes]
+            response.meta["truncated"] = True
+
+        response.requested_url = requested_url
+        response.timings = {"fetch": fetch_timer.timing}
+
+        return response
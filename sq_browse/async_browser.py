@@ -0,0 +1,181 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+from urllib.parse import urlsplit
+
+from sq_browse.browser import Browser
+from sq_browse.encoding import declared_encoding
+from sq_browse.instrumentation import Timer
+from sq_browse.structs import BrowserResponse
+
+
+class ConcurrencyLimiter(object):
+    """Bounds the number of fetches in flight, both globally and per host."""
+
+    def __init__(self, max_concurrency: int = 100, max_per_host: int = 8):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts = {}
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        # the host slot is acquired first, so waiting on a busy host does not block a global slot
+        entry = self._hosts.setdefault(host, [asyncio.Semaphore(self.max_per_host), 0])
+        entry[1] += 1
+
+        try:
+            async with entry[0], self._global:
+                yield
+        finally:
+            entry[1] -= 1
+
+            if not entry[1]:
+                del self._hosts[host]
+
+
+class AsyncBrowser(Browser):
+    """Base class for browsers which fetch natively with asyncio.
+
+    Subclasses implement `abrowse`. The blocking `browse` runs a single fetch in its own event loop, so async
+    browsers can be used everywhere a regular browser is expected.
+    """
+
+    async def abrowse(self, url, headers: Dict[str, str] = None) -> BrowserResponse:
+        raise NotImplementedError
+
+    async def abrowse_many(self, urls):
+        """Browse all given urls concurrently and yield `(url, response or exception)` in completion order."""
+        async def browse_one(url):
+            try:
+                return url, await self.abrowse(url)
+            except Exception as e:
+                return url, e
+
+        for task in asyncio.as_completed([browse_one(url) for url in urls]):
+            yield await task
+
+    async def aclose(self):
+        pass
+
+    @staticmethod
+    async def arace(candidates: List[str], fetch: Callable[[str], Awaitable], head_start: float = None):
+        """Fetch the candidates and return the first result, preferring earlier candidates.
+
+        Every candidate gets a head start of `head_start` seconds before the next one is fetched concurrently, or is
+        only followed by the next one on failure if `head_start` is None. The fetches of the losers are cancelled.
+        """
+        pending = list(candidates)
+        tasks: Dict[asyncio.Task, str] = {}
+
+        try:
+            while pending or tasks:
+                if pending:
+                    url = pending.pop(0)
+                    tasks[asyncio.ensure_future(fetch(url))] = url
+
+                done, _ = await asyncio.wait(tasks, timeout=head_start if pending else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+
+                for task in sorted(done, key=lambda t: candidates.index(tasks[t])):
+                    del tasks[task]
+
+                    if task.exception() is None:
+                        return task.result()
+
+                    if not isinstance(task.exception(), (IOError, asyncio.TimeoutError)):
+                        raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise IOError(f"No valid URL found for {candidates[0]}")
+
+    def browse(self, url, headers: Dict[str, str] = None) -> BrowserResponse:
+        async def browse_once():
+            try:
+                return await self.abrowse(url, headers=headers)
+            finally:
+                await self.aclose()
+
+        return asyncio.run(browse_once())
+
+
+class AiohttpBrowser(AsyncBrowser):
+    """Asyncio browser based on aiohttp.
+
+    Concurrency is bounded by `max_concurrency` fetches in total and `max_per_host` fetches per host.
+    """
+
+    def __init__(self, timeout: float = 3, max_concurrency: int = 100, max_per_host: int = 8,
+                 head_start: float = 0.25, **config):
+        super().__init__(**config)
+        self.timeout = timeout
+        self.head_start = head_start
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self._loop = None
+        self._session = None
+        self._limiter = None
+
+    async def _ensure_session(self):
+        # sessions and semaphores are bound to the event loop they were created in
+        loop = asyncio.get_running_loop()
+
+        if self._session is None or self._loop is not loop:
+            import aiohttp
+
+            self._loop = loop
+            self._limiter = ConcurrencyLimiter(self.max_concurrency, self.max_per_host)
+            self._session = aiohttp.ClientSession(
+                headers=self.HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.max_per_host),
+            )
+
+        return self._session
+
+    async def abrowse(self, ambiguous_url: str, headers: Dict[str, str] = None) -> BrowserResponse:
+        session = await self._ensure_session()
+        start = datetime.now()
+        loop_start = asyncio.get_running_loop().time()
+
+        # includes the CPU time of other tasks running on this thread meanwhile
+        candidates = list(self.possible_urls(ambiguous_url))
+
+        async def fetch(url):
+            async with self._limiter.slot(urlsplit(url).netloc):
+                async with session.get(url, headers=headers) as response:
+                    return url, response, await response.read()
+
+        with Timer() as fetch_timer:
+            try:
+                url, r, body = await self.arace(candidates, fetch, self.race_head_start(candidates, self.head_start))
+            except (IOError, asyncio.TimeoutError):
+                raise IOError(f"No valid URL found for {ambiguous_url}")
+
+        self.remember_scheme(candidates, url)
+
+        return BrowserResponse(
+            url=str(r.url),
+            requested_url=url,
+            status_code=r.status,
+            reason=r.reason,
+            response_headers={
+                k.lower(): v
+                for k, v
+                in r.headers.items()
+            },
+            content=body,
+            timestamp_start=start,
+            elapsed=timedelta(seconds=asyncio.get_running_loop().time() - loop_start),
+            meta={"received_bytes": len(body)},
+            timings={"fetch": fetch_timer.timing},
+            encoding=declared_encoding(r.headers, body),
+        )
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,168 @@
+import multiprocessing
+import tracemalloc
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import replace
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from sq_browse.browser import Browser, ThreadLocalBrowsers
+from sq_browse.incremental import IncrementalBrowsing
+from sq_browse.plugins import load_all_plugins
+from sq_browse.postprocessing import pipeline
+from sq_browse.structs import BrowserResponse
+
+
+class SharedContent(object):
+    """Fetched content placed in shared memory, so that only its name is pickled when sent to a worker process.
+
+    The creating process owns the block and has to `unlink` it once the worker is done.
+    """
+
+    def __init__(self, content: bytes | str):
+        # bodies are passed on as they are, text of browsers which only provide text is restored as text
+        self.binary = isinstance(content, bytes)
+        data = content if self.binary else content.encode("utf-8")
+        self.size = len(data)
+        self._shm = SharedMemory(create=True, size=max(self.size, 1))
+        self._shm.buf[:self.size] = data
+        self.name = self._shm.name
+
+    def __getstate__(self):
+        return {"name": self.name, "size": self.size, "binary": self.binary}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _shm=None)
+
+    def read(self) -> bytes | str:
+        shm = self._shm or SharedMemory(name=self.name)
+
+        try:
+            data = bytes(shm.buf[:self.size])
+            return data if self.binary else data.decode("utf-8")
+        finally:
+            if shm is not self._shm:
+                shm.close()
+
+    def unlink(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def init_worker(trace_memory: bool = False, settings: Dict = None):
+    load_all_plugins()
+    # every worker has its own memory tier of the result cache, a cache directory is shared
+    pipeline.configure(**(settings or {}))
+
+    if trace_memory:
+        tracemalloc.start()
+
+
+def process_shared_response(response: BrowserResponse, content: SharedContent, only: List[str] = None,
+                            timings: bool = False) -> Dict:
+    """Run the pipeline inside a worker process."""
+    response.content = content.read()
+
+    return pipeline.run(response, fail_save=False, only=only, timings=timings)
+
+
+class BatchRunner(object):
+    """Fetches urls with a pool of threads and runs the pipeline on a pool of worker processes.
+
+    Fetching and processing overlap: as soon as a page is fetched, it is handed to the process pool while the
+    fetcher threads continue with the next urls. At most `max_in_flight` urls are fetched or processed at a time.
+    """
+    # workers are started on demand from fetcher threads, forking there could inherit locks held by other threads
+    MP_CONTEXT = multiprocessing.get_context("spawn")
+
+    def __init__(self, browser_factory: Callable[[], Browser], workers: int = None, fetchers: int = 16,
+                 ordered: bool = False, max_in_flight: int = None, only: List[str] = None, timings: bool = False,
+                 trace_memory: bool = False, settings: Dict = None, incremental: IncrementalBrowsing = None):
+        self.browser_factory = browser_factory
+        self.workers = workers
+        self.fetchers = fetchers
+        self.ordered = ordered
+        self.max_in_flight = max_in_flight or 2 * fetchers
+        self.only = only
+        self.timings = timings
+        self.trace_memory = trace_memory
+        # passed to `Pipeline.configure` in the workers
+        self.settings = settings
+        # skips unchanged pages before they are sent to the workers
+        self.incremental = incremental
+        self.browsers = ThreadLocalBrowsers(browser_factory)
+
+    def browse(self, url: str, headers: Dict[str, str] = None) -> BrowserResponse:
+        return self.browsers.get().browse(url, headers=headers)
+
+    def fetch(self, url: str) -> Tuple[BrowserResponse, Dict | None]:
+        """Browse the url, together with its incremental state if enabled."""
+        if self.incremental is None:
+            return self.browse(url), None
+
+        state = self.incremental.prepare(url, self.only)
+
+        return self.browse(url, self.incremental.conditional_headers(state) or None), state
+
+    def submit(self, url: str, fetch_pool: ThreadPoolExecutor, process_pool: ProcessPoolExecutor) -> Future:
+        result = Future()
+
+        def on_processed(process_future: Future, content: SharedContent, state: Dict | None):
+            content.unlink()
+
+            try:
+                data = process_future.result()
+                result.set_result(data if state is None else self.incremental.update(state, data))
+            except Exception as e:
+                result.set_exception(e)
+
+        def on_fetched(fetch_future: Future):
+            try:
+                response, state = fetch_future.result()
+
+                if state is not None and self.incremental.unchanged(state, response):
+                    result.set_result(self.incremental.skipped(response, self.timings))
+                    return
+
+                content = SharedContent(response.content)
+                process_future = process_pool.submit(
+                    process_shared_response, replace(response, content=""), content, self.only, self.timings
+                )
+            except Exception as e:
+                result.set_exception(e)
+                return
+
+            process_future.add_done_callback(lambda f: on_processed(f, content, state))
+
+        fetch_pool.submit(self.fetch, url).add_done_callback(on_fetched)
+
+        return result
+
+    def run(self, urls: Iterable[str]) -> Iterator[Tuple[str, Dict | Exception]]:
+        """Yield `(url, result or exception)` for every url, either in input or in completion order."""
+        urls = iter(urls)
+        in_flight = deque()
+
+        with ThreadPoolExecutor(self.fetchers) as fetch_pool, \
+                ProcessPoolExecutor(self.workers, mp_context=self.MP_CONTEXT, initializer=init_worker,
+                                    initargs=(self.trace_memory, self.settings)) as process_pool:
+
+            while True:
+                while len(in_flight) < self.max_in_flight and (url := next(urls, None)) is not None:
+                    in_flight.append((url, self.submit(url, fetch_pool, process_pool)))
+
+                if not in_flight:
+                    break
+
+                if self.ordered:
+                    done = [in_flight.popleft()]
+                    wait([done[0][1]])
+                else:
+                    done_futures, _ = wait([future for _, future in in_flight], return_when=FIRST_COMPLETED)
+                    done = [item for item in in_flight if item[1] in done_futures]
+
+                    for item in done:
+                        in_flight.remove(item)
+
+                for url, future in done:
+                    yield url, future.exception() or future.result()
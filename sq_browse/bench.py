@@ -0,0 +1,217 @@
+"""Offline benchmarks of the pipeline over a corpus of representative and pathological pages.
+
+Responses are faked, so no network is needed. Every case is run repeatedly and reported with throughput and
+percentiles of the wall time. Results can be stored as a baseline, and later runs compared against it.
+"""
+import glob
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List
+
+from sq_browse.instrumentation import Timer
+from sq_browse.postprocessing import Pipeline
+from sq_browse.structs import BrowserResponse
+
+
+def article_page(paragraphs: int = 40) -> str:
+    rng = random.Random(1)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do"]
+    body = []
+
+    for i in range(paragraphs):
+        sentence = " ".join(rng.choice(words) for _ in range(60))
+        body.append(f"<h2>Section {i}</h2><p>{sentence} <a href='/p/{i}'>more</a> <b>bold</b> text.<br>next</p>")
+
+    return (
+        "<html><head><title>Article</title><meta name='description' content='An article'>"
+        "<meta name='author' content='Jane'><meta name='viewport' content='width=device-width'></head><body>"
+        "<nav class='menu'><ul><li><a href='/'>Home</a></li><li><a href='/imprint'>Imprint</a></li></ul></nav>"
+        f"<main><h1>Article</h1>{''.join(body)}</main>"
+        "<footer><a href='/contact'>Contact</a></footer></body></html>"
+    )
+
+
+def huge_table_page(rows: int = 5000, columns: int = 6) -> str:
+    head = "".join(f"<th>Column {c}</th>" for c in range(columns))
+    body = "".join(
+        "<tr>" + "".join(f"<td>Cell {r}.{c} <span>x</span></td>" for c in range(columns)) + "</tr>"
+        for r in range(rows)
+    )
+
+    return f"<html><body><table><tr>{head}</tr>{body}</table></body></html>"
+
+
+def nested_tables_page(tables: int = 200) -> str:
+    inner = "<table><tr><td>inner</td><td>1</td></tr><tr><td>inner</td><td>2</td></tr></table>"
+    rows = "".join(f"<tr><td>Outer {i}</td><td>{inner}</td></tr>" for i in range(tables))
+
+    return f"<html><body><table>{rows}</table></body></html>"
+
+
+def deep_nesting_page(depth: int = 250, repeat: int = 20) -> str:
+    # libxml2 limits the depth of parsed documents to 256
+    tags = ["div", "span", "section", "a", "b"]
+    blocks = []
+
+    for i in range(repeat):
+        opening = "".join(f"<{tags[d % len(tags)]}>" for d in range(depth))
+        closing = "".join(f"</{tags[d % len(tags)]}>" for d in reversed(range(depth)))
+        blocks.append(f"{opening}Deep text {i}{closing}")
+
+    return f"<html><body>{''.join(blocks)}</body></html>"
+
+
+def many_links_page(links: int = 5000) -> str:
+    anchors = "".join(f"<li><a href='/page/{i}'>Link <b>{i}</b></a></li>" for i in range(links))
+
+    return (f"<html><head><title>Links</title></head>"
+            f"<body><ul>{anchors}</ul><a href='/imprint'>Impressum</a></body></html>")
+
+
+CORPUS: Dict[str, Callable[[], str]] = {
+    "article": article_page,
+    "huge_table": huge_table_page,
+    "nested_tables": nested_tables_page,
+    "deep_nesting": deep_nesting_page,
+    "many_links": many_links_page,
+}
+
+
+def load_corpus(corpus_dir: str = None) -> Dict[str, str]:
+    """Return the built-in corpus, or all `*.html` files in `corpus_dir`."""
+    if corpus_dir is None:
+        return {name: generate() for name, generate in CORPUS.items()}
+
+    corpus = {}
+
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*.html"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            corpus[os.path.splitext(os.path.basename(path))[0]] = f.read()
+
+    return corpus
+
+
+def fake_response(content: bytes | str, url: str = "https://localhost/") -> BrowserResponse:
+    """A successful response with the content. Text is sent as UTF-8, bytes without a declared encoding."""
+    if isinstance(content, str):
+        content, encoding, content_type = content.encode("utf-8"), "utf-8", "text/html; charset=utf-8"
+    else:
+        encoding, content_type = None, "text/html"
+
+    return BrowserResponse(
+        url=url,
+        requested_url=url,
+        status_code=200,
+        reason="OK",
+        response_headers={"content-type": content_type},
+        content=content,
+        timestamp_start=datetime(1970, 1, 1),
+        elapsed=timedelta(0),
+        encoding=encoding,
+    )
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentile of sorted values with linear interpolation."""
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(wall_times: List[float]) -> Dict[str, float]:
+    wall_times = sorted(wall_times)
+    total = sum(wall_times)
+
+    return {
+        "runs": len(wall_times),
+        "mean": total / len(wall_times),
+        "p50": percentile(wall_times, 0.5),
+        "p90": percentile(wall_times, 0.9),
+        "p99": percentile(wall_times, 0.99),
+        "throughput": len(wall_times) / total if total else float("inf"),
+    }
+
+
+class Benchmark(object):
+    """Runs the whole pipeline and every processor in isolation over a corpus.
+
+    A processor is run in isolation by restricting the pipeline to it and its dependencies, and only its own time
+    is counted.
+    """
+
+    def __init__(self, pipeline: Pipeline, corpus: Dict[str, str], repeat: int = 5, warmup: int = 1,
+                 processors: Iterable[str] = None):
+        self.pipeline = pipeline
+        self.corpus = corpus
+        self.repeat = repeat
+        self.warmup = warmup
+        self.processors = list(processors or pipeline.sorted_components())
+
+    def measure(self, content: str, processor: str = None) -> float:
+        response = fake_response(content)
+
+        if processor is None:
+            with Timer() as timer:
+                self.pipeline.run(response)
+
+            return timer.timing["wall"]
+
+        return self.pipeline.run(response, only=[processor], timings=True)["meta"]["timings"][processor]["wall"]
+
+    def run(self) -> Dict[str, Dict[str, float]]:
+        results = {}
+
+        for page_name, content in self.corpus.items():
+            for processor in [None, *self.processors]:
+                for _ in range(self.warmup):
+                    self.measure(content, processor)
+
+                wall_times = [self.measure(content, processor) for _ in range(self.repeat)]
+                results[f"{page_name}/{processor or 'pipeline'}"] = summarize(wall_times)
+
+        return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float = 0.2) -> List[str]:
+    """Return a description of every case whose median got slower than the baseline by more than `tolerance`."""
+    regressions = []
+
+    for case, summary in results.items():
+        if case not in baseline:
+            continue
+
+        allowed = baseline[case]["p50"] * (1 + tolerance)
+
+        if summary["p50"] > allowed:
+            regressions.append(
+                f"{case}: p50 {summary['p50'] * 1000:.2f}ms > {baseline[case]['p50'] * 1000:.2f}ms "
+                f"+ {tolerance:.0%}"
+            )
+
+    return regressions
+
+
+def format_results(results: Dict[str, Dict]) -> str:
+    lines = [f"{'case':40s} {'runs':>5s} {'p50 ms':>10s} {'p90 ms':>10s} {'p99 ms':>10s} {'docs/s':>10s}"]
+
+    for case, summary in results.items():
+        lines.append(
+            f"{case:40s} {summary['runs']:5d} {summary['p50'] * 1000:10.2f} {summary['p90'] * 1000:10.2f} "
+            f"{summary['p99'] * 1000:10.2f} {summary['throughput']:10.1f}"
+        )
+
+    return "\n".join(lines)
+
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: Dict[str, Dict]):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
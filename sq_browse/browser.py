@@ -1,40 +1,97 @@
-import signal
-from contextlib import suppress
-from datetime import datetime
-from urllib.parse import urlparse, urlunsplit, urlsplit
-
-import requests
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+from urllib.parse import urlunsplit, urlsplit
+
+from sq_browse.lazy import resolve
 from sq_browse.structs import BrowserResponse
 
 
-class ForcedTimeout(object):
+class Deadline(object):
+    """A point in time by which an operation has to be finished.
+
+    Unlike a signal based alarm, a deadline is local to the operation it is passed to, works in every thread and
+    supports sub-second budgets.
+    """
 
-    def __init__(self, timeout):
+    def __init__(self, timeout: float):
         self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        if self.expired():
+            raise TimeoutError(f"Deadline of {self.timeout}s exceeded")
+
 
-    @staticmethod
-    def raise_timeout(signum, stack):
-        raise TimeoutError("Forced timeout")
+class SchemeMemory(object):
+    """Remembers the scheme which worked for each of the `max_domains` most recently browsed domains."""
 
-    def __enter__(self):
-        signal.signal(signal.SIGALRM, self.raise_timeout)
-        signal.alarm(self.timeout)
-        return self
+    def __init__(self, max_domains: int = 10_000):
+        self.max_domains = max_domains
+        self._schemes: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        signal.alarm(0)
-        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    def get(self, domain: str) -> str | None:
+        with self._lock:
+            if (scheme := self._schemes.get(domain)) is not None:
+                self._schemes.move_to_end(domain)
+
+            return scheme
+
+    def remember(self, domain: str, scheme: str):
+        with self._lock:
+            self._schemes[domain] = scheme
+            self._schemes.move_to_end(domain)
+
+            while len(self._schemes) > self.max_domains:
+                self._schemes.popitem(last=False)
 
 
 class Browser(object):
+    # shared by all browsers, so that every thread's browser benefits
+    schemes = SchemeMemory()
+    HEADERS = {
+        "user-agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                       "Chrome/132.0.0.0 Safari/537.36")
+    }
+
+    # seconds a request may take, browsers without network requests ignore it
+    timeout: float = None
 
     def __init__(self, **config):
         pass
 
-    def browse(self, url) -> BrowserResponse:
+    def browse(self, url, headers: Dict[str, str] = None) -> BrowserResponse:
+        """Fetch the given url. `headers` are sent in addition to the browser's default headers."""
         raise NotImplementedError
 
+    @contextmanager
+    def request_timeout(self, timeout: float = None):
+        """Browse with the timeout instead of the configured one within the block, which needs the browser alone."""
+        if timeout is None:
+            yield
+            return
+
+        configured, self.timeout = self.timeout, timeout
+
+        try:
+            yield
+        finally:
+            self.timeout = configured
+
+    def close(self):
+        pass
+
     def possible_urls(self, ambiguous_url) -> str:
+        """Yield the urls the input may refer to, first with the scheme which worked for the domain before."""
         url_parts = list(urlsplit(ambiguous_url))
 
         # if only a domain was provided, it is detected as path and not as netloc
@@ -42,49 +99,54 @@ class Browser(object):
             url_parts[2], url_parts[1] = url_parts[1], url_parts[2]
 
         if not url_parts[0]:
-            yield urlunsplit(["https", *url_parts[1:]])
-            yield urlunsplit(["http", *url_parts[1:]])
+            urls = [urlunsplit([scheme, *url_parts[1:]]) for scheme in ("https", "http")]
+
+            if self.schemes.get(urlsplit(urls[0]).netloc.lower()) == "http":
+                urls.reverse()
+
+            yield from urls
         else:
             yield urlunsplit(url_parts)
 
+    def race_head_start(self, candidates: List[str], head_start: float) -> float | None:
+        """Head start of every candidate url before the next one is requested as well, None to wait for failure.
 
-class RequestsBrowser(Browser):
-    HEADERS = {
-        "user-agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
-                       "Chrome/132.0.0.0 Safari/537.36")
-    }
+        Candidates are only raced while the working scheme of the domain is unknown.
+        """
+        if len(candidates) < 2 or self.schemes.get(urlsplit(candidates[0]).netloc.lower()) is not None:
+            return None
 
-    def __init__(self, **config):
-        super().__init__(**config)
-        self.timeout = 3
+        return head_start
 
-    def browse(self, ambiguous_url: str) -> BrowserResponse:
-        start = datetime.now()
+    def remember_scheme(self, candidates: List[str], url: str):
+        if len(candidates) > 1:
+            parts = urlsplit(url)
+            self.schemes.remember(parts.netloc.lower(), parts.scheme)
 
-        for url in self.possible_urls(ambiguous_url):
-            with suppress(IOError, TimeoutError), ForcedTimeout(self.timeout):
-                r = requests.get(url, timeout=self.timeout+0.001, headers=self.HEADERS)
-                break
-        else:
-            raise IOError(f"No valid URL found for {ambiguous_url}")
-
-        return BrowserResponse(
-            url=r.url,
-            requested_url=url,
-            status_code=r.status_code,
-            reason=r.reason,
-            response_headers={
-                k.lower(): v
-                for k, v
-                in r.headers.items()
-            },
-            content=r.content.decode(r.apparent_encoding),
-            timestamp_start=start,
-            elapsed=r.elapsed,
-        )
+
+class ThreadLocalBrowsers(object):
+    """Creates a browser per thread and set of arguments, as browsers are not necessarily thread-safe."""
+
+    def __init__(self, factory: Callable[..., Browser]):
+        self.factory = factory
+        self._local = threading.local()
+
+    def get(self, *args, **config) -> Browser:
+        browsers = self._local.__dict__.setdefault("browsers", {})
+        key = (args, tuple(sorted(config.items())))
+
+        if key not in browsers:
+            browsers[key] = self.factory(*args, **config)
+
+        return browsers[key]
 
 
 class BrowserRegistry(object):
+    """Maps names to browser classes.
+
+    A class can also be registered by its path as `module:Class`, then it is only imported once it is used. This
+    keeps dependencies of unused browsers from being imported.
+    """
 
     def __init__(self):
         self.browsers = {}
@@ -94,12 +156,50 @@ class BrowserRegistry(object):
         self.browsers[name] = browser_cls
         self.browser_configs[name] = config
 
-    def get_browser(self, name: str):
-        browser_cls = self.browsers.get(name)
-        config = self.browser_configs.get(name, {})
+    def get_browser_class(self, name: str):
+        if name not in self.browsers:
+            raise ValueError(f"Unknown browser {name!r}")
+
+        if isinstance(self.browsers[name], str):
+            self.browsers[name] = resolve(self.browsers[name])
+
+        return self.browsers[name]
+
+    def describe(self, name: str) -> str:
+        """Return the dotted path of the browser class without importing it."""
+        browser_cls = self.browsers[name]
+
+        if isinstance(browser_cls, str):
+            return browser_cls.replace(":", ".")
+
+        return f"{browser_cls.__module__}.{browser_cls.__name__}"
+
+    def get_browser(self, name: str, **config):
+        """Instantiate the browser registered as `name`. `config` overrides the registered config."""
+        browser_cls = self.get_browser_class(name)
+        config = {**self.browser_configs.get(name, {}), **config}
 
         return browser_cls(**config)
 
 
+# names which moved to their own modules, importable from here for compatibility
+MOVED = {
+    "header_charset": "sq_browse.encoding:header_charset",
+    "RequestsBrowser": "sq_browse.requests_browser:RequestsBrowser",
+    "AsyncBrowser": "sq_browse.async_browser:AsyncBrowser",
+    "AiohttpBrowser": "sq_browse.async_browser:AiohttpBrowser",
+    "ConcurrencyLimiter": "sq_browse.async_browser:ConcurrencyLimiter",
+}
+
+
+def __getattr__(name):
+    if name in MOVED:
+        return resolve(MOVED[name])
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 registry = BrowserRegistry()
-registry.register("requests", RequestsBrowser, {})
+registry.register("requests", MOVED["RequestsBrowser"], {})
+registry.register("aiohttp", MOVED["AiohttpBrowser"], {})
+registry.register("archive", "sq_browse.archive_browser:ArchiveBrowser", {})
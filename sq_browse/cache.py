@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sq_browse.browser import Browser
+from sq_browse.structs import BrowserResponse
+from sq_browse.utils import atomic_write
+
+
+class ResponseCache(object):
+    """Stores responses on disk, one `<key>.json` file with metadata and one `<key>.body` file per url.
+
+    Entries older than `max_age` seconds are dropped. When the bodies exceed `max_size` bytes in total, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: str, max_age: float = 7 * 24 * 3600, max_size: int = 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_size = max_size
+        self._size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{suffix}")
+
+    def get(self, url: str) -> BrowserResponse | None:
+        key = self.key(url)
+
+        try:
+            with open(self._path(key, "json")) as f:
+                entry = json.load(f)
+
+            if time.time() - entry["stored_at"] > self.max_age:
+                self.delete(key)
+                return None
+
+            with open(self._path(key, "body"), "rb") as f:
+                content = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # the modification time of the metadata file tracks the last use
+        os.utime(self._path(key, "json"))
+
+        return BrowserResponse(
+            url=entry["url"],
+            requested_url=entry["requested_url"],
+            status_code=entry["status_code"],
+            reason=entry["reason"],
+            response_headers=entry["response_headers"],
+            content=content,
+            timestamp_start=datetime.fromisoformat(entry["timestamp_start"]),
+            elapsed=timedelta(seconds=entry["elapsed"]),
+            # entries of earlier versions stored the text as UTF-8
+            encoding=entry.get("encoding", "utf-8"),
+        )
+
+    def put(self, url: str, response: BrowserResponse):
+        key = self.key(url)
+        body = response.content if isinstance(response.content, bytes) else response.content.encode("utf-8")
+
+        self.delete(key)
+        atomic_write(self._path(key, "body"), body)
+        atomic_write(self._path(key, "json"), self._entry(response, isinstance(response.content, bytes)))
+        self._size = self.size() + len(body)
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def refresh(self, url: str, response: BrowserResponse):
+        """Update the metadata of a revalidated entry, keeping the stored body."""
+        atomic_write(self._path(self.key(url), "json"), self._entry(response))
+
+    @staticmethod
+    def _entry(response: BrowserResponse, binary: bool = True) -> bytes:
+        return json.dumps({
+            "url": response.url,
+            "requested_url": response.requested_url,
+            "status_code": response.status_code,
+            "reason": response.reason,
+            "response_headers": response.response_headers,
+            "timestamp_start": response.timestamp_start.isoformat(),
+            "elapsed": response.elapsed.total_seconds(),
+            "stored_at": time.time(),
+            "encoding": response.encoding if binary else "utf-8",
+        }).encode("utf-8")
+
+    def delete(self, key: str):
+        for suffix in ("json", "body"):
+            path = self._path(key, suffix)
+
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+
+            if suffix == "body" and self._size is not None:
+                self._size -= size
+
+    def size(self) -> int:
+        """Total size of all stored bodies in bytes."""
+        if self._size is None:
+            self._size = sum(
+                entry.stat().st_size
+                for entry
+                in os.scandir(self.cache_dir)
+                if entry.name.endswith(".body")
+            )
+
+        return self._size
+
+    def evict(self):
+        """Delete expired entries and the least recently used ones until the cache fits into `max_size`."""
+        entries = []
+
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                entries.append((entry.stat().st_mtime, entry.name[:-len(".json")]))
+
+        now = time.time()
+
+        for last_used, key in sorted(entries):
+            if self.size() <= self.max_size and now - last_used <= self.max_age:
+                continue
+
+            self.delete(key)
+
+
+class CachingBrowser(Browser):
+    """Puts a `ResponseCache` in front of another browser.
+
+    Cached responses are revalidated with `If-None-Match`/`If-Modified-Since`. If the server answers with
+    304 Not Modified, the cached content is returned without downloading it again. Whether the cache was used
+    is recorded as `cache` in the response meta, either `hit` or `miss`.
+    """
+    REVALIDATION_HEADERS = ("etag", "last-modified", "cache-control", "expires", "date")
+
+    def __init__(self, browser: Browser, cache: ResponseCache, **config):
+        super().__init__(**config)
+        self.browser = browser
+        self.cache = cache
+
+    def browse(self, url, headers: Dict[str, str] = None) -> BrowserResponse:
+        cached = self.cache.get(url)
+        conditional_headers = self.conditional_headers(cached) if cached else {}
+
+        if not conditional_headers:
+            return self.fetch(url, headers)
+
+        start = datetime.now()
+        response = self.browser.browse(cached.url, headers={**(headers or {}), **conditional_headers})
+
+        if response.status_code != 304:
+            return self.store(url, response, "miss")
+
+        # a 304 may carry updated validators
+        cached.response_headers.update({
+            k: v
+            for k, v
+            in response.response_headers.items()
+            if k in self.REVALIDATION_HEADERS
+        })
+        cached = replace(cached, timestamp_start=start, elapsed=response.elapsed)
+        self.cache.refresh(url, cached)
+        cached.meta["cache"] = "hit"
+        cached.meta["received_bytes"] = response.meta.get("received_bytes", 0)
+
+        return cached
+
+    def fetch(self, url, headers: Dict[str, str] = None) -> BrowserResponse:
+        return self.store(url, self.browser.browse(url, headers=headers), "miss")
+
+    def store(self, url, response: BrowserResponse, cache_status: str) -> BrowserResponse:
+        # truncated or already parsed responses have no complete content to store
+        if response.status_code == 200 and response.tree is None and not response.meta.get("truncated"):
+            self.cache.put(url, response)
+
+        response.meta["cache"] = cache_status
+
+        return response
+
+    @staticmethod
+    def conditional_headers(response: BrowserResponse) -> Dict[str, str]:
+        headers = {}
+
+        if etag := response.response_headers.get("etag"):
+            headers["If-None-Match"] = etag
+
+        if last_modified := response.response_headers.get("last-modified"):
+            headers["If-Modified-Since"] = last_modified
+
+        return headers
+
+    def request_timeout(self, timeout: float = None):
+        return self.browser.request_timeout(timeout)
+
+    def close(self):
+        self.browser.close()
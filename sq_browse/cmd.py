@@ -2,28 +2,61 @@ import os
 import sys
 import json
 import argparse
-from datetime import datetime
-from json import JSONDecodeError
+import tracemalloc
+from typing import Dict, List
 
 from sq_browse.browser import registry
-from sq_browse.plugins import load_all_plugins
-from sq_browse.postprocessing import pipeline
+from sq_browse.errors import WorkersFailingError
+from sq_browse.plugins import discover_entry_points, load_all_plugins
+from sq_browse.pipeline import pipeline
+from sq_browse.serializers import OutputWriter, serializers
 
+# the modules of the commands and of the browsers are imported when they are used, which keeps the startup fast
 
-def json_decode_fallback(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise JSONDecodeError
+
+def get_browser(args, name: str = None, **config):
+    """Build the browser selected by the arguments. `name` and `config` override the selection."""
+    if args.max_bytes is not None:
+        config.update(max_bytes=args.max_bytes, truncate=not args.abort_on_max_bytes)
+
+    if getattr(args, "stream_parse", False):
+        config.update(stream_parse=True)
+
+    if args.archive:
+        config.update(archives=args.archive)
+        name = name or "archive"
+
+    browser = registry.get_browser(name or args.browser, **config)
+
+    if args.cache_dir:
+        from sq_browse.cache import ResponseCache, CachingBrowser
+
+        cache = ResponseCache(args.cache_dir, max_age=args.cache_max_age, max_size=args.cache_max_size)
+        browser = CachingBrowser(browser, cache)
+
+    return browser
+
+
+def get_incremental(args):
+    if not args.incremental_store:
+        return None
+
+    from sq_browse.incremental import IncrementalBrowsing, ResultStore
+
+    return IncrementalBrowsing(ResultStore(args.incremental_store), pipeline)
 
 
 def cmd_run(args):
-    browser = registry.get_browser(args.browser)
+    browser = get_browser(args)
 
-    response = browser.browse(ambiguous_url=args.url)
-    data = pipeline.run(response)
+    if incremental := get_incremental(args):
+        data = incremental.run(browser, args.url, only=args.only, timings=args.timings)
+    else:
+        response = browser.browse(ambiguous_url=args.url)
+        data = pipeline.run(response, only=args.only, timings=args.timings)
 
     try:
-        json.dump(data, sys.stdout, default=json_decode_fallback)
+        sys.stdout.buffer.write(serializers.get_serializer(args.output_format).dumps(data))
         sys.stdout.flush()
     except BrokenPipeError:
         devnull = os.open(os.devnull, os.O_WRONLY)
@@ -31,17 +64,61 @@ def cmd_run(args):
         sys.exit(1)
 
 
+def start_metrics(args):
+    """Metrics exposed as selected by the arguments, None if they are disabled."""
+    if not args.metrics_port and not args.metrics_file:
+        return None
+
+    from sq_browse.metrics import Metrics
+
+    metrics = Metrics(pipeline)
+
+    if args.metrics_port:
+        host, port = metrics.serve(args.metrics_host, args.metrics_port)
+        sys.stderr.write(f"Serving metrics on http://{host}:{port}/metrics\n")
+        sys.stderr.flush()
+
+    if args.metrics_file:
+        metrics.write_periodically(args.metrics_file, args.metrics_interval)
+
+    return metrics
+
+
 def cmd_run_subprocess(args):
-    browser = registry.get_browser(args.browser)
+    # the caller waits for every result, so nothing may be held back in a buffer
+    writer = OutputWriter(sys.stdout.buffer, serializers.get_serializer(args.output_format), buffer_size=0)
+    metrics = start_metrics(args)
+
+    try:
+        if args.protocol == 2:
+            return run_subprocess_v2(args, writer, metrics)
+
+        run_subprocess_v1(args, writer, metrics)
+    finally:
+        if metrics is not None:
+            metrics.close()
+
+
+def run_subprocess_v1(args, writer: OutputWriter, metrics=None):
+    browser = get_browser(args)
+
+    if metrics is not None:
+        browser = metrics.wrap(browser)
 
     while True:
         try:
-            url = sys.stdin.readline().strip()
-            response = browser.browse(ambiguous_url=url)
-            data = pipeline.run(response, fail_save=False)
-            json.dump(data, sys.stdout, default=json_decode_fallback)
-            sys.stdout.write("\n")
-            sys.stdout.flush()
+            line = sys.stdin.readline()
+
+            if not line:
+                return
+
+            url = line.strip()
+            response = browser.browse(url)
+            data = pipeline.run(response, fail_save=False, only=args.only, timings=args.timings)
+            writer.write(data)
+
+            if metrics is not None:
+                metrics.observe_result(data)
         except KeyboardInterrupt:
             return
         except BrokenPipeError:
@@ -49,22 +126,287 @@ def cmd_run_subprocess(args):
             os.dup2(devnull, sys.stdout.fileno())
             sys.exit(1)
         except Exception as e:
+            if metrics is not None:
+                metrics.observe_failure(e)
+
             sys.stderr.write(f"{e.__class__.__name__}: {str(e).strip()}\n")
             sys.stderr.flush()
             continue
 
 
+def run_subprocess_v2(args, writer: OutputWriter, metrics=None):
+    from sq_browse.protocol import SubprocessProtocol
+
+    def browser_factory(name, **config):
+        browser = get_browser(args, name, **config)
+
+        return browser if metrics is None else metrics.wrap(browser)
+
+    protocol = SubprocessProtocol(
+        browser_factory,
+        writer,
+        default_browser=args.browser,
+        concurrency=args.concurrency,
+        only=args.only,
+        timings=args.timings,
+        metrics=metrics,
+    )
+
+    try:
+        protocol.serve(sys.stdin)
+    except KeyboardInterrupt:
+        return
+    except BrokenPipeError:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def cmd_run_batch(args):
+    from sq_browse.batch import BatchRunner
+
+    runner = BatchRunner(
+        lambda: get_browser(args),
+        workers=args.workers,
+        fetchers=args.fetchers,
+        ordered=args.ordered,
+        only=args.only,
+        timings=args.timings,
+        trace_memory=args.trace_memory,
+        settings=pipeline_settings(args),
+        incremental=get_incremental(args),
+    )
+    input_file = sys.stdin if args.input == "-" else open(args.input)
+    writer = OutputWriter(sys.stdout.buffer, serializers.get_serializer(args.output_format))
+
+    with input_file:
+        urls = (line.strip() for line in input_file if line.strip())
+
+        try:
+            for url, data in runner.run(urls):
+                if isinstance(data, Exception):
+                    sys.stderr.write(f"{url}\t{data.__class__.__name__}: {str(data).strip()}\n")
+                    sys.stderr.flush()
+                    continue
+
+                writer.write(data)
+
+            writer.flush()
+        except BrokenPipeError:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            sys.exit(1)
+
+
+def cmd_crawl(args):
+    from sq_browse.crawl import Crawler, FollowLinkProcessor
+
+    follow = FollowLinkProcessor(
+        classes=[name for name in args.follow if name != "all"],
+        follow_all="all" in args.follow,
+        other_hosts=args.other_hosts,
+    )
+    crawler = Crawler(
+        lambda: get_browser(args),
+        pipeline,
+        follow=follow,
+        max_depth=args.max_depth,
+        max_pages=args.max_pages,
+        max_per_host=args.max_per_host,
+        rate=args.rate,
+        fetchers=args.fetchers,
+        only=args.only,
+        timings=args.timings,
+        capacity=args.expected_urls,
+    )
+    input_file = sys.stdin if args.input == "-" else open(args.input)
+    writer = OutputWriter(sys.stdout.buffer, serializers.get_serializer(args.output_format))
+
+    with input_file:
+        seeds = [line.strip() for line in input_file if line.strip()]
+
+    try:
+        for url, data in crawler.run(seeds):
+            if isinstance(data, Exception):
+                sys.stderr.write(f"{url}\t{data.__class__.__name__}: {str(data).strip()}\n")
+                sys.stderr.flush()
+                continue
+
+            writer.write(data)
+
+        writer.flush()
+    except BrokenPipeError:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def cmd_serve(args):
+    from sq_browse.server import PreforkServer
+
+    # imported once before forking, instead of in every worker
+    get_browser(args).close()
+    pipeline.sorted_components(args.only)
+
+    sock = PreforkServer.bind(args.host, args.port, args.unix_socket)
+    server = PreforkServer(
+        sock,
+        workers=args.workers,
+        browser_factory=lambda: get_browser(args),
+        max_jobs=args.max_jobs,
+        fetchers=args.fetchers,
+        only=args.only,
+        timings=args.timings,
+    )
+    address = args.unix_socket or "http://%s:%d" % sock.getsockname()[:2]
+    sys.stderr.write(f"Listening on {address} with {args.workers} workers\n")
+    sys.stderr.flush()
+
+    try:
+        server.serve_forever()
+    except WorkersFailingError as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
+
+
+def cmd_bench(args):
+    from sq_browse.bench import Benchmark, load_corpus, format_results, compare, load_baseline, save_baseline
+
+    benchmark = Benchmark(
+        pipeline,
+        load_corpus(args.corpus),
+        repeat=args.repeat,
+        warmup=args.warmup,
+        processors=args.only,
+    )
+    results = benchmark.run()
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(format_results(results))
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+
+    if args.baseline:
+        if regressions := compare(results, load_baseline(args.baseline), tolerance=args.tolerance):
+            sys.stderr.write("Regressions:\n" + "".join(f"- {regression}\n" for regression in regressions))
+            sys.exit(1)
+
+
 def cmd_config(args):
     print("Browsers:")
-    for name, browser_cls in registry.browsers.items():
-        print(f"- {name:15s}\t{browser_cls.__module__}.{browser_cls.__name__}")
+    for name in registry.browsers:
+        print(f"- {name:15s}\t{registry.describe(name)}")
 
     print("")
 
     print("Processors:")
-    for processor_name in pipeline.sorted_components():
-        processor = pipeline.components[processor_name]
-        print(f"- {processor_name:15s}\t{processor.__module__}.{processor.__class__.__name__}")
+    # described by their path, so that listing them does not import them
+    for processor_name in sorted({*pipeline.components, *pipeline.lazy_components}):
+        if processor_name in pipeline.lazy_components:
+            path = pipeline.lazy_components[processor_name].replace(":", ".")
+        else:
+            processor = pipeline.components[processor_name]
+            path = f"{processor.__module__}.{processor.__class__.__name__}"
+
+        print(f"- {processor_name:15s}\t{path}")
+
+
+def add_browser_arguments(parser, stream_parse=True):
+    parser.add_argument("--browser", "-b", default="requests")
+    parser.add_argument("--archive", action="append",
+                        help="serve responses from this WARC or HAR file instead of the network, may be repeated")
+    parser.add_argument("--cache-dir", help="cache responses in this directory and revalidate them")
+    parser.add_argument("--cache-max-age", type=float, default=7 * 24 * 3600,
+                        help="maximum age of cache entries in seconds")
+    parser.add_argument("--cache-max-size", type=int, default=1024 ** 3, help="maximum size of the cache in bytes")
+    parser.add_argument("--max-bytes", type=int, help="truncate response bodies after this many bytes")
+    parser.add_argument("--abort-on-max-bytes", action="store_true",
+                        help="fail instead of truncating responses larger than --max-bytes")
+
+    # parsed trees cannot be handed to worker processes
+    if stream_parse:
+        parser.add_argument("--stream-parse", action="store_true", help="parse documents while they are downloaded")
+
+
+def processor_list(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def add_output_arguments(parser):
+    parser.add_argument("--output-format", "-o", default="json", choices=list(serializers.serializers.keys()),
+                        help="json uses orjson if installed, msgpack requires msgpack")
+
+
+def add_pipeline_arguments(parser):
+    parser.add_argument("--only", type=processor_list,
+                        help="comma separated processors to run, their dependencies are run as well")
+    parser.add_argument("--timings", action="store_true", help="add timings of all stages to the meta data")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="add peak memory allocations to the timings, slows down processing")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="release intermediate data as early as possible, for huge documents")
+    parser.add_argument("--memory-budget", type=int, help="fail documents which need more memory than this many bytes")
+    parser.add_argument("--result-cache-size", type=int, default=0,
+                        help="keep the results of this many documents in memory and skip processing identical ones")
+    parser.add_argument("--result-cache-dir", help="store the results of processed documents in this directory as well")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="report pages with a text similar to an earlier page's, requires the result cache")
+    parser.add_argument("--table-format", choices=["rows", "columnar"], default="rows",
+                        help="columnar lists the values per column, which is smaller")
+    parser.add_argument("--table-max-rows", type=int, help="extract at most this many rows per table")
+    parser.add_argument("--deadline", type=float,
+                        help="seconds per document, optional processors are skipped and required ones fail after it")
+    parser.add_argument("--time-budget", type=float, help="seconds every processor may take per document")
+    parser.add_argument("--optional", type=processor_list, default=[],
+                        help="comma separated processors to skip once the deadline is spent")
+    parser.add_argument("--isolate", type=processor_list, default=[],
+                        help="comma separated processors to run in worker processes which are killed when they "
+                             "overrun their time budget, 'plugins' for all processor plugins")
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="address to serve the metrics on")
+    parser.add_argument("--metrics-file", help="write Prometheus metrics to this file periodically")
+    parser.add_argument("--metrics-interval", type=float, default=15,
+                        help="seconds between writes of the metrics file")
+
+
+def add_incremental_arguments(parser):
+    parser.add_argument("--incremental-store",
+                        help="keep the results in this directory and only emit what changed since the last run")
+
+
+def pipeline_settings(args) -> Dict:
+    """Arguments for `Pipeline.configure`."""
+    settings = {
+        "low_memory": getattr(args, "low_memory", False),
+        "memory_budget": getattr(args, "memory_budget", None),
+        "result_cache_size": getattr(args, "result_cache_size", 0),
+        "result_cache_dir": getattr(args, "result_cache_dir", None),
+        "near_duplicates": getattr(args, "near_duplicates", False),
+        "deadline": getattr(args, "deadline", None),
+        "time_budget": getattr(args, "time_budget", None),
+        "components": {name: {"optional": True} for name in getattr(args, "optional", [])},
+        "isolate": [],
+    }
+
+    for name in getattr(args, "isolate", []):
+        if name == "plugins":
+            settings["isolate"].extend(name for name, _ in discover_entry_points()["sq_browse.processor"])
+        else:
+            settings["isolate"].append(name)
+
+    if hasattr(args, "table_format") and ("table" in pipeline.components or "table" in pipeline.lazy_components):
+        settings["components"].setdefault("table", {}).update(
+            columnar=args.table_format == "columnar", max_rows=args.table_max_rows,
+        )
+
+    return settings
 
 
 def main(*argv):
@@ -75,11 +417,75 @@ def main(*argv):
     run_parser = sub_parsers.add_parser("run")
     run_parser.set_defaults(func=cmd_run)
     run_parser.add_argument("url")
-    run_parser.add_argument("--browser", "-b", default="requests")
+    add_browser_arguments(run_parser)
+    add_pipeline_arguments(run_parser)
+    add_incremental_arguments(run_parser)
+    add_output_arguments(run_parser)
 
     run_subproc_parser = sub_parsers.add_parser("run-subprocess")
     run_subproc_parser.set_defaults(func=cmd_run_subprocess)
-    run_subproc_parser.add_argument("--browser", "-b", default="requests")
+    add_browser_arguments(run_subproc_parser)
+    add_pipeline_arguments(run_subproc_parser)
+    add_output_arguments(run_subproc_parser)
+    run_subproc_parser.add_argument("--protocol", type=int, choices=[1, 2], default=1,
+                                    help="1 reads bare urls, 2 reads JSON requests and replies out of order")
+    run_subproc_parser.add_argument("--concurrency", "-c", type=int, default=16,
+                                    help="number of requests processed at once with protocol 2")
+    add_metrics_arguments(run_subproc_parser)
+
+    run_batch_parser = sub_parsers.add_parser("run-batch")
+    run_batch_parser.set_defaults(func=cmd_run_batch)
+    run_batch_parser.add_argument("input", nargs="?", default="-", help="file with one url per line, - for stdin")
+    add_browser_arguments(run_batch_parser, stream_parse=False)
+    add_pipeline_arguments(run_batch_parser)
+    add_incremental_arguments(run_batch_parser)
+    add_output_arguments(run_batch_parser)
+    run_batch_parser.add_argument("--workers", "-w", type=int, default=os.cpu_count(),
+                                  help="number of processes running the pipeline")
+    run_batch_parser.add_argument("--fetchers", "-f", type=int, default=16, help="number of concurrent fetches")
+    run_batch_parser.add_argument("--ordered", action="store_true", help="write results in input order")
+
+    crawl_parser = sub_parsers.add_parser("crawl")
+    crawl_parser.set_defaults(func=cmd_crawl)
+    crawl_parser.add_argument("input", nargs="?", default="-", help="file with one seed url per line, - for stdin")
+    add_browser_arguments(crawl_parser)
+    add_pipeline_arguments(crawl_parser)
+    add_output_arguments(crawl_parser)
+    crawl_parser.add_argument("--follow", type=processor_list, default=["Imprint", "Contact"],
+                              help="comma separated semantic link classes to follow, all for every link")
+    crawl_parser.add_argument("--other-hosts", action="store_true", help="follow links to other hosts as well")
+    crawl_parser.add_argument("--max-depth", type=int, default=1, help="maximum number of links followed from a seed")
+    crawl_parser.add_argument("--max-pages", type=int, help="maximum number of pages requested in total")
+    crawl_parser.add_argument("--max-per-host", type=int, default=1, help="concurrent requests per host")
+    crawl_parser.add_argument("--rate", type=float, default=1.0, help="requests per second per host, 0 for no limit")
+    crawl_parser.add_argument("--fetchers", "-f", type=int, default=16, help="number of concurrent fetches")
+    crawl_parser.add_argument("--expected-urls", type=int, default=1_000_000,
+                              help="number of urls the set of visited urls is sized for")
+
+    serve_parser = sub_parsers.add_parser("serve")
+    serve_parser.set_defaults(func=cmd_serve)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", "-p", type=int, default=8080)
+    serve_parser.add_argument("--unix-socket", help="listen on this unix socket instead of host and port")
+    serve_parser.add_argument("--workers", "-w", type=int, default=os.cpu_count(), help="number of worker processes")
+    serve_parser.add_argument("--max-jobs", type=int, default=1000,
+                              help="replace a worker after this many jobs, 0 for never")
+    serve_parser.add_argument("--fetchers", "-f", type=int, default=8,
+                              help="number of concurrent fetches per batch request")
+    add_browser_arguments(serve_parser)
+    add_pipeline_arguments(serve_parser)
+
+    bench_parser = sub_parsers.add_parser("bench")
+    bench_parser.set_defaults(func=cmd_bench)
+    bench_parser.add_argument("--corpus", help="directory of *.html files to use instead of the built-in corpus")
+    bench_parser.add_argument("--repeat", "-n", type=int, default=5)
+    bench_parser.add_argument("--warmup", type=int, default=1)
+    bench_parser.add_argument("--only", type=processor_list, help="comma separated processors to benchmark")
+    bench_parser.add_argument("--baseline", help="fail if slower than the results stored in this file")
+    bench_parser.add_argument("--tolerance", type=float, default=0.2,
+                              help="allowed slowdown against the baseline, 0.2 means 20%%")
+    bench_parser.add_argument("--save-baseline", help="store the results in this file")
+    bench_parser.add_argument("--json", action="store_true", help="print the results as JSON")
 
     config_parser = sub_parsers.add_parser("config")
     config_parser.set_defaults(func=cmd_config)
@@ -87,6 +493,22 @@ def main(*argv):
     args = arg_parser.parse_args(argv or sys.argv[1:])
     load_all_plugins()
 
+    if getattr(args, "trace_memory", False):
+        args.timings = True
+        tracemalloc.start()
+
+    try:
+        pipeline.configure(**pipeline_settings(args))
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    # processors are only known after loading the plugins
+    if getattr(args, "only", None):
+        try:
+            pipeline.required_components(args.only)
+        except ValueError as e:
+            arg_parser.error(str(e))
+
     args.func(args)
 
 
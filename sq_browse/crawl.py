@@ -0,0 +1,261 @@
+"""Polite crawling, which follows links selected from the pages' `_links` starting from a set of seed urls.
+
+Pending urls are queued per host. A host is only requested again once `1 / rate` seconds passed since its last
+request and while it has less than `max_per_host` requests in flight, so thousands of sites can be crawled at once
+without hammering any of them. Visited urls are remembered in their canonical form in a Bloom filter.
+"""
+import hashlib
+import heapq
+import math
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
+from urllib.parse import urlsplit
+
+from sq_browse.browser import Browser, ThreadLocalBrowsers
+from sq_browse.postprocessing import BaseProcessor, Pipeline, SemanticLinkProcessor
+from sq_browse.utils import canonicalize_url
+
+
+def host_of(url: str) -> str:
+    """Host and port of the url, also for urls without a scheme."""
+    return urlsplit(url if "://" in url else f"//{url}").netloc.lower()
+
+
+class BloomFilter(object):
+    """Set of strings in a fixed amount of memory, which may report false positives at `error_rate`.
+
+    The size is chosen for `capacity` items, with more items the error rate grows.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> bool:
+        """Add the item and return whether it was new."""
+        new = False
+
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+
+        self.count += new
+
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+
+class Frontier(object):
+    """Urls waiting to be crawled, queued per host.
+
+    `pop` only returns urls of hosts which may be requested now. Every popped url has to be `release`d once its
+    request finished.
+    """
+
+    def __init__(self, max_per_host: int = 1, rate: float = 1.0):
+        self.max_per_host = max_per_host
+        self.interval = 1 / rate if rate else 0
+        self.queues: Dict[str, deque] = {}
+        self.active: Dict[str, int] = {}
+        self.next_request: Dict[str, float] = {}
+        # hosts with queued urls and free slots, by the time they may be requested next
+        self._schedule: List[Tuple[float, int, str]] = []
+        self._scheduled: Set[str] = set()
+        self._sequence = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _schedule_host(self, host: str):
+        if host in self._scheduled or not self.queues.get(host) or self.active.get(host, 0) >= self.max_per_host:
+            return
+
+        self._sequence += 1
+        heapq.heappush(self._schedule, (self.next_request.get(host, 0), self._sequence, host))
+        self._scheduled.add(host)
+
+    def push(self, url: str, depth: int, seed: str):
+        host = host_of(url)
+        self.queues.setdefault(host, deque()).append((url, depth, seed))
+        self._size += 1
+        self._schedule_host(host)
+
+    def pop(self) -> Tuple[str, int, str] | None:
+        now = time.monotonic()
+
+        if not self._schedule or self._schedule[0][0] > now:
+            return None
+
+        _, _, host = heapq.heappop(self._schedule)
+        self._scheduled.discard(host)
+        item = self.queues[host].popleft()
+        self._size -= 1
+
+        if not self.queues[host]:
+            del self.queues[host]
+
+        self.active[host] = self.active.get(host, 0) + 1
+        self.next_request[host] = now + self.interval
+        self._schedule_host(host)
+
+        return item
+
+    def release(self, url: str):
+        host = host_of(url)
+        self.active[host] -= 1
+
+        if not self.active[host]:
+            del self.active[host]
+
+            if self.next_request[host] <= time.monotonic() and host not in self.queues:
+                del self.next_request[host]
+
+        self._schedule_host(host)
+
+    def wait_time(self) -> float | None:
+        """Seconds until the next url may be popped, None if no url is waiting for a free slot."""
+        if not self._schedule:
+            return None
+
+        return max(self._schedule[0][0] - time.monotonic(), 0)
+
+
+class FollowLinkProcessor(BaseProcessor):
+    """Selects the links to crawl from `_links` into `content.follow`.
+
+    Links are selected by their semantic class as classified by `SemanticLinkProcessor`, or all links with
+    `follow_all`. Unless `other_hosts` is set, only links to the host of the page are followed.
+    """
+    dependencies = ["links"]
+    consumes = ["_links"]
+
+    def __init__(self, classes: Iterable[str] = ("Imprint", "Contact"), follow_all: bool = False,
+                 other_hosts: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.classes = set(classes)
+        self.follow_all = follow_all
+        self.other_hosts = other_hosts
+        self.classifier = SemanticLinkProcessor()
+
+    def process(self, data: Dict) -> Dict:
+        host = host_of(canonicalize_url(data["meta"]["url"]) or data["meta"]["url"])
+        follow = []
+        seen = set()
+
+        for link in data["_links"]:
+            href = canonicalize_url(link["href"])
+
+            if href is None or href in seen or (not self.other_hosts and host_of(href) != host):
+                continue
+
+            link_class = self.classifier.classify_link_title(link["title"])
+
+            if self.follow_all or link_class in self.classes:
+                seen.add(href)
+                follow.append({"class": link_class, "href": href})
+
+        data["content"]["follow"] = follow
+
+        return data
+
+    def cache_token(self) -> str:
+        return f"{super().cache_token()}:{sorted(self.classes)}:{self.follow_all}:{self.other_hosts}"
+
+
+class Crawler(object):
+    """Crawls from seed urls with a pool of fetcher threads, following links up to `max_depth` hops from the seeds.
+
+    At most `max_pages` pages are requested in total. The links to follow are selected by the `follow` component,
+    which is added to the pipeline.
+    """
+
+    def __init__(self, browser_factory: Callable[[], Browser], pipeline: Pipeline, follow: FollowLinkProcessor = None,
+                 max_depth: int = 1, max_pages: int = None, max_per_host: int = 1, rate: float = 1.0,
+                 fetchers: int = 16, only: List[str] = None, timings: bool = False, capacity: int = 1_000_000,
+                 error_rate: float = 0.001):
+        self.browser_factory = browser_factory
+        self.pipeline = pipeline
+        self.pipeline.add_component("follow", follow or FollowLinkProcessor())
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.fetchers = fetchers
+        self.only = [*only, "follow"] if only else None
+        self.timings = timings
+        self.frontier = Frontier(max_per_host=max_per_host, rate=rate)
+        self.visited = BloomFilter(capacity, error_rate)
+        self.requested = 0
+        self.browsers = ThreadLocalBrowsers(browser_factory)
+
+    def browse(self, url: str, depth: int, seed: str) -> Dict:
+        response = self.browsers.get().browse(url)
+        response.meta["crawl"] = {"depth": depth, "seed": seed}
+
+        return self.pipeline.run(response, fail_save=False, only=self.only, timings=self.timings)
+
+    def enqueue(self, url: str, depth: int, seed: str):
+        if self.max_pages is not None and self.requested + len(self.frontier) >= self.max_pages:
+            return
+
+        # seeds may lack a scheme, the browser tries the possible urls then
+        if self.visited.add(canonicalize_url(url) or url):
+            self.frontier.push(url, depth, seed)
+
+    def run(self, seeds: Iterable[str]) -> Iterator[Tuple[str, Dict | Exception]]:
+        """Yield `(url, result or exception)` for every crawled url in completion order."""
+        for seed in seeds:
+            self.enqueue(seed, 0, seed)
+
+        in_flight: Dict[Future, str] = {}
+
+        with ThreadPoolExecutor(self.fetchers) as executor:
+            while True:
+                while len(in_flight) < self.fetchers and (item := self.frontier.pop()) is not None:
+                    self.requested += 1
+                    in_flight[executor.submit(self.browse, *item)] = item
+
+                if not in_flight:
+                    if (wait_time := self.frontier.wait_time()) is None:
+                        break
+
+                    time.sleep(wait_time)
+                    continue
+
+                # with all fetchers busy, ready urls have to wait for a fetcher anyway
+                timeout = None if len(in_flight) >= self.fetchers else self.frontier.wait_time()
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    url, depth, seed = in_flight.pop(future)
+                    self.frontier.release(url)
+
+                    if future.exception() is not None:
+                        yield url, future.exception()
+                        continue
+
+                    data = future.result()
+                    self.visited.add(canonicalize_url(data["meta"]["url"]) or data["meta"]["url"])
+
+                    if depth < self.max_depth:
+                        for link in data["content"].get("follow", []):
+                            self.enqueue(link["href"], depth + 1, seed)
+
+                    yield url, data
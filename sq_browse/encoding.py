@@ -0,0 +1,93 @@
+"""Character encodings of fetched documents.
+
+Browsers keep the body as bytes together with the encoding the document declares, either in the `Content-Type`
+header, by a byte order mark or in a `<meta charset>` or XML declaration near its start. lxml parses the bytes
+directly, so the content is never decoded to `str` and encoded again. Only if nothing is declared, the encoding is
+guessed: UTF-8 if the body is valid UTF-8, statistical detection as the last resort.
+"""
+import codecs
+import re
+
+# as in the prescan of the HTML standard
+PRESCAN_BYTES = 1024
+DECLARED_CHARSET = re.compile(
+    rb"""<(?:meta\b[^>]*?charset|\?xml\b[^>]*?encoding)\s*=\s*["']?\s*([a-zA-Z0-9_.:\-]+)""",
+    re.IGNORECASE,
+)
+BOMS = [(codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be")]
+# labels browsers treat as windows-1252, which is a superset
+WINDOWS_1252 = {"ascii", "latin-1", "iso8859-1"}
+# a document declaring these in ASCII cannot be in them, the prescan of the HTML standard takes UTF-8 instead
+WIDE_ENCODINGS = ("utf-16", "utf-32")
+
+
+def normalize_encoding(name: str | None) -> str | None:
+    """Python's name of the encoding, None if it is unknown or not a text encoding, such as `hex` or `rot13`."""
+    try:
+        codec = codecs.lookup(name.strip()) if name else None
+    except LookupError:
+        return None
+
+    if codec is None or not codec._is_text_encoding:
+        return None
+
+    return "cp1252" if codec.name in WINDOWS_1252 else codec.name
+
+
+def header_charset(headers) -> str | None:
+    """Return the charset declared in the content-type header, if any."""
+    content_type = headers.get("content-type", "")
+
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+
+        if key.lower() == "charset":
+            return value.strip("\"' ") or None
+
+
+def declared_encoding(headers, body: bytes) -> str | None:
+    """The encoding declared by the byte order mark, the headers or the document, in this order."""
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return encoding
+
+    if encoding := normalize_encoding(header_charset(headers)):
+        return encoding
+
+    if match := DECLARED_CHARSET.search(body, 0, PRESCAN_BYTES):
+        encoding = normalize_encoding(match.group(1).decode("ascii"))
+
+        return "utf-8" if encoding and encoding.startswith(WIDE_ENCODINGS) else encoding
+
+    return None
+
+
+def strip_bom(body: bytes) -> bytes:
+    """The body without its byte order mark, which parsers told the encoding do not expect."""
+    for bom, _ in BOMS:
+        if body.startswith(bom):
+            return body[len(bom):]
+
+    return body
+
+
+def detect_encoding(body: bytes) -> str:
+    """Guess the encoding of a document which declares none."""
+    try:
+        # a truncated body may end within a character
+        codecs.getincrementaldecoder("utf-8")().decode(body, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    try:
+        from requests.compat import chardet
+    except ImportError:
+        return "cp1252"
+
+    return normalize_encoding(chardet.detect(body)["encoding"]) or "cp1252"
+
+
+def decode(body: bytes, encoding: str = None) -> str:
+    """Decode a body with its declared encoding, or with the guessed one."""
+    return body.decode(normalize_encoding(encoding) or detect_encoding(body), errors="replace")
@@ -6,3 +6,23 @@ class SqBrowseError(Exception):
 
 class UnprocessableError(SqBrowseError):
     pass
+
+
+class ResponseTooLargeError(SqBrowseError):
+    pass
+
+
+class MemoryBudgetExceededError(SqBrowseError):
+    pass
+
+
+class DeadlineExceededError(SqBrowseError):
+    pass
+
+
+class ProcessorTimeoutError(SqBrowseError):
+    pass
+
+
+class WorkersFailingError(SqBrowseError):
+    pass
@@ -1,9 +1,11 @@
 import re
+from typing import Dict, List
+
 from lxml import etree
-from collections import deque
 
 
 WHITESPACE_AROUND_LINEBREAK = re.compile(r"[ \t]*\n[ \t]*")
+MULTIPLE_SPACES = re.compile(r" +")
 FORCED_LINE_BREAK = object()
 IGNORE_CSS_CLASSES = ("hidden", "consent", "cookie", "banner", "overlay", "widget", "menu")
 IGNORE_ELEMS = {"script", "style", etree.Comment, "meta", "head", "svg", "nav", "figcaption", "aside", "form", "footer"}
@@ -17,25 +19,48 @@ VISIBLE_ELEMS = BLOCKS | INLINES | {"body", "html"}
 INDENTS = {"ul", "ol"}
 
 
-def is_essentially_block(elem):
+def is_essentially_block(elem, memo: Dict = None):
     """Returns True if the given element acts as a block element.
 
     Can be true, even if the given element is an inline element. E.g. when it is embedded between two block elements.
+    Results are stored in `memo` for the element and all ancestors visited, so that siblings and descendants do not
+    walk up the same ancestor chain again.
     """
-    if elem.tag in BLOCKS:
-        return True
+    memo = {} if memo is None else memo
+    chain = []
 
-    no_inline_next = elem.getnext() is None or elem.getnext().tag in BLOCKS
-    no_inline_prev = elem.getprevious() is None or elem.getprevious().tag in BLOCKS
+    while True:
+        if elem in memo:
+            result = memo[elem]
+            break
 
-    if elem.getparent() is None:
-        return True
+        chain.append(elem)
 
-    if no_inline_next and no_inline_prev and (
-            not (elem.getparent().text or "").strip() and is_essentially_block(elem.getparent())):
-        return True
+        if elem.tag in BLOCKS:
+            result = True
+            break
 
-    return False
+        parent = elem.getparent()
+
+        if parent is None:
+            result = True
+            break
+
+        no_inline_next = elem.getnext() is None or elem.getnext().tag in BLOCKS
+        no_inline_prev = elem.getprevious() is None or elem.getprevious().tag in BLOCKS
+
+        # an inline element alone in its parent is a block exactly if its parent is one
+        if no_inline_next and no_inline_prev and not (parent.text or "").strip():
+            elem = parent
+            continue
+
+        result = False
+        break
+
+    for visited in chain:
+        memo[visited] = result
+
+    return result
 
 
 def render_text(s):
@@ -63,42 +88,66 @@ def should_be_ignored(elem):
     return is_hidden_by_attr or is_hidden_by_css or blacklisted_class
 
 
+def _join_texts(texts: List, context: str) -> str:
+    if context == "inline":
+        text = "".join(["\n" if t is FORCED_LINE_BREAK else t for t in texts])
+
+        return MULTIPLE_SPACES.sub(" ", text)
+
+    return "\n\n".join(["" if t is FORCED_LINE_BREAK else t for t in texts if t is FORCED_LINE_BREAK or t.strip()])
+
+
 def get_text(elem):
-    """Convert lxml element to text."""
+    """Convert lxml element to text.
+
+    Walks the tree with an explicit stack instead of recursion, so that the depth of the document is not limited by
+    the recursion limit. Every stack frame holds `[element, texts, child iterator, context, current child]`.
+    """
     if should_be_ignored(elem):
         return ""
 
-    leading_text_node = elem.text or ""
-    context = "block" if any(child.tag in BLOCKS for child in elem) else "inline"
+    # leaves, like most table cells, need no walk
+    if not len(elem):
+        return MULTIPLE_SPACES.sub(" ", render_text(elem.text or ""))
 
-    leading_text_node = render_text(leading_text_node)
-    texts = deque([leading_text_node])
+    block_memo = {}
+    stack = [_text_frame(elem)]
+    child_text = None
 
-    for child in elem:
-        if should_be_ignored(child):
-            continue
+    while True:
+        frame = stack[-1]
+        texts = frame[1]
 
-        if child.tag in ("span", "a") and is_essentially_block(child):
-            continue
+        if child_text is not None:
+            child = frame[4]
+            texts.append(child_text)
+            child_text = None
 
-        texts.append(get_text(child))
+            if child.tag == "br":
+                texts.append(FORCED_LINE_BREAK)
+                texts.append(render_text(child.tail or "").lstrip())
+            elif child.tail:
+                texts.append(render_text(child.tail or ""))
 
-        if child.tag == "br":
-            tail = render_text(child.tail or "").lstrip()
-            texts.append(FORCED_LINE_BREAK)
-            texts.append(tail)
-        elif child.tail:
-            texts.append(render_text(child.tail or ""))
+        for child in frame[2]:
+            if should_be_ignored(child):
+                continue
 
-    if context == "inline":
-        text = "".join(["\n" if t is FORCED_LINE_BREAK else t for t in texts])
+            if child.tag in ("span", "a") and is_essentially_block(child, block_memo):
+                continue
+
+            frame[4] = child
+            stack.append(_text_frame(child))
+            break
+        else:
+            stack.pop()
+            child_text = _join_texts(texts, frame[3])
 
-        text = re.sub(r" +", " ", text)
-        # text = text.strip()
+            if not stack:
+                return child_text
 
-        return text
 
-    if context == "block":
-        text = "\n\n".join(["" if t is FORCED_LINE_BREAK else t for t in texts if t is FORCED_LINE_BREAK or t.strip()])
+def _text_frame(elem) -> List:
+    context = "block" if any(child.tag in BLOCKS for child in elem) else "inline"
 
-        return text
+    return [elem, [render_text(elem.text or "")], iter(elem), context, None]
@@ -0,0 +1,253 @@
+"""Incremental re-browsing, which emits only what changed since the previous run of a url.
+
+The last result of every url is kept in a `ResultStore`. Pages are requested conditionally with the validators of the
+previous response. If the server answers 304 Not Modified, or the content is the same as before, the pipeline is
+skipped and an empty `content` is emitted. Otherwise `content` is replaced by a patch against the previous content,
+see `diff`. Whether a page is `new`, `changed` or `unchanged` is recorded as `incremental` in the meta data.
+"""
+import difflib
+import hashlib
+import json
+import os
+from copy import deepcopy
+from dataclasses import replace
+from typing import Any, Dict, List
+
+from sq_browse.browser import Browser
+from sq_browse.postprocessing import Pipeline
+from sq_browse.structs import BrowserResponse
+from sq_browse.utils import atomic_write
+
+
+def _pointer(path: str, key) -> str:
+    return f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+
+def _item_key(value) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict]:
+    """JSON Patch (RFC 6902) turning the JSON value `old` into `new`.
+
+    Lists are compared item by item, so added or removed links and rows only cost their own operations. Changed
+    multi-line strings use the additional operation `{"op": "lines", "path": ..., "edits": [[start, end, lines]]}`,
+    which replaces the lines `start:end` with `lines`. Edits and list operations are ordered from the end, so applying
+    them in order keeps the positions of the following ones valid.
+    """
+    if old == new:
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = [{"op": "remove", "path": _pointer(path, key)} for key in old if key not in new]
+
+        for key, value in new.items():
+            if key in old:
+                ops.extend(diff(old[key], value, _pointer(path, key)))
+            else:
+                ops.append({"op": "add", "path": _pointer(path, key), "value": value})
+
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        old_keys, new_keys = [_item_key(value) for value in old], [_item_key(value) for value in new]
+
+        for tag, i1, i2, j1, j2 in reversed(difflib.SequenceMatcher(None, old_keys, new_keys, False).get_opcodes()):
+            if tag == "equal":
+                continue
+
+            if tag == "replace" and i2 - i1 == j2 - j1:
+                for offset in reversed(range(i2 - i1)):
+                    ops.extend(diff(old[i1 + offset], new[j1 + offset], _pointer(path, i1 + offset)))
+
+                continue
+
+            ops.extend({"op": "remove", "path": _pointer(path, index)} for index in reversed(range(i1, i2)))
+            ops.extend(
+                {"op": "add", "path": _pointer(path, i1 + offset), "value": value}
+                for offset, value
+                in enumerate(new[j1:j2])
+            )
+
+        return ops
+
+    if isinstance(old, str) and isinstance(new, str) and "\n" in old and "\n" in new:
+        old_lines, new_lines = old.splitlines(keepends=True), new.splitlines(keepends=True)
+        edits = [
+            [i1, i2, new_lines[j1:j2]]
+            for tag, i1, i2, j1, j2
+            in reversed(difflib.SequenceMatcher(None, old_lines, new_lines, False).get_opcodes())
+            if tag != "equal"
+        ]
+
+        return [{"op": "lines", "path": path, "edits": edits}]
+
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def _edit_lines(text: str, edits: List) -> str:
+    lines = text.splitlines(keepends=True)
+
+    for start, end, new_lines in edits:
+        lines[start:end] = new_lines
+
+    return "".join(lines)
+
+
+def apply_diff(value: Any, ops: List[Dict]) -> Any:
+    """Apply a patch created by `diff` to a copy of `value`."""
+    value = deepcopy(value)
+
+    for op in ops:
+        keys = [key.replace("~1", "/").replace("~0", "~") for key in op["path"].split("/")[1:]]
+
+        if not keys:
+            value = _edit_lines(value, op["edits"]) if op["op"] == "lines" else op.get("value")
+            continue
+
+        parent = value
+
+        for key in keys[:-1]:
+            parent = parent[int(key) if isinstance(parent, list) else key]
+
+        key = int(keys[-1]) if isinstance(parent, list) else keys[-1]
+
+        if op["op"] == "remove":
+            del parent[key]
+        elif op["op"] == "add" and isinstance(parent, list):
+            parent.insert(key, op["value"])
+        elif op["op"] == "lines":
+            parent[key] = _edit_lines(parent[key], op["edits"])
+        else:
+            parent[key] = op["value"]
+
+    return value
+
+
+class ResultStore(object):
+    """Keeps the last result of every url as a JSON file in `store_dir`."""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.store_dir, key[:2], f"{key}.json")
+
+    def get(self, url: str) -> Dict | None:
+        try:
+            with open(self._path(url), "rb") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, entry: Dict):
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps(entry))
+
+
+class IncrementalBrowsing(object):
+    """Runs the pipeline only for changed pages and replaces their `content` by a patch against the last run.
+
+    Browsing a url is split into steps, so fetching and processing may happen in different threads or processes:
+    `prepare` the state of the url, browse it with the `conditional_headers`, and either emit the `skipped` result if
+    the response is `unchanged`, or run the pipeline and `update` the result.
+    """
+    VALIDATORS = {"etag": "If-None-Match", "last-modified": "If-Modified-Since"}
+
+    def __init__(self, store: ResultStore, pipeline: Pipeline):
+        self.store = store
+        self.pipeline = pipeline
+
+    def prepare(self, url: str, only: List[str] = None) -> Dict:
+        """The state of the url before browsing it."""
+        tokens = self.pipeline.cache_tokens(self.pipeline.sorted_components(only))
+
+        return {
+            "url": url,
+            "previous": self.store.get(url),
+            "components": hashlib.sha256("\0".join(tokens).encode("utf-8")).hexdigest(),
+        }
+
+    def conditional_headers(self, state: Dict) -> Dict[str, str]:
+        previous = state["previous"]
+
+        # a 304 would leave nothing to run changed components on
+        if previous is None or previous["components"] != state["components"]:
+            return {}
+
+        return {header: previous["validators"][name] for name, header in self.VALIDATORS.items()
+                if name in previous["validators"]}
+
+    def unchanged(self, state: Dict, response: BrowserResponse) -> bool:
+        """Whether the previous result still holds. Has to be called before the response is processed."""
+        state["validators"] = {name: response.response_headers[name] for name in self.VALIDATORS
+                               if name in response.response_headers}
+        state["hash"] = None
+
+        # parsed while downloading, there is no content to compare
+        if response.tree is None and response.content is not None:
+            content = response.content
+            state["hash"] = hashlib.sha256(
+                content if isinstance(content, bytes) else content.encode("utf-8", errors="surrogatepass")
+            ).hexdigest()
+
+        previous = state["previous"]
+
+        if previous is None or previous["components"] != state["components"]:
+            return False
+
+        if response.status_code == 304:
+            return True
+
+        if state["hash"] is None or state["hash"] != previous["hash"]:
+            return False
+
+        if state["validators"] != previous["validators"]:
+            self.store.put(state["url"], {**previous, "validators": state["validators"]})
+
+        return True
+
+    def skipped(self, response: BrowserResponse, timings: bool = False) -> Dict:
+        """The result of an unchanged page, without running any component."""
+        data = self.pipeline.run(replace(response, content=""), only=[], timings=timings)
+        data["meta"]["incremental"] = "unchanged"
+
+        return data
+
+    def update(self, state: Dict, data: Dict) -> Dict:
+        """Store the processed result and replace its content by the patch against the previous one."""
+        # compare what the store returns next time, e.g. lists instead of tuples
+        content = json.loads(json.dumps(data["content"]))
+        previous = state["previous"]
+        # without a hash and validators, a result with failed or skipped stages is processed again next time
+        incomplete = "failed_stages" in data["meta"] or "skipped_stages" in data["meta"]
+        self.store.put(state["url"], {
+            "components": state["components"],
+            "hash": None if incomplete else state["hash"],
+            "validators": {} if incomplete else state["validators"],
+            "content": content,
+        })
+
+        if previous is None or previous["components"] != state["components"]:
+            data["meta"]["incremental"] = "new"
+        else:
+            data["meta"]["incremental"] = "changed"
+            data["content"] = diff(previous["content"], content)
+
+        return data
+
+    def run(self, browser: Browser, url: str, only: List[str] = None, timings: bool = False,
+            fail_save: bool = True) -> Dict:
+        """Browse and process the url in the calling thread."""
+        state = self.prepare(url, only)
+        response = browser.browse(url, headers=self.conditional_headers(state) or None)
+
+        if self.unchanged(state, response):
+            return self.skipped(response, timings)
+
+        return self.update(state, self.pipeline.run(response, fail_save=fail_save, only=only, timings=timings))
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from sq_browse.errors import MemoryBudgetExceededError
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def resident_memory() -> int:
+    """Resident set size of the process in bytes, 0 on platforms without `/proc`."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Timer(object):
+    """Measures wall time, CPU time of the current thread and, if tracemalloc is tracing, peak allocation.
+
+    Resetting the peak of tracemalloc is global, so a nested timer passes the peaks it hides on to the enclosing one.
+    """
+    # timers measuring memory in the current thread, innermost last
+    _active = threading.local()
+
+    def __init__(self):
+        self.timing = {}
+
+    def __enter__(self):
+        self._trace_memory = tracemalloc.is_tracing()
+
+        if self._trace_memory:
+            self._memory_start, self._enclosing_peak = tracemalloc.get_traced_memory()
+            self._hidden_peak = 0
+            tracemalloc.reset_peak()
+            self._active.__dict__.setdefault("timers", []).append(self)
+
+        self._cpu_start = time.thread_time()
+        self._wall_start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.timing["wall"] = time.perf_counter() - self._wall_start
+        self.timing["cpu"] = time.thread_time() - self._cpu_start
+
+        if self._trace_memory:
+            timers = self._active.timers
+            timers.remove(self)
+            peak = max(tracemalloc.get_traced_memory()[1], self._hidden_peak)
+            self.timing["peak_memory"] = max(peak - self._memory_start, 0)
+
+            if timers:
+                timers[-1]._hidden_peak = max(timers[-1]._hidden_peak, self._enclosing_peak, peak)
+
+
+class Instrumentation(object):
+    """Collects the timings of the stages of processing a single document.
+
+    Processors find the instrumentation of the current run in `data["_instrumentation"]` and can measure their own
+    sub-stages with `measure`. Every finished measurement is passed to the `hooks` as `hook(name, timing)`.
+    """
+
+    def __init__(self, enabled: bool = True, hooks: List[Callable[[str, Dict], None]] = None):
+        self.enabled = enabled
+        self.hooks = hooks or []
+        self.timings: Dict[str, Dict] = {}
+
+    @contextmanager
+    def measure(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        timer = Timer()
+
+        try:
+            with timer:
+                yield
+        finally:
+            self.record(name, timer.timing)
+
+    def record(self, name: str, timing: Dict):
+        self.timings[name] = timing
+
+        for hook in self.hooks:
+            hook(name, timing)
+
+
+class MemoryBudget(object):
+    """Limits the memory used for processing a single document to `limit` bytes.
+
+    The usage is the size of the document plus the growth of the resident set size since `start`. The resident set
+    is shared by all threads, so documents processed concurrently are charged for each other's allocations.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.document_size = 0
+        self._resident_start = 0
+
+    def start(self, document_size: int):
+        self.document_size = document_size
+        self._resident_start = resident_memory()
+
+    def usage(self) -> int:
+        return self.document_size + max(resident_memory() - self._resident_start, 0)
+
+    def check(self, stage: str):
+        if (usage := self.usage()) > self.limit:
+            raise MemoryBudgetExceededError(
+                f"Processing used {usage} bytes after {stage}, more than the budget of {self.limit} bytes"
+            )
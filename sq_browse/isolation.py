@@ -0,0 +1,163 @@
+"""Running untrusted processors, e.g. from plugins, in worker processes which are killed when they overrun.
+
+A processor in the pipeline's process can only be asked to stop, by checking the deadline in `data["_deadline"]`.
+An `IsolatedProcessor` sends the data to a worker process instead and kills the worker once the deadline passes, so
+a processor stuck in a loop or in a C extension cannot stall the pipeline. A crash of the worker only fails the
+current document. Workers are started on demand and reused.
+
+The data is pickled on its way to the worker and back, so only what the processor `consumes` is sent if it declares
+it, and the content is not sent back. The parsed document is sent as HTML and parsed again in the worker; the parent
+keeps its own tree.
+"""
+import multiprocessing
+import threading
+from typing import Dict, List, Tuple
+
+from lxml import html
+
+from sq_browse.errors import ProcessorTimeoutError, UnprocessableError
+from sq_browse.postprocessing import BaseProcessor, LinkStream
+
+# keys only meaningful in the pipeline's process, the index holds elements of the tree
+LOCAL_KEYS = ("_instrumentation", "_deadline", "_tree", "_index")
+
+
+def serve_processor(connection, processor: BaseProcessor):
+    """Main loop of a worker process: process the data received until the parent closes the connection."""
+    while True:
+        try:
+            data = connection.recv()
+        except (EOFError, OSError):
+            return
+
+        try:
+            if (tree := data.get("_tree")) is not None:
+                parser = html.HTMLParser(encoding="utf-8")
+                data["_tree"] = html.fromstring(tree, base_url=data["meta"]["url"], parser=parser)
+
+            received = dict(data)
+            data = processor.process(data)
+            # intermediate data the processor did not replace stays as it is in the parent
+            result = {
+                key: value for key, value in data.items()
+                if key not in LOCAL_KEYS and not (key.startswith("_") and received.get(key) is value)
+            }
+
+            # the parent still has the content, it is not sent back
+            if isinstance(result.get("raw"), dict):
+                result["raw"] = {key: value for key, value in result["raw"].items() if key != "content"}
+
+            connection.send(("ok", result))
+        except Exception as e:
+            connection.send(("error", f"{e.__class__.__name__}: {e}"))
+
+
+class IsolatedProcessor(BaseProcessor):
+    """Runs another processor in worker processes, killing a worker which overruns the deadline of its stage."""
+    MP_CONTEXT = multiprocessing.get_context("spawn")
+
+    def __init__(self, processor: BaseProcessor):
+        self.processor = processor
+        self.dependencies = processor.dependencies
+        self.consumes = processor.consumes
+        self.version = processor.version
+        self.depends_on_url = processor.depends_on_url
+        self.optional = processor.optional
+        self.time_budget = processor.time_budget
+        self._idle: List[Tuple[multiprocessing.Process, object]] = []
+        self._lock = threading.Lock()
+
+    def cache_token(self) -> str:
+        return self.processor.cache_token()
+
+    def start_worker(self) -> Tuple[multiprocessing.Process, object]:
+        connection, worker_connection = self.MP_CONTEXT.Pipe()
+        process = self.MP_CONTEXT.Process(target=serve_processor, args=(worker_connection, self.processor),
+                                          daemon=True)
+        process.start()
+        worker_connection.close()
+
+        return process, connection
+
+    def acquire(self) -> Tuple[multiprocessing.Process, object]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+
+        return self.start_worker()
+
+    def release(self, worker: Tuple[multiprocessing.Process, object]):
+        with self._lock:
+            self._idle.append(worker)
+
+    @staticmethod
+    def kill(worker: Tuple[multiprocessing.Process, object]):
+        process, connection = worker
+        process.kill()
+        process.join()
+        connection.close()
+
+    def payload(self, data: Dict) -> Dict:
+        consumed = None if self.consumes is None else set(self.consumes)
+        payload = {
+            key: value for key, value in data.items()
+            if key not in LOCAL_KEYS and (consumed is None or not key.startswith("_") or key in consumed)
+        }
+
+        if consumed is not None and "raw.content" not in consumed and "raw" in payload:
+            payload["raw"] = {key: value for key, value in payload["raw"].items() if key != "content"}
+
+        if data.get("_tree") is not None and (consumed is None or "_tree" in consumed):
+            payload["_tree"] = html.tostring(data["_tree"], encoding="utf-8")
+
+        # a `LinkStream` of low memory mode refers to elements of the tree
+        if isinstance(payload.get("_links"), LinkStream):
+            payload["_links"] = list(payload["_links"])
+
+        return payload
+
+    def process(self, data: Dict) -> Dict:
+        name = self.processor.__class__.__name__
+        deadline = data.get("_deadline")
+        payload = self.payload(data)
+        worker = self.acquire()
+
+        try:
+            worker[1].send(payload)
+
+            if not worker[1].poll(None if deadline is None else deadline.remaining()):
+                self.kill(worker)
+                worker = None
+                raise ProcessorTimeoutError(f"{name} did not finish within {deadline.timeout:.3f}s")
+
+            status, result = worker[1].recv()
+        except (EOFError, OSError) as e:
+            self.kill(worker)
+            worker = None
+            raise UnprocessableError(f"Worker process of {name} died: {e!r}")
+        finally:
+            if worker is not None:
+                self.release(worker)
+
+        if status != "ok":
+            raise UnprocessableError(result)
+
+        if "raw" in result:
+            result["raw"] = {**data["raw"], **result["raw"]}
+
+        data.update(result)
+
+        return data
+
+    def close(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+
+        for process, connection in workers:
+            # the worker exits when the connection is closed
+            connection.close()
+            process.join(timeout=1)
+
+            if process.is_alive():
+                process.kill()
+                process.join()
@@ -0,0 +1,12 @@
+import importlib
+
+
+def resolve(path: str):
+    """Import the object referenced by `path` in the entry point format `module:attribute`."""
+    module_name, _, attribute = path.split("[")[0].strip().partition(":")
+    obj = importlib.import_module(module_name.strip())
+
+    for part in filter(None, attribute.strip().split(".")):
+        obj = getattr(obj, part)
+
+    return obj
@@ -0,0 +1,235 @@
+"""Counters and histograms of long-running processes in the Prometheus text format.
+
+`Metrics` counts processed urls, failures by exception class, downloaded bytes and cache hits, and measures the
+latency of fetches and of every processor. The metrics are served on a local HTTP endpoint, written to a file
+periodically, or both. Recording a value only takes a lock and a few additions, so metrics can stay enabled.
+"""
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Tuple
+
+from sq_browse.browser import Browser
+from sq_browse.instrumentation import Timer
+from sq_browse.postprocessing import Pipeline
+from sq_browse.structs import BrowserResponse
+from sq_browse.utils import atomic_write
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    escaped = [value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in values]
+    pairs = [f'{name}="{value}"' for name, value in zip(names, escaped)] + ([extra] if extra else [])
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(object):
+    """Monotonically increasing count per combination of label values."""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Histogram(object):
+    """Distribution of observed values in cumulative buckets per combination of label values."""
+    type = "histogram"
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: Tuple[float] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets or self.BUCKETS
+        # per label values: the count of every bucket and of +Inf, the sum and the count
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        position = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            if (entry := self.values.get(label_values)) is None:
+                entry = self.values[label_values] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+
+            entry[0][position] += 1
+            entry[1][0] += value
+            entry[1][1] += 1
+
+    def samples(self) -> List[str]:
+        samples = []
+
+        with self._lock:
+            for key, (counts, (total, count)) in self.values.items():
+                cumulative = 0
+
+                for bound, bucket_count in zip([*map(str, self.buckets), "+Inf"], counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.labels, key, f'le="{bound}"')
+                    samples.append(f"{self.name}_bucket{labels} {cumulative}")
+
+                samples.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+                samples.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+
+        return samples
+
+
+class Metrics(object):
+    """The metrics of a process running the pipeline.
+
+    The processor latencies are recorded by a timing hook of the `pipeline`. Browsers have to be wrapped with `wrap`
+    to record fetches, and the callers of the pipeline report every url with `observe_result` or `observe_failure`.
+    """
+
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.urls = Counter("sq_browse_urls_processed_total", "Urls browsed and processed successfully.")
+        self.failures = Counter("sq_browse_failures_total", "Urls which failed, by exception class.", ("exception",))
+        self.fetch_latency = Histogram("sq_browse_fetch_duration_seconds", "Wall time of fetching a url.")
+        self.processor_latency = Histogram("sq_browse_processor_duration_seconds", "Wall time of every processor.",
+                                           ("processor",))
+        self.downloaded = Counter("sq_browse_downloaded_bytes_total", "Bytes received from the network.")
+        self.cache_lookups = Counter("sq_browse_cache_lookups_total", "Lookups in the response and result caches.",
+                                     ("cache",))
+        self.cache_hits = Counter("sq_browse_cache_hits_total", "Hits of the response and result caches.", ("cache",))
+        self.all = [self.urls, self.failures, self.fetch_latency, self.processor_latency, self.downloaded,
+                    self.cache_lookups, self.cache_hits]
+        self._server = None
+        self._stop = threading.Event()
+        self._writer = None
+
+        pipeline.timing_hooks.append(self.observe_stage)
+
+    def observe_stage(self, name: str, timing: Dict):
+        # sub-stages measured by the processors themselves and the browser's stages are skipped
+        if name in self.pipeline.components:
+            self.processor_latency.observe(timing["wall"], name)
+
+    def observe_response(self, response: BrowserResponse, wall: float):
+        self.fetch_latency.observe(wall)
+
+        # revalidated cached bodies were not downloaded again, browsers which do not report what they received
+        # are assumed to have downloaded the content
+        if response.meta.get("cache") != "hit":
+            self.downloaded.inc(response.meta.get("received_bytes", len(response.content or b"")))
+
+        if "cache" in response.meta:
+            self.cache_lookups.inc(1, "response")
+            self.cache_hits.inc(int(response.meta["cache"] == "hit"), "response")
+
+    def observe_result(self, data: Dict):
+        self.urls.inc()
+
+        if "result_cache" in data["meta"]:
+            self.cache_lookups.inc(1, "result")
+            self.cache_hits.inc(int(data["meta"]["result_cache"] == "hit"), "result")
+
+    def observe_failure(self, e: Exception):
+        # processor failures are raised as `UnprocessableError` from the original exception
+        self.failures.inc(1, (e.__cause__ or e).__class__.__name__)
+
+    def wrap(self, browser: Browser) -> "MeasuredBrowser":
+        return MeasuredBrowser(browser, self)
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self.all:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        # scrapers of the file never see a partial file
+        atomic_write(path, self.render())
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9464) -> Tuple[str, int]:
+        """Serve the metrics on `/metrics` from a background thread and return the address."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        return self._server.server_address[:2]
+
+    def write_periodically(self, path: str, interval: float = 15):
+        """Write the metrics to `path` every `interval` seconds from a background thread, and once more on `close`."""
+        def run():
+            while not self._stop.wait(interval):
+                self.write(path)
+
+            self.write(path)
+
+        self._writer = threading.Thread(target=run, daemon=True)
+        self._writer.start()
+
+    def close(self):
+        self._stop.set()
+
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+        if self.observe_stage in self.pipeline.timing_hooks:
+            self.pipeline.timing_hooks.remove(self.observe_stage)
+
+
+class MeasuredBrowser(Browser):
+    """Records the fetches of another browser in `Metrics`."""
+
+    def __init__(self, browser: Browser, metrics: Metrics, **config):
+        super().__init__(**config)
+        self.browser = browser
+        self.metrics = metrics
+
+    def browse(self, url, headers: Dict[str, str] = None) -> BrowserResponse:
+        with Timer() as timer:
+            response = self.browser.browse(url, headers=headers)
+
+        self.metrics.observe_response(response, timer.timing["wall"])
+
+        return response
+
+    def request_timeout(self, timeout: float = None):
+        return self.browser.request_timeout(timeout)
+
+    def close(self):
+        self.browser.close()
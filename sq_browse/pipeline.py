@@ -0,0 +1,445 @@
+"""The pipeline of processors which turns a browser response into the result, and the base class of processors.
+
+This module does not import lxml or the built-in processors in `sq_browse.postprocessing`, they are registered by
+their path and imported once a run needs them. Commands which do not process documents start faster that way.
+"""
+import abc
+import threading
+import time
+from logging import warning
+from typing import Callable, Dict, Iterable, List, Set
+
+from sq_browse.browser import Deadline
+from sq_browse.errors import DeadlineExceededError, ProcessorTimeoutError, UnprocessableError
+from sq_browse.instrumentation import Instrumentation, MemoryBudget
+from sq_browse.lazy import resolve
+from sq_browse.structs import BrowserResponse
+
+BUILTIN_PROCESSORS = {
+    "lxml": "sq_browse.postprocessing:LxmlProcessor",
+    "index": "sq_browse.postprocessing:IndexProcessor",
+    "text": "sq_browse.postprocessing:TextProcessor",
+    "metadata": "sq_browse.postprocessing:MetadataProcessor",
+    "links": "sq_browse.postprocessing:LinkProcessor",
+    "table": "sq_browse.postprocessing:TableProcessor",
+    "semantic_links": "sq_browse.postprocessing:SemanticLinkProcessor",
+}
+
+
+class BaseProcessor(abc.ABC):
+    dependencies = []
+    # intermediate data read by the processor, like `_tree` or `raw.content`; None if unknown, which keeps everything
+    consumes: List[str] | None = None
+    # bump when the output changes, so that results cached with the old version are not reused
+    version = 1
+    # whether the output depends on the url of the page, e.g. because links are resolved against it
+    depends_on_url = True
+    # optional processors are skipped once the deadline of the document is spent
+    optional = False
+    # seconds the processor may take per document, None for the time budget of the pipeline
+    time_budget: float | None = None
+
+    def __init__(self, **kwargs):
+        pass
+
+    def process(self, data: Dict) -> Dict:
+        return data
+
+    def cache_token(self) -> str:
+        """Identifies the processor, its version and its configuration in keys of the result cache."""
+        return f"{self.__class__.__module__}.{self.__class__.__qualname__}:{self.version}"
+
+
+class Pipeline(object):
+
+    def __init__(self):
+        self.components: Dict[str, BaseProcessor] = {}
+        self.dependencies: Dict[str, List[str]] = {}
+        # processor classes registered by their path as `module:Class`, imported once they are needed
+        self.lazy_components: Dict[str, str] = {}
+        # called as `hook(name, timing)` for every measured stage of every run
+        self.timing_hooks: List[Callable[[str, Dict], None]] = []
+        # defaults for the arguments of `run`
+        self.low_memory = False
+        self.memory_budget: int | None = None
+        self.deadline: float | None = None
+        # seconds every processor may take per document, unless it has a `time_budget` of its own
+        self.time_budget: float | None = None
+        # `sq_browse.result_cache.ResultCache` of the results of earlier runs
+        self.result_cache = None
+        # lazy components are resolved by the first runs, which may be concurrent
+        self._lock = threading.RLock()
+
+    def add_component(self, name: str, component: BaseProcessor):
+        with self._lock:
+            self.components[name] = component
+            self.dependencies[name] = component.dependencies
+            self.lazy_components.pop(name, None)
+
+    def configure(self, low_memory: bool = False, memory_budget: int = None, result_cache_size: int = 0,
+                  result_cache_dir: str = None, near_duplicates: bool = False, deadline: float = None,
+                  time_budget: float = None,
+                  components: Dict[str, Dict] = None, isolate: Iterable[str] = ()):
+        """Set the defaults of `run` and the attributes of components given as `{name: {attribute: value}}`.
+
+        The components named in `isolate` run in worker processes, see `sq_browse.isolation.IsolatedProcessor`.
+        Takes plain values only, so that the settings can be passed to worker processes.
+        """
+        self.low_memory = low_memory
+        self.memory_budget = memory_budget
+        self.deadline = deadline
+        self.time_budget = time_budget
+
+        if near_duplicates and not (result_cache_size or result_cache_dir):
+            raise ValueError("Near-duplicate detection requires the result cache")
+
+        if result_cache_size or result_cache_dir:
+            from sq_browse.result_cache import ResultCache
+
+            self.result_cache = ResultCache(max_entries=result_cache_size or 1024, cache_dir=result_cache_dir,
+                                            near_duplicates=near_duplicates)
+
+        for name, attributes in (components or {}).items():
+            self.resolve_component(name)
+
+            if name not in self.components:
+                raise ValueError(f"Unknown processor {name!r}")
+
+            for attribute, value in attributes.items():
+                setattr(self.components[name], attribute, value)
+
+        # after setting the attributes, which are copied into the worker processes
+        for name in isolate:
+            self.isolate_component(name)
+
+    def isolate_component(self, name: str):
+        from sq_browse.isolation import IsolatedProcessor
+
+        self.resolve_component(name)
+
+        if name not in self.components:
+            raise ValueError(f"Unknown processor {name!r}")
+
+        if not isinstance(self.components[name], IsolatedProcessor):
+            self.add_component(name, IsolatedProcessor(self.components[name]))
+
+    def add_lazy_component(self, name: str, path: str):
+        """Register the processor class at `path` without importing it until a run needs it."""
+        with self._lock:
+            self.lazy_components[name] = path
+
+    def resolve_component(self, name: str):
+        if (path := self.lazy_components.get(name)) is None:
+            return
+
+        # imported without holding the lock, as the module may register components while it is imported
+        component = resolve(path)()
+
+        with self._lock:
+            # importing the module or another thread may have resolved it already
+            if self.lazy_components.get(name) == path:
+                self.add_component(name, component)
+
+    def run(self, response: BrowserResponse, fail_save=True, only: Iterable[str] = None, timings=False,
+            low_memory: bool = None, memory_budget: int = None, deadline: float = None) -> Dict:
+        """Process the response with all components, or only with the components `only` and their dependencies.
+
+        With `timings`, the timings of the browser's stages and of every component are added as `timings` to the
+        meta data.
+
+        With `low_memory`, the content of the response is dropped from it, intermediate data is released as soon as
+        no later component consumes it, and processors may stream their intermediate data. A `memory_budget` in bytes
+        aborts processing with `MemoryBudgetExceededError` once a document uses more memory, regardless of
+        `fail_save`.
+
+        Once the `deadline` in seconds is spent, optional components are skipped and the next required one aborts
+        processing with `DeadlineExceededError`, regardless of `fail_save`. Every component may take its time budget,
+        which processors can check with the `Deadline` in `data.get("_deadline")`. Isolated components are killed when
+        they overrun it. Skipped components are recorded with the reason in `skipped_stages` in the meta data,
+        components in the same process which overran their budget with their duration in `over_budget`. Components
+        which failed with `fail_save` are recorded with the exception class in `failed_stages`.
+
+        With a `result_cache`, documents processed before by the same components are not processed again. If it looks
+        for near-duplicates, the simhash of the text of processed documents and possible near-duplicates are added to
+        the meta data.
+        """
+        low_memory = self.low_memory if low_memory is None else low_memory
+        memory_budget = self.memory_budget if memory_budget is None else memory_budget
+        document_deadline = Deadline(self.deadline if deadline is None else deadline) \
+            if (deadline or self.deadline) else None
+        # hooks observe every run, not only those returning timings
+        instrumentation = Instrumentation(enabled=timings or bool(self.timing_hooks), hooks=self.timing_hooks)
+        data = {
+            "meta": {
+                "elapsed": response.elapsed.total_seconds(),
+                "timestamp": response.timestamp_start,
+                "url": response.url,
+                "requested_url": response.requested_url,
+                **response.meta,
+            },
+            "raw": {
+                "headers": response.response_headers,
+                "content": response.content,
+                "encoding": response.encoding,
+                "status_code": response.status_code,
+                "reason": response.reason,
+            },
+            "content": {},
+            "_instrumentation": instrumentation,
+        }
+
+        if response.tree is not None:
+            data["_tree"] = response.tree
+
+        if instrumentation.enabled:
+            for name, timing in response.timings.items():
+                instrumentation.record(name, timing)
+
+        component_names = self.sorted_components(only)
+        cache_key = None
+
+        if self.result_cache is not None and response.tree is None and data["raw"]["content"]:
+            cache_key = self.cache_key(data["raw"]["content"], component_names, data["meta"]["url"], response.encoding)
+
+            if (cached := self.result_cache.get(cache_key)) is not None:
+                data["content"] = cached
+                component_names = []
+
+            data["meta"]["result_cache"] = "miss" if cached is None else "hit"
+
+        if low_memory:
+            data["_low_memory"] = True
+            # the caller's response would keep the content alive
+            response.content = None
+            response.tree = None
+
+        budget = None
+
+        if memory_budget:
+            budget = MemoryBudget(memory_budget)
+            budget.start(len(data["raw"]["content"] or ""))
+            budget.check("fetching")
+
+        consumed_later = self.consumed_later(component_names) if low_memory else None
+        failed: Dict[str, str] = {}
+        skipped: Dict[str, str] = {}
+        over_budget: Dict[str, float] = {}
+
+        for position, component_name in enumerate(component_names):
+            component = self.components[component_name]
+
+            if any(dependency in skipped for dependency in self.dependencies[component_name]):
+                skipped[component_name] = "dependency"
+                continue
+
+            if document_deadline is not None and document_deadline.expired():
+                if not component.optional:
+                    raise DeadlineExceededError(
+                        f"Deadline of {document_deadline.timeout}s exceeded before {component_name}"
+                    )
+
+                skipped[component_name] = "deadline"
+                continue
+
+            time_budget = self.time_budget if component.time_budget is None else component.time_budget
+            data["_deadline"] = self.stage_deadline(document_deadline, time_budget)
+
+            if data["_deadline"] is None:
+                del data["_deadline"]
+
+            started_at = time.monotonic()
+
+            try:
+                with instrumentation.measure(component_name):
+                    data = component.process(data)
+            except ProcessorTimeoutError as e:
+                skipped[component_name] = "timeout"
+
+                if not component.optional:
+                    failed[component_name] = e.__class__.__name__
+
+                    if not fail_save:
+                        raise UnprocessableError(str(e)) from e
+
+                    warning(f"Could not process data with {component.__class__.__name__}: {e!r}")
+            except Exception as e:
+                failed[component_name] = e.__class__.__name__
+
+                if fail_save:
+                    warning(f"Could not process data with {component.__class__.__name__}: {e!r}")
+                else:
+                    raise UnprocessableError(str(e)) from e
+
+            if time_budget is not None and component_name not in skipped and \
+                    (duration := time.monotonic() - started_at) > time_budget:
+                over_budget[component_name] = round(duration, 6)
+
+            if consumed_later is not None:
+                self._release_data(data, consumed_later[position])
+
+            if budget is not None:
+                budget.check(component_name)
+
+        if failed:
+            data["meta"]["failed_stages"] = failed
+
+        if skipped:
+            data["meta"]["skipped_stages"] = skipped
+
+        if over_budget:
+            data["meta"]["over_budget"] = over_budget
+
+        if cache_key is not None and data["meta"]["result_cache"] == "miss" and not failed and not skipped:
+            self.result_cache.put(cache_key, data["content"])
+
+        # cached results were compared when they were processed
+        if self.result_cache is not None and data["meta"].get("result_cache") != "hit" and \
+                isinstance(data["content"].get("text"), str):
+            data["meta"].update(self.result_cache.near_duplicate(data["meta"]["url"], data["content"]["text"]))
+
+        if timings:
+            data["meta"]["timings"] = instrumentation.timings
+
+        self._clean_data(data)
+
+        return data
+
+    def cache_tokens(self, component_names: List[str]) -> List[str]:
+        """Describe what the components compute, see `BaseProcessor.cache_token`."""
+        return [f"{name}={self.components[name].cache_token()}" for name in component_names]
+
+    def cache_key(self, content: bytes | str, component_names: List[str], url: str, encoding: str = None) -> str:
+        depends_on_url = any(self.components[name].depends_on_url for name in component_names)
+        # the same bytes in another encoding are another document
+        tokens = [*self.cache_tokens(component_names), f"encoding={encoding}"]
+
+        return self.result_cache.key(content, tokens, url if depends_on_url else None)
+
+    @staticmethod
+    def _clean_data(data: Dict):
+        """Remove all keys starting with _"""
+        for key in list(data.keys()):
+            if key.startswith("_"):
+                del data[key]
+
+        data["raw"].pop("content", None)
+
+    @staticmethod
+    def stage_deadline(document_deadline: Deadline | None, time_budget: float | None) -> Deadline | None:
+        """The deadline of a component: its time budget, cut short by the deadline of the document."""
+        if document_deadline is None:
+            return Deadline(time_budget) if time_budget is not None else None
+
+        remaining = document_deadline.remaining()
+
+        return Deadline(remaining if time_budget is None else min(remaining, time_budget))
+
+    def consumed_later(self, component_names: List[str]) -> List[Set[str] | None]:
+        """For every position, the intermediate data consumed by the components after it, None if unknown."""
+        result = []
+        consumed = set()
+
+        for component_name in reversed(component_names):
+            result.append(consumed)
+            component_consumes = self.components[component_name].consumes
+
+            if consumed is not None:
+                consumed = None if component_consumes is None else consumed | set(component_consumes)
+
+        return result[::-1]
+
+    @staticmethod
+    def _release_data(data: Dict, consumed: Set[str] | None):
+        """Drop the intermediate data which no later component consumes."""
+        if consumed is None:
+            return
+
+        for key in list(data.keys()):
+            if key.startswith("_") and key not in ("_instrumentation", "_low_memory", "_deadline") and \
+                    key not in consumed:
+                del data[key]
+
+        if "raw.content" not in consumed:
+            data["raw"].pop("content", None)
+
+    def iter_components(self, only: Iterable[str] = None):
+        """Iterate over all components in the correct order, such that all dependencies are met."""
+        for component_name in self.sorted_components(only):
+            yield self.components[component_name]
+
+    def required_components(self, names: Iterable[str]) -> Set[str]:
+        """Return the given components together with all their direct and indirect dependencies."""
+        required = set()
+        pending = list(names)
+
+        while pending:
+            name = pending.pop()
+
+            if name in required:
+                continue
+
+            self.resolve_component(name)
+
+            if name not in self.components:
+                raise ValueError(f"Unknown processor {name!r}")
+
+            required.add(name)
+            pending.extend(
+                dependency
+                for dependency in self.dependencies[name]
+                if dependency in self.components or dependency in self.lazy_components
+            )
+
+        return required
+
+    def sorted_components(self, only: Iterable[str] = None) -> List[str]:
+        """Sort components such that every component occurs after its dependencies.
+
+        Uses an implementation of Kahn's algorithm.
+        :param only: restrict the result to these components and their dependencies
+        :return:
+        """
+        if only is None:
+            for name in list(self.lazy_components):
+                self.resolve_component(name)
+        else:
+            required = self.required_components(only)
+
+        result = []
+
+        with self._lock:
+            deps = {
+                k: set(v)
+                for k, v
+                in self.dependencies.items()
+            }
+            without_edges = {
+                component
+                for component
+                in self.components.keys()
+                if len(deps[component]) == 0
+            }
+
+        while len(without_edges) > 0:
+            node = without_edges.pop()
+            result.append(node)
+
+            for other_node, other_dep in deps.items():
+                try:
+                    other_dep.remove(node)
+                except KeyError:
+                    continue
+
+                if len(other_dep) == 0:
+                    without_edges.add(other_node)
+
+        if only is not None:
+            result = [component for component in result if component in required]
+
+        return result
+
+
+pipeline = Pipeline()
+
+for name, path in BUILTIN_PROCESSORS.items():
+    pipeline.add_lazy_component(name, path)
@@ -1,22 +1,99 @@
-from importlib.metadata import entry_points
-from sq_browse import browser, postprocessing
+"""Discovery of browser and processor plugins registered as entry points.
 
+Scanning the metadata of all installed distributions is slow, so the discovered entry points are cached in the user's
+cache directory. The cache is keyed by the modification times of the directories on `sys.path`, which change
+whenever a distribution is installed or removed. Plugins are registered by their path and only imported once they
+are used. Set `SQ_BROWSE_NO_PLUGIN_CACHE` to always scan the installed distributions.
+"""
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Tuple
 
-def load_browser_plugins():
-    discovered_plugins = entry_points(group='sq_browse.browser')
+from sq_browse import browser
+from sq_browse.pipeline import pipeline
+from sq_browse.utils import atomic_write, cache_dir
 
-    for plugin in discovered_plugins:
-        browser.registry.register(plugin.name, plugin.load(), {})
+GROUPS = ("sq_browse.browser", "sq_browse.processor")
 
 
-def load_processor_plugins():
-    discovered_plugins = entry_points(group='sq_browse.processor')
+def cache_path() -> str:
+    return os.path.join(cache_dir(), "entry_points.json")
 
-    for plugin in discovered_plugins:
-        processor_cls = plugin.load()
-        postprocessing.pipeline.add_component(plugin.name, processor_cls())
+
+def environment_fingerprint() -> str:
+    """Fingerprint of the interpreter and the installed distributions."""
+    parts = [sys.executable, sys.version]
+
+    for path in sys.path:
+        try:
+            parts.append(f"{path}\t{os.stat(path or '.').st_mtime_ns}")
+        except OSError:
+            parts.append(path)
+
+    return hashlib.sha1("\n".join(parts).encode("utf-8", errors="surrogateescape")).hexdigest()
+
+
+def scan_entry_points() -> Dict[str, List[Tuple[str, str]]]:
+    from importlib.metadata import entry_points
+
+    return {group: [(ep.name, ep.value) for ep in entry_points(group=group)] for group in GROUPS}
+
+
+def read_cache(path: str, fingerprint: str) -> Dict[str, List[Tuple[str, str]]] | None:
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get("fingerprint") != fingerprint:
+        return None
+
+    return {group: [tuple(entry) for entry in cached["entry_points"].get(group, [])] for group in GROUPS}
+
+
+def write_cache(path: str, fingerprint: str, discovered: Dict[str, List[Tuple[str, str]]]):
+    # a failing cache must never break the command line
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps({"fingerprint": fingerprint, "entry_points": discovered}))
+    except OSError:
+        pass
+
+
+def discover_entry_points() -> Dict[str, List[Tuple[str, str]]]:
+    """Return the `(name, value)` pairs of the plugin entry points per group."""
+    if os.environ.get("SQ_BROWSE_NO_PLUGIN_CACHE"):
+        return scan_entry_points()
+
+    path = cache_path()
+    fingerprint = environment_fingerprint()
+    discovered = read_cache(path, fingerprint)
+
+    if discovered is None:
+        discovered = scan_entry_points()
+        write_cache(path, fingerprint, discovered)
+
+    return discovered
+
+
+def load_browser_plugins(discovered: Dict[str, List[Tuple[str, str]]] = None):
+    discovered = discovered or discover_entry_points()
+
+    for name, value in discovered["sq_browse.browser"]:
+        browser.registry.register(name, value, {})
+
+
+def load_processor_plugins(discovered: Dict[str, List[Tuple[str, str]]] = None):
+    discovered = discovered or discover_entry_points()
+
+    for name, value in discovered["sq_browse.processor"]:
+        pipeline.add_lazy_component(name, value)
 
 
 def load_all_plugins():
-    load_browser_plugins()
-    load_processor_plugins()
+    discovered = discover_entry_points()
+    load_browser_plugins(discovered)
+    load_processor_plugins(discovered)
@@ -1,16 +1,22 @@
-import abc
-from collections import deque
-from logging import warning
+import re
 from urllib.parse import urljoin
 from xml.etree.ElementTree import Element
 
 from lxml import html
-from typing import Dict, List, Type
+from typing import Dict, Iterable, Iterator, List
 
 from sq_browse import html_utils
-from sq_browse.errors import UnprocessableError
+from sq_browse.encoding import decode, detect_encoding, normalize_encoding, strip_bom
 from sq_browse.html_utils import get_text
-from sq_browse.structs import BrowserResponse
+# the pipeline is importable from here as well
+from sq_browse.pipeline import BUILTIN_PROCESSORS, BaseProcessor, Pipeline, pipeline
+
+__all__ = [
+    "BUILTIN_PROCESSORS", "BaseProcessor", "Pipeline", "pipeline",
+    "first_or_none", "xpath_extract", "LxmlProcessor", "INDEXED_TAGS", "build_index", "document_index",
+    "IndexProcessor", "TextProcessor", "MetadataProcessor", "iter_links", "LinkStream", "LinkProcessor",
+    "TableProcessor", "SemanticLinkProcessor",
+]
 
 
 def first_or_none(elems):
@@ -26,30 +32,97 @@ def xpath_extract(elem, path, clean=True):
     return result
 
 
-class BaseProcessor(abc.ABC):
-    dependencies = []
-
-    def __init__(self, **kwargs):
-        pass
+class LxmlProcessor(BaseProcessor):
+    consumes = ["raw.content", "_tree"]
+    depends_on_url = False
+    version = 2
+    FULL_DOCUMENT = re.compile(rb"\s*(?:<\?xml[^>]*>\s*)?<(?:html|!doctype)", re.IGNORECASE)
 
     def process(self, data: Dict) -> Dict:
+        data = super().process(data)
+
+        # the browser may already have parsed the document while downloading it
+        if data.get("_tree") is not None:
+            return data
+
+        content, base_url = data["raw"]["content"], data["meta"]["url"]
+
+        if isinstance(content, str):
+            # text with an encoding declaration can only be parsed as bytes
+            try:
+                data["_tree"] = html.fromstring(content, base_url=base_url)
+            except ValueError:
+                data["_tree"] = html.fromstring(content.encode("utf-8"), base_url=base_url)
+
+            return data
+
+        encoding = normalize_encoding(data["raw"].get("encoding")) or detect_encoding(content)
+        # the parser gets the encoding, a byte order mark would hide the start of the document
+        content = strip_bom(content)
+
+        parser = None
+
+        # `fromstring` can only tell documents from fragments in encodings compatible with ASCII
+        if "<".encode(encoding) == b"<":
+            try:
+                parser = html.HTMLParser(encoding=encoding)
+            except LookupError:
+                pass
+
+        if parser is None:
+            # a wide encoding, or one Python knows but libxml2 does not
+            content, parser = decode(content, encoding).encode("utf-8"), html.HTMLParser(encoding="utf-8")
+
+        # `fromstring` would take documents starting with an XML declaration for fragments
+        parse = html.document_fromstring if self.FULL_DOCUMENT.match(content) else html.fromstring
+        data["_tree"] = parse(content, base_url=base_url, parser=parser)
+
         return data
 
 
-class LxmlProcessor(BaseProcessor):
+INDEXED_TAGS = {"head", "meta", "title", "h1", "a", "table"}
+
+
+def build_index(tree: html.HtmlElement, tags=None) -> Dict[str, List[html.HtmlElement]]:
+    """Collect all elements with the given tags in a single pass, grouped by tag and in document order."""
+    index = {tag: [] for tag in tags or INDEXED_TAGS}
+
+    for elem in tree.iter(*index.keys()):
+        index[elem.tag].append(elem)
+
+    return index
+
+
+def document_index(data: Dict) -> Dict[str, List[html.HtmlElement]]:
+    """Return the index built by `IndexProcessor`, building it on the fly in pipelines without one."""
+    if "_index" not in data:
+        data["_index"] = build_index(data["_tree"])
+
+    return data["_index"]
+
+
+class IndexProcessor(BaseProcessor):
+    """Walks the tree once and stores elements by tag in `_index`, so processors need not scan the whole tree.
+
+    Plugins can extend `INDEXED_TAGS` before running the pipeline to have further tags indexed. Processors using the
+    index do not depend on this one, so that they work in pipelines without it; if one of them ran first, its index
+    is kept instead of walking the tree again.
+    """
+    dependencies = ["lxml"]
+    consumes = ["_tree", "_index"]
+    depends_on_url = False
 
     def process(self, data: Dict) -> Dict:
         data = super().process(data)
-        try:
-            data["_tree"] = html.fromstring(data["raw"]["content"], base_url=data["meta"]["url"])
-        except ValueError:
-            data["_tree"] = html.fromstring(data["raw"]["content"].encode("utf-8"), base_url=data["meta"]["url"])
+        document_index(data)
 
         return data
 
 
 class TextProcessor(BaseProcessor):
     dependencies = ["lxml"]
+    consumes = ["_tree"]
+    depends_on_url = False
 
     def process(self, data: Dict) -> Dict:
         data = super().process(data)
@@ -67,226 +140,208 @@ class TextProcessor(BaseProcessor):
 
 class MetadataProcessor(BaseProcessor):
     dependencies = ["lxml"]
+    consumes = ["_tree", "_index"]
+    depends_on_url = False
 
     def process(self, data: Dict) -> Dict:
-        tree = data["_tree"]
+        index = document_index(data)
         custom_metadata = {}
+        titles = [title.text for title in index["title"] if title.text]
+        named_meta = {}
+
+        for meta_elem in index["meta"]:
+            name = meta_elem.get("name")
+
+            if name in ["description", "keywords", "author"]:
+                if (content := meta_elem.get("content")) is not None:
+                    named_meta.setdefault(name, content.strip() if content else content)
+            elif name and next(meta_elem.iterancestors("head"), None) is not None:
+                custom_metadata[name] = meta_elem.get("content")
+
         metadata = {
-            "title": xpath_extract(tree, "//title/text()"),
-            "heading": get_text(tree.xpath("//h1")[0]) if len(tree.xpath("//h1")) else None,
-            "description": xpath_extract(tree, "//meta[@name='description']/@content"),
-            "keywords": xpath_extract(tree, "//meta[@name='keywords']/@content"),
-            "author": xpath_extract(tree, "//meta[@name='author']/@content"),
+            "title": titles[0].strip() if titles else None,
+            "heading": get_text(index["h1"][0]) if index["h1"] else None,
+            "description": named_meta.get("description"),
+            "keywords": named_meta.get("keywords"),
+            "author": named_meta.get("author"),
             "custom": custom_metadata,
         }
 
-        for meta_elem in tree.xpath("//head//meta"):
-            name = xpath_extract(meta_elem, "./@name", clean=False)
-            value = xpath_extract(meta_elem, "./@content", clean=False)
-
-            if name and name not in ["description", "keywords", "author"]:
-                custom_metadata[name] = value
-
         data["content"]["metadata"] = metadata
 
         return data
 
 
-class LinkProcessor(BaseProcessor):
-    dependencies = ["lxml"]
-
-    def process(self, data: Dict) -> Dict:
-        links = data["_tree"].xpath("//a")
-        link_list = [
-            {
-                "title": "".join(link.xpath(".//text()")).strip(),
-                "href": urljoin(data["meta"]["url"], link.attrib["href"]),
-            }
-            for link
-            in links
-            if "href" in link.attrib and not link.attrib["href"].startswith("#")
-        ]
-        data["_links"] = list(filter(lambda x: len(x["title"]), link_list))
-
-        return data
+def iter_links(links: Iterable[html.HtmlElement], base_url: str) -> Iterator[Dict[str, str]]:
+    for link in links:
+        href = link.attrib.get("href")
 
+        if href is None or href.startswith("#"):
+            continue
 
-class TableProcessor(BaseProcessor):
-    dependencies = ["lxml"]
+        if title := "".join(link.itertext()).strip():
+            yield {"title": title, "href": urljoin(base_url, href)}
 
-    def process(self, data: Dict) -> Dict:
-        result_data = []
-        tables = data["_tree"].xpath("//table")
 
-        for table in tables:
-            table_data = self.process_table_plain(table)
-            result_data.append(table_data)
+class LinkStream(object):
+    """Iterable over the links of a document, which extracts them anew on every iteration instead of storing them."""
 
-        data["content"]["tables"] = result_data
+    def __init__(self, links: List[html.HtmlElement], base_url: str):
+        self.links = links
+        self.base_url = base_url
 
-        return data
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter_links(self.links, self.base_url)
 
-    def process_table_plain(self, table: Element) -> Dict:
-        table_data = {
-            "rows": []
-        }
-        columns = self.column_names(table)
 
-        if head_data := self.parse_table_head(table):
-            table_data["head"] = head_data
+class LinkProcessor(BaseProcessor):
+    """Collects the titled links as `_links`. In low memory mode, `_links` is a `LinkStream` instead of a list."""
+    dependencies = ["lxml"]
+    consumes = ["_tree", "_index"]
 
-        for row in table.xpath(".//tr[not(ancestor::*[local-name()='tfoot' or local-name()='thead'])]"):
-            row_data = self.parse_row(row, columns=columns)
+    def process(self, data: Dict) -> Dict:
+        links = LinkStream(document_index(data)["a"], data["meta"]["url"])
+        data["_links"] = links if data.get("_low_memory") else list(links)
 
-            # ignore if this is the semantic header row
-            if columns and (isinstance(row_data, dict) and tuple(row_data.values()) == columns) or row_data == columns:
-                continue
+        return data
 
-            table_data["rows"].append(row_data)
 
-        if foot_data := self.parse_table_foot(table):
-            table_data["foot"] = foot_data
+class TableProcessor(BaseProcessor):
+    """Extracts every table of the document. Rows of nested tables belong to the nested table only.
 
-        return table_data
+    The rows and cells of a table are walked once. With `columnar`, the body rows are returned per column as
+    `columns`, which is much smaller to serialize. At most `max_rows` body rows are extracted per table, larger tables
+    are flagged as `truncated` and report their `total_rows`.
+    """
+    dependencies = ["lxml"]
+    consumes = ["_tree", "_index"]
+    depends_on_url = False
+    version = 2
+    SECTIONS = {"thead": "head", "tbody": "rows", "tfoot": "foot"}
+    CELLS = ("td", "th")
 
-    def column_names(self, table: Element) -> tuple | None:
-        # rows which have only th members (everything other than th/td is ignored though)
-        candidates = table.xpath(".//tr[not(descendant::*[local-name()='td' or local-name()='th']"
-                                 "[not(local-name()='th')])]")
+    def __init__(self, columnar: bool = False, max_rows: int = None, **kwargs):
+        super().__init__(**kwargs)
+        self.columnar = columnar
+        self.max_rows = max_rows
 
-        if len(candidates) == 1:
-            column_names = self.parse_row(candidates[0])
+    def cache_token(self) -> str:
+        return f"{super().cache_token()}:{self.columnar}:{self.max_rows}"
 
-            # make sure there are no duplicates
-            if len(column_names) == len(set(column_names)):
-                return column_names
+    def process(self, data: Dict) -> Dict:
+        data["content"]["tables"] = [self.process_table(table) for table in document_index(data)["table"]]
 
-    def parse_table_foot(self, table: Element) -> List[tuple] | None:
-        tfoot = table.find(".//tfoot")
-        row_data = []
+        return data
 
-        if tfoot is not None:
-            for row in tfoot.xpath(".//tr"):
-                row_data.append(self.parse_row(row))
+    def iter_rows(self, table: Element) -> Iterator[tuple]:
+        """Yield `(section, row)` for the rows of the table in document order, without entering nested tables."""
+        stack = [(iter(table), "rows")]
 
-            return row_data
+        while stack:
+            children, section = stack[-1]
 
-    def parse_table_head(self, table: Element) -> List[tuple] | None:
-        tfoot = table.find(".//thead")
-        row_data = []
+            if (child := next(children, None)) is None:
+                stack.pop()
+            elif not isinstance(child.tag, str) or child.tag == "table":
+                continue
+            elif child.tag == "tr":
+                yield section, child
+            else:
+                stack.append((iter(child), self.SECTIONS.get(child.tag, section)))
+
+    def process_table(self, table: Element) -> Dict:
+        sections = {"head": [], "rows": [], "foot": []}
+        # rows consisting of th cells only, if there is exactly one, it names the columns. Rows without cells count as
+        # well, as in the XPath based implementation: they prevent naming the columns or, alone, are dropped
+        candidates = []
+        # cells of the body rows past the limit, they are only compared with the row naming the columns
+        skipped = []
+        # one more row than the limit, because the row naming the columns is dropped from the body
+        limit = None if self.max_rows is None else self.max_rows + 1
+
+        for section, row in self.iter_rows(table):
+            cells = [cell for cell in row if cell.tag in self.CELLS]
+            header_like = all(cell.tag == "th" for cell in cells)
+
+            if section == "rows" and limit is not None and len(sections["rows"]) >= limit:
+                skipped.append(cells)
+
+                if header_like:
+                    candidates.append(tuple(get_text(cell) for cell in cells))
 
-        if tfoot is not None:
-            for row in tfoot.xpath(".//tr"):
-                row_data.append(self.parse_row(row))
+                continue
 
-            return row_data
+            row_data = tuple(get_text(cell) for cell in cells)
 
-            return row_data
+            if header_like:
+                candidates.append(row_data)
 
-    def parse_row(self, row: Element, columns: tuple = None) -> tuple|dict:
-        cells = row.xpath(".//*[local-name() = 'td' or local-name() = 'th']")
+            sections[section].append(row_data)
 
-        if columns and len(cells) == len(columns):
-            return {
-                column: get_text(cell)
-                for column, cell
-                in zip(columns, cells)
-            }
+        columns = None
 
-        return tuple([get_text(cell) for cell in cells])
+        if len(candidates) == 1 and len(set(candidates[0])) == len(candidates[0]):
+            header = candidates[0]
+            sections["rows"] = [row_data for row_data in sections["rows"] if row_data != header]
+            skipped = [
+                cells for cells in skipped
+                if len(cells) != len(header) or tuple(get_text(cell) for cell in cells) != header
+            ]
+            columns = header or None
 
+            # further rows equal to the row naming the columns may have taken the place of rows past the limit
+            if skipped and (missing := self.max_rows - len(sections["rows"])) > 0:
+                sections["rows"].extend(tuple(get_text(cell) for cell in cells) for cells in skipped[:missing])
+                skipped = skipped[missing:]
 
-class Pipeline(object):
+        rows = sections["rows"][:self.max_rows]
+        total_rows = len(sections["rows"]) + len(skipped)
+        table_data = self.columnar_rows(rows, columns) if self.columnar else {"rows": self.named_rows(rows, columns)}
 
-    def __init__(self):
-        self.components: Dict[str, BaseProcessor] = {}
-        self.dependencies: Dict[str, List[str]] = {}
+        if sections["head"]:
+            table_data["head"] = sections["head"]
 
-    def add_component(self, name: str, component: BaseProcessor):
-        self.components[name] = component
-        self.dependencies[name] = component.dependencies
+        if sections["foot"]:
+            table_data["foot"] = sections["foot"]
 
-    def run(self, response: BrowserResponse, fail_save=True) -> Dict:
-        data = {
-            "meta": {
-                "elapsed": response.elapsed.total_seconds(),
-                "timestamp": response.timestamp_start,
-                "url": response.url,
-                "requested_url": response.requested_url,
-            },
-            "raw": {
-                "headers": response.response_headers,
-                "content": response.content,
-                "status_code": response.status_code,
-                "reason": response.reason,
-            },
-            "content": {},
-        }
+        if total_rows > len(rows):
+            table_data.update(truncated=True, total_rows=total_rows)
 
-        for component in self.iter_components():
-            try:
-                data = component.process(data)
-            except Exception as e:
-                if fail_save:
-                    warning(f"Could not process data with {component.__class__.__name__}: {e!r}")
-                else:
-                    raise UnprocessableError(str(e))
+        return table_data
 
-        self._clean_data(data)
+    @staticmethod
+    def named_rows(rows: List[tuple], columns: tuple = None) -> List[tuple | dict]:
+        if not columns:
+            return rows
 
-        return data
+        return [dict(zip(columns, row_data)) if len(row_data) == len(columns) else row_data for row_data in rows]
 
     @staticmethod
-    def _clean_data(data: Dict):
-        """Remove all keys starting with _"""
-        for key in list(data.keys()):
-            if key.startswith("_"):
-                del data[key]
-
-        del data["raw"]["content"]
-
-    def iter_components(self):
-        """Iterate over all components in the correct order, such that all dependencies are met."""
-        for component_name in self.sorted_components():
-            yield self.components[component_name]
-
-    def sorted_components(self) -> List[str]:
-        """Sort components such that every component occurs after its dependencies.
-
-        Uses an implementation of Kahn's algorithm.
-        :return:
-        """
-        result = []
-        deps = {
-            k: set(v)
-            for k, v
-            in self.dependencies.items()
-        }
-        without_edges = {
-            component
-            for component
-            in self.components.keys()
-            if len(deps[component]) == 0
-        }
+    def columnar_rows(rows: List[tuple], columns: tuple = None) -> Dict:
+        """Values per column, rows which do not match the named columns are kept as `rows`."""
+        names = columns or tuple(str(i) for i in range(max(map(len, rows), default=0)))
+        values = {name: [] for name in names}
+        other_rows = []
+
+        for row_data in rows:
+            if columns and len(row_data) != len(columns):
+                other_rows.append(row_data)
+                continue
 
-        while len(without_edges) > 0:
-            node = without_edges.pop()
-            result.append(node)
+            for i, name in enumerate(names):
+                values[name].append(row_data[i] if i < len(row_data) else None)
 
-            for other_node, other_dep in deps.items():
-                try:
-                    other_dep.remove(node)
-                except KeyError:
-                    continue
+        table_data = {"columns": values}
 
-                if len(other_dep) == 0:
-                    without_edges.add(other_node)
+        if other_rows:
+            table_data["rows"] = other_rows
 
-        return result
+        return table_data
 
 
 class SemanticLinkProcessor(BaseProcessor):
     dependencies = ["links"]
+    consumes = ["_links"]
 
     def process(self, data: Dict) -> Dict:
         links = {}
@@ -313,10 +368,7 @@ class SemanticLinkProcessor(BaseProcessor):
             return "Contact"
 
 
-pipeline = Pipeline()
-pipeline.add_component("lxml", LxmlProcessor())
-pipeline.add_component("text", TextProcessor())
-pipeline.add_component("metadata", MetadataProcessor())
-pipeline.add_component("links", LinkProcessor())
-pipeline.add_component("table", TableProcessor())
-pipeline.add_component("semantic_links", SemanticLinkProcessor())
+# the pipeline registers the built-in processors lazily, they are resolved with this module unless plugins replaced them
+for name, path in BUILTIN_PROCESSORS.items():
+    if pipeline.lazy_components.get(name) == path:
+        pipeline.resolve_component(name)
@@ -0,0 +1,110 @@
+"""Version 2 of the run-subprocess line protocol.
+
+Every input line is a JSON request like `{"id": 1, "url": "example.com"}` with the optional keys `browser`,
+`timeout`, `only` and `timings`. Requests are processed concurrently and every reply is written as soon as it is
+ready, so replies arrive out of order and carry the `id` of their request:
+
+    {"id": 1, "result": {...}}
+    {"id": 2, "error": {"type": "OSError", "message": "..."}}
+
+At the end of the input, all pending requests are finished before returning. Once the replies cannot be written
+any more, because the reader is gone, no further requests are read and `serve` raises `BrokenPipeError`.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, IO
+
+from sq_browse.browser import Browser, ThreadLocalBrowsers
+from sq_browse.metrics import Metrics
+from sq_browse.postprocessing import pipeline
+from sq_browse.serializers import OutputWriter
+
+
+class SubprocessProtocol(object):
+
+    def __init__(self, browser_factory: Callable[..., Browser], writer: OutputWriter, default_browser: str,
+                 concurrency: int = 16, only=None, timings: bool = False, metrics: Metrics = None):
+        self.browser_factory = browser_factory
+        self.writer = writer
+        self.default_browser = default_browser
+        self.concurrency = concurrency
+        self.only = only
+        self.timings = timings
+        self.metrics = metrics
+        self._write_lock = threading.Lock()
+        self.browsers = ThreadLocalBrowsers(browser_factory)
+        # bounds the number of requests read ahead of the workers
+        self._slots = threading.BoundedSemaphore(2 * concurrency)
+        self._broken = threading.Event()
+
+    def get_browser(self, name: str) -> Browser:
+        return self.browsers.get(name)
+
+    def reply(self, reply: Dict):
+        try:
+            with self._write_lock:
+                self.writer.write(reply)
+        except BrokenPipeError:
+            # raising in a worker thread would go unnoticed, `serve` stops instead
+            self._broken.set()
+
+    @staticmethod
+    def error(e: Exception) -> Dict:
+        return {"type": e.__class__.__name__, "message": str(e).strip()}
+
+    def handle(self, request: Dict):
+        try:
+            browser = self.get_browser(request.get("browser") or self.default_browser)
+
+            # one browser per thread serves requests with any timeout
+            with browser.request_timeout(request.get("timeout")):
+                response = browser.browse(request["url"])
+            result = pipeline.run(
+                response,
+                fail_save=False,
+                only=request.get("only", self.only),
+                timings=request.get("timings", self.timings),
+            )
+            self.reply({"id": request.get("id"), "result": result})
+
+            if self.metrics is not None:
+                self.metrics.observe_result(result)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.observe_failure(e)
+
+            self.reply({"id": request.get("id"), "error": self.error(e)})
+        finally:
+            self._slots.release()
+
+    def serve(self, stream: IO[str]):
+        executor = ThreadPoolExecutor(self.concurrency)
+
+        try:
+            for line in stream:
+                if self._broken.is_set():
+                    break
+
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    self.reply({"id": None, "error": self.error(e)})
+                    continue
+
+                if not isinstance(request, dict) or not isinstance(request.get("url"), str):
+                    request_id = request.get("id") if isinstance(request, dict) else None
+                    self.reply({"id": request_id, "error": self.error(ValueError("Request without url"))})
+                    continue
+
+                self._slots.acquire()
+                executor.submit(self.handle, request)
+        finally:
+            # queued requests are dropped once nobody reads their replies
+            executor.shutdown(cancel_futures=self._broken.is_set())
+
+        if self._broken.is_set():
+            raise BrokenPipeError("The replies cannot be written any more")
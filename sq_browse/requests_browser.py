@@ -0,0 +1,239 @@
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import requests
+from lxml import etree, html
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
+
+from sq_browse.browser import Browser, Deadline
+from sq_browse.encoding import declared_encoding, header_charset, normalize_encoding
+from sq_browse.errors import ResponseTooLargeError
+from sq_browse.instrumentation import Timer
+from sq_browse.structs import BrowserResponse
+
+
+class RequestsBrowser(Browser):
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, timeout: float = 3, pool_connections: int = 10, pool_maxsize: int = 10,
+                 max_retries: int = 0, backoff_factor: float = 0, max_bytes: int = None, truncate: bool = True,
+                 stream_parse: bool = False, head_start: float = 0.25, **config):
+        super().__init__(**config)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.truncate = truncate
+        self.stream_parse = stream_parse
+        self.head_start = head_start
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.session = self.build_session()
+
+    def build_session(self) -> requests.Session:
+        """Build a long-lived session, which keeps connections alive and pools them per host.
+
+        `pool_connections` is the number of hosts to keep pools for, `pool_maxsize` the number of connections kept
+        per host.
+        """
+        session = requests.Session()
+        session.headers.update(self.HEADERS)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=Retry(
+                total=self.max_retries,
+                connect=self.max_retries,
+                read=self.max_retries,
+                status=0,
+                backoff_factor=self.backoff_factor,
+                raise_on_status=False,
+            ),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def connect(self, url: str, headers: Dict[str, str] = None) -> Tuple[requests.Response, Deadline]:
+        """Request the url and return once the headers arrived, together with the deadline of the request."""
+        deadline = Deadline(self.timeout)
+
+        return self.session.get(url, timeout=deadline.remaining(), stream=True, headers=headers), deadline
+
+    def race(self, candidates: List[str], headers: Dict[str, str] = None,
+             head_start: float = None) -> Tuple[str, requests.Response, Deadline]:
+        """Connect to the candidates and return the first response, preferring earlier candidates.
+
+        Every candidate gets a head start of `head_start` seconds before the next one is requested concurrently, or
+        is only followed by the next one on failure if `head_start` is None. Responses of the losers are closed.
+        """
+        if len(candidates) == 1:
+            return candidates[0], *self.connect(candidates[0], headers)
+
+        pending = list(candidates)
+        futures: Dict[Future, str] = {}
+        winner = None
+
+        try:
+            while winner is None and (pending or futures):
+                if pending:
+                    url = pending.pop(0)
+                    futures[self.start_connect(url, headers)] = url
+
+                done, _ = wait(futures, timeout=head_start if pending else None, return_when=FIRST_COMPLETED)
+
+                for future in sorted(done, key=lambda f: candidates.index(futures[f])):
+                    url = futures.pop(future)
+
+                    if future.exception() is None:
+                        winner = (url, *future.result())
+                        break
+
+                    if not isinstance(future.exception(), IOError):
+                        raise future.exception()
+        finally:
+            for future in futures:
+                future.add_done_callback(lambda f: f.exception() is None and f.result()[0].close())
+
+        if winner is None:
+            raise IOError(f"No valid URL found for {candidates[0]}")
+
+        return winner
+
+    def start_connect(self, url: str, headers: Dict[str, str] = None) -> Future:
+        # a thread per attempt, so that losers still waiting for their timeout never delay later races
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.connect(url, headers))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+
+        return future
+
+    def iter_content(self, response: requests.Response, deadline: Deadline, meta: Dict) -> Iterator[bytes]:
+        """Yield the response body in chunks, giving up once the deadline has passed.
+
+        The socket timeout only bounds single reads, so the deadline is checked between chunks as well. `read1`
+        returns whatever is available instead of waiting for a full chunk, which keeps slow responses checkable.
+
+        If the body exceeds `max_bytes`, it is either truncated, which is flagged as `truncated` in `meta`, or
+        `ResponseTooLargeError` is raised. Errors while reading the body are raised as `requests.ConnectionError`,
+        like errors before the body. The bytes received, before decompression, are recorded as `received_bytes`.
+        """
+        raw_read = getattr(response.raw, "read1", response.raw.read)
+        received = 0
+
+        def read(size: int, **kwargs) -> bytes:
+            try:
+                return raw_read(size, **kwargs)
+            except urllib3.exceptions.HTTPError as e:
+                raise requests.ConnectionError(e, response=response) from e
+
+        with response:
+            # also counts bodies given up on or passed to the parser
+            meta["received_bytes"] = 0
+            declared_length = int(response.headers.get("content-length") or 0)
+
+            if self.max_bytes is not None and not self.truncate and declared_length > self.max_bytes:
+                raise ResponseTooLargeError(f"Response of {declared_length} bytes exceeds {self.max_bytes} bytes")
+
+            while chunk := read(self.CHUNK_SIZE, decode_content=True):
+                deadline.check()
+
+                if self.max_bytes is not None and received + len(chunk) > self.max_bytes:
+                    if not self.truncate:
+                        raise ResponseTooLargeError(f"Response exceeds {self.max_bytes} bytes")
+
+                    meta["truncated"] = True
+                    meta["received_bytes"] = response.raw.tell()
+                    yield chunk[:self.max_bytes - received]
+                    return
+
+                received += len(chunk)
+                meta["received_bytes"] = response.raw.tell()
+                yield chunk
+
+    def parse_content(self, response: requests.Response, chunks: Iterable[bytes]) -> html.HtmlElement | None:
+        """Feed the chunks into lxml while they arrive, so that downloading and parsing overlap."""
+        try:
+            parser = html.HTMLParser(encoding=normalize_encoding(header_charset(response.headers)))
+        except LookupError:
+            # an encoding Python knows but libxml2 does not, libxml2 detects the encoding itself then
+            parser = html.HTMLParser()
+
+        for chunk in chunks:
+            parser.feed(chunk)
+
+        try:
+            tree = parser.close()
+        except etree.LxmlError:
+            return None
+
+        tree.getroottree().docinfo.URL = response.url
+
+        return tree
+
+    def browse(self, ambiguous_url: str, headers: Dict[str, str] = None) -> BrowserResponse:
+        start = datetime.now()
+
+        all_candidates = list(self.possible_urls(ambiguous_url))
+        candidates = list(all_candidates)
+
+        with Timer() as fetch_timer:
+            while True:
+                meta = {}
+                body, tree = b"", None
+
+                try:
+                    url, r, deadline = self.race(candidates, headers, self.race_head_start(candidates, self.head_start))
+                except IOError:
+                    raise IOError(f"No valid URL found for {ambiguous_url}")
+
+                try:
+                    chunks = self.iter_content(r, deadline, meta)
+
+                    if self.stream_parse:
+                        tree = self.parse_content(r, chunks)
+                    else:
+                        body = b"".join(chunks)
+
+                    break
+                except IOError:
+                    # the body failed, the remaining candidates may still work
+                    candidates = [candidate for candidate in candidates if candidate != url]
+
+                    if not candidates:
+                        raise IOError(f"No valid URL found for {ambiguous_url}")
+
+        self.remember_scheme(all_candidates, url)
+
+        return BrowserResponse(
+            url=r.url,
+            requested_url=url,
+            status_code=r.status_code,
+            reason=r.reason,
+            response_headers={
+                k.lower(): v
+                for k, v
+                in r.headers.items()
+            },
+            content=body,
+            timestamp_start=start,
+            elapsed=r.elapsed,
+            meta=meta,
+            tree=tree,
+            timings={"fetch": fetch_timer.timing},
+            encoding=declared_encoding(r.headers, body),
+        )
@@ -0,0 +1,194 @@
+"""Cache of pipeline results keyed by the hash of the document, so identical pages are only processed once.
+
+The key covers the content, the components that run and their versions. Components which resolve urls, like
+`LinkProcessor`, make the key depend on the url of the page as well, so identical pages at different urls only share
+results if none of those components run.
+
+Near-duplicates are optionally found by the simhash of the extracted text: pages whose simhashes differ in at most
+`max_distance` bits are reported as near-duplicates of the earlier page.
+"""
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, Tuple
+
+from sq_browse.utils import atomic_write
+
+WORD = re.compile(r"\w+")
+# maps every byte to its bit at the position
+BIT_TABLES = [bytes(byte >> bit & 1 for byte in range(256)) for bit in range(8)]
+
+
+def simhash(text: str, shingle_size: int = 3, max_shingles: int = 2048) -> int:
+    """64 bit simhash over the word shingles of the text.
+
+    Long texts are sampled to about `max_shingles` shingles: those starting with a word whose CRC is below a
+    threshold, at most `max_shingles` of them with the smallest CRCs. Small edits of the text hardly change the sample.
+    """
+    words = WORD.findall(text.lower())
+
+    if len(words) > max_shingles:
+        crcs = {word: zlib.crc32(word.encode("utf-8")) for word in set(words)}
+        threshold = (1 << 32) * max_shingles // len(words)
+        starts = [position for position, word in enumerate(words) if crcs[word] < threshold]
+        shingles = {" ".join(words[position:position + shingle_size]) for position in starts}
+    else:
+        shingles = set(map(" ".join, zip(*(words[i:] for i in range(shingle_size))))) or {" ".join(words)}
+
+    # frequent words can exceed the sample size
+    if len(shingles) > max_shingles:
+        by_crc = {zlib.crc32(shingle.encode("utf-8")): shingle for shingle in shingles}
+        shingles = [by_crc[crc] for crc in heapq.nsmallest(max_shingles, by_crc)]
+
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    value = 0
+
+    # a bit is set if it is set in the hashes of the majority of the shingles, counted per byte of the little endian
+    # hashes without a loop over the shingles
+    for position in range(8):
+        column = digests[position::8]
+
+        for bit, table in enumerate(BIT_TABLES):
+            if 2 * column.translate(table).count(1) > len(column):
+                value |= 1 << (8 * position + bit)
+
+    return value
+
+
+class SimhashIndex(object):
+    """Finds earlier simhashes within `max_distance` bits among the last `max_entries` added ones.
+
+    The 64 bits are split into `max_distance + 1` bands. Two hashes within the distance agree on at least one band, so
+    only hashes sharing a band with the query are compared.
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_distance: int = 3):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.band_bits = 64 // (max_distance + 1)
+        self.bands = {}
+        self.entries = deque()
+
+    def _bands(self, value: int) -> Iterable[Tuple[int, int]]:
+        mask = (1 << self.band_bits) - 1
+
+        return ((band, value >> (band * self.band_bits) & mask) for band in range(self.max_distance + 1))
+
+    def find(self, value: int, exclude: str = None) -> Tuple[str, int] | None:
+        """Return the url and distance of the closest earlier near-duplicate."""
+        best = None
+
+        for band in self._bands(value):
+            for other_value, url in self.bands.get(band, ()):
+                distance = (value ^ other_value).bit_count()
+
+                if url != exclude and distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (url, distance)
+
+        return best
+
+    def add(self, value: int, url: str):
+        if len(self.entries) >= self.max_entries:
+            old_value, old_url = self.entries.popleft()
+
+            for band in self._bands(old_value):
+                self.bands[band].remove((old_value, old_url))
+
+                if not self.bands[band]:
+                    del self.bands[band]
+
+        self.entries.append((value, url))
+
+        for band in self._bands(value):
+            self.bands.setdefault(band, []).append((value, url))
+
+
+class ResultCache(object):
+    """Stores the `content` section of pipeline results by key in memory and optionally in `cache_dir`.
+
+    The memory tier keeps the `max_entries` most recently used results. Results are stored as JSON, so cached tuples
+    are returned as lists.
+    """
+
+    def __init__(self, max_entries: int = 1024, cache_dir: str = None, near_duplicates: bool = False):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.simhashes = SimhashIndex() if near_duplicates else None
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(content: bytes | str, tokens: Iterable[str], url: str = None) -> str:
+        """Key of a document processed by the components described by `tokens`, see `BaseProcessor.cache_token`."""
+        digest = hashlib.sha256()
+        digest.update(content if isinstance(content, bytes) else content.encode("utf-8", errors="surrogatepass"))
+
+        for token in [*tokens, url or ""]:
+            digest.update(b"\0" + token.encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Dict | None:
+        with self._lock:
+            if (entry := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None and self.cache_dir:
+            try:
+                with open(self._path(key), "rb") as f:
+                    entry = f.read()
+            except OSError:
+                return None
+
+            self._remember(key, entry)
+
+        return None if entry is None else json.loads(entry)
+
+    def put(self, key: str, content: Dict):
+        entry = json.dumps(content).encode("utf-8")
+        self._remember(key, entry)
+
+        if self.cache_dir:
+            path = self._path(key)
+
+            # a failing disk tier only costs the reprocessing
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                atomic_write(path, entry)
+            except OSError:
+                pass
+
+    def _remember(self, key: str, entry: bytes):
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def near_duplicate(self, url: str, text: str) -> Dict:
+        """Return the simhash of the text and, if there is one, the closest earlier page with a similar text."""
+        if self.simhashes is None:
+            return {}
+
+        value = simhash(text)
+        result = {"simhash": f"{value:016x}"}
+
+        with self._lock:
+            if (found := self.simhashes.find(value, exclude=url)) is not None:
+                result["near_duplicate"] = {"url": found[0], "distance": found[1]}
+
+            self.simhashes.add(value, url)
+
+        return result
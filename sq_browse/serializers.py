@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from datetime import date, datetime
+from typing import BinaryIO, Dict
+
+
+class Serializer(object):
+    """Turns pipeline results into bytes. Records of a stream are separated by `separator`."""
+    separator = b""
+
+    def dumps(self, data: Dict) -> bytes:
+        raise NotImplementedError
+
+
+class DateTimeEncoder(json.JSONEncoder):
+
+    def default(self, o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+
+        return super().default(o)
+
+
+class StdlibJsonSerializer(Serializer):
+    separator = b"\n"
+
+    def __init__(self):
+        self.encoder = DateTimeEncoder()
+
+    def dumps(self, data: Dict) -> bytes:
+        return self.encoder.encode(data).encode("utf-8")
+
+
+class JsonSerializer(StdlibJsonSerializer):
+    """JSON serializer using orjson if it is installed, which handles datetimes natively."""
+
+    def __init__(self):
+        super().__init__()
+
+        try:
+            import orjson
+        except ImportError:
+            self.orjson = None
+        else:
+            self.orjson = orjson
+
+    def dumps(self, data: Dict) -> bytes:
+        if self.orjson is None:
+            return super().dumps(data)
+
+        return self.orjson.dumps(data, option=self.orjson.OPT_NON_STR_KEYS)
+
+
+class MessagePackSerializer(Serializer):
+    """Compact binary serializer, requires msgpack. Records are self-delimiting, so no separator is needed."""
+
+    def __init__(self):
+        import msgpack
+
+        self.packer = msgpack.Packer(default=self.default)
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, (datetime, date)):
+            return obj.isoformat()
+
+        raise TypeError(f"Object of type {obj.__class__.__name__} is not serializable")
+
+    def dumps(self, data: Dict) -> bytes:
+        return self.packer.pack(data)
+
+
+class SerializerRegistry(object):
+
+    def __init__(self):
+        self.serializers = {}
+
+    def register(self, name: str, serializer_cls):
+        self.serializers[name] = serializer_cls
+
+    def get_serializer(self, name: str) -> Serializer:
+        return self.serializers[name]()
+
+
+class OutputWriter(object):
+    """Writes serialized records to a binary stream in batches.
+
+    The buffer is flushed once it holds `buffer_size` bytes, and at the latest `flush_interval` seconds after a
+    record was buffered, from a timer thread if no further record is written meanwhile. An error of a flush by the
+    timer is raised by the next `write` or `flush`. A `buffer_size` of 0 flushes after every record, which
+    interactive consumers need.
+    """
+
+    def __init__(self, stream: BinaryIO, serializer: Serializer, buffer_size: int = 64 * 1024,
+                 flush_interval: float = 1.0):
+        self.stream = stream
+        self.serializer = serializer
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._error = None
+
+    def write(self, data: Dict):
+        record = self.serializer.dumps(data) + self.serializer.separator
+
+        with self._lock:
+            self._raise_error()
+            self._buffer.append(record)
+            self._buffered += len(record)
+
+            if self._buffered >= self.buffer_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+            elif self._timer is None:
+                # the next record may take long, e.g. when crawling with a rate limit
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._raise_error()
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._buffer:
+            self.stream.write(b"".join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+
+        self.stream.flush()
+        self._last_flush = time.monotonic()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+
+            try:
+                self._flush()
+            except Exception as e:
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+serializers = SerializerRegistry()
+serializers.register("json", JsonSerializer)
+serializers.register("json-stdlib", StdlibJsonSerializer)
+serializers.register("msgpack", MessagePackSerializer)
@@ -0,0 +1,248 @@
+"""Long-running server with a pool of pre-forked worker processes.
+
+The parent process binds the socket, loads the plugins and forks the workers, which all accept connections on the
+shared socket. A worker exits after `max_jobs` jobs and is replaced by a fresh one, which bounds memory creep.
+Workers failing right after their start are replaced with an exponential backoff, and the server gives up after
+`max_failures` such failures in a row.
+Requires a platform with `os.fork`.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, List, Tuple
+
+from sq_browse.browser import Browser, ThreadLocalBrowsers
+from sq_browse.errors import WorkersFailingError
+from sq_browse.postprocessing import pipeline
+from sq_browse.serializers import serializers
+
+
+class BrowseRequestHandler(BaseHTTPRequestHandler):
+    """Handles `POST /browse` with `{"url": ...}` and `POST /batch` with `{"urls": [...]}`.
+
+    Both accept the pipeline options `only` and `timings`. A batch answers with one `{"url", "result"}` or
+    `{"url", "error"}` object per url, in input order. A worker serves one connection at a time, so every
+    connection is closed after its response, instead of waiting for further requests of an idle client.
+    """
+    protocol_version = "HTTP/1.1"
+    # slow clients must not block a worker forever
+    timeout = 30
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self.send_json(404, {"error": {"type": "NotFound", "message": self.path}})
+
+        self.send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        except ValueError as e:
+            return self.send_json(400, {"error": self.server.error(e)})
+
+        if not isinstance(request, dict):
+            return self.send_json(400, {"error": self.server.error(ValueError("Request is not an object"))})
+
+        if self.path == "/browse" and isinstance(request.get("url"), str):
+            status, result = self.server.browse(request)
+        elif self.path == "/batch" and isinstance(request.get("urls"), list):
+            status, result = 200, self.server.browse_batch(request)
+        else:
+            return self.send_json(404, {"error": {"type": "NotFound", "message": self.path}})
+
+        self.server.jobs += 1
+        self.send_json(status, result)
+
+    def send_json(self, status: int, data):
+        body = self.server.serializer.dumps(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Worker-Pid", str(os.getpid()))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkerHTTPServer(HTTPServer):
+    """HTTP server of a single worker, serving connections from an already bound and listening socket."""
+    timeout = 1
+
+    def __init__(self, sock: socket.socket, browser_factory: Callable[[], Browser], max_jobs: int = 0,
+                 fetchers: int = 8, only: List[str] = None, timings: bool = False):
+        super().__init__(sock.getsockname(), BrowseRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        # all workers are woken by a new connection, those losing the race must not block in `accept`
+        sock.setblocking(False)
+        self.socket = sock
+        self.browser_factory = browser_factory
+        self.max_jobs = max_jobs
+        self.fetchers = fetchers
+        self.only = only
+        self.timings = timings
+        self.serializer = serializers.get_serializer("json")
+        self.jobs = 0
+        self.stopping = False
+        self.browsers = ThreadLocalBrowsers(browser_factory)
+
+    def server_close(self):
+        # the socket is shared with the parent and the other workers
+        pass
+
+    def exhausted(self) -> bool:
+        return self.stopping or (self.max_jobs and self.jobs >= self.max_jobs)
+
+    def get_browser(self) -> Browser:
+        return self.browsers.get()
+
+    @staticmethod
+    def error(e: Exception) -> Dict:
+        return {"type": e.__class__.__name__, "message": str(e).strip()}
+
+    def run_pipeline(self, url: str, request: Dict) -> Dict:
+        response = self.get_browser().browse(url)
+
+        return pipeline.run(
+            response,
+            fail_save=False,
+            only=request.get("only", self.only),
+            timings=request.get("timings", self.timings),
+        )
+
+    def browse(self, request: Dict) -> Tuple[int, Dict]:
+        try:
+            return 200, self.run_pipeline(request["url"], request)
+        except Exception as e:
+            return 502, {"error": self.error(e)}
+
+    def browse_batch(self, request: Dict) -> List[Dict]:
+        def browse_one(url):
+            try:
+                return {"url": url, "result": self.run_pipeline(url, request)}
+            except Exception as e:
+                return {"url": url, "error": self.error(e)}
+
+        with ThreadPoolExecutor(self.fetchers) as executor:
+            return list(executor.map(browse_one, request["urls"]))
+
+    def serve_until_exhausted(self):
+        while not self.exhausted():
+            self.handle_request()
+
+
+class PreforkServer(object):
+    """Starts `workers` worker processes on a shared socket and replaces every worker that exits."""
+    # a worker failing within this many seconds counts as failing at startup
+    MIN_UPTIME = 1.0
+    RESPAWN_BACKOFF = 0.1
+    MAX_RESPAWN_BACKOFF = 10.0
+
+    def __init__(self, sock: socket.socket, workers: int = 4, max_failures: int = 10, **worker_config):
+        self.socket = sock
+        self.workers = workers
+        self.max_failures = max_failures
+        self.worker_config = worker_config
+        # start times by pid
+        self.children: Dict[int, float] = {}
+        self.failures = 0
+
+    @staticmethod
+    def bind(host: str = "127.0.0.1", port: int = 8080, unix_socket: str = None) -> socket.socket:
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(unix_socket)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+
+        sock.listen(128)
+
+        return sock
+
+    def spawn(self):
+        pid = os.fork()
+
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+
+        exit_code = 0
+
+        try:
+            server = WorkerHTTPServer(self.socket, **self.worker_config)
+
+            def stop(signum, frame):
+                server.stopping = True
+
+            signal.signal(signal.SIGTERM, stop)
+            # Ctrl+C reaches all processes of the group, the parent stops the workers
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            server.serve_until_exhausted()
+        except BaseException as e:
+            sys.stderr.write(f"Worker {os.getpid()} failed: {e.__class__.__name__}: {e}\n")
+            exit_code = 1
+        finally:
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def serve_forever(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+
+            while True:
+                pid, status = os.wait()
+                self.respawn_delay(pid, status)
+                self.spawn()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self.stop()
+
+    def respawn_delay(self, pid: int, status: int):
+        """Wait before replacing a worker which failed at startup, raise if workers keep failing."""
+        started = self.children.pop(pid, None)
+
+        if status == 0 or started is None or time.monotonic() - started >= self.MIN_UPTIME:
+            self.failures = 0
+            return
+
+        self.failures += 1
+
+        if self.failures >= self.max_failures:
+            raise WorkersFailingError(f"Workers failed at startup {self.failures} times in a row, giving up")
+
+        time.sleep(min(self.RESPAWN_BACKOFF * 2 ** (self.failures - 1), self.MAX_RESPAWN_BACKOFF))
+
+    def stop(self):
+        for pid in self.children:
+            with suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+        for pid in self.children:
+            with suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+
+        self.children.clear()
+
+        if self.socket.family == socket.AF_UNIX:
+            with suppress(OSError):
+                os.remove(self.socket.getsockname())
+
+        self.socket.close()
@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field
-from typing import Dict
+from typing import Any, Dict
+
+from sq_browse.encoding import decode
 
 
 @dataclass
@@ -10,6 +12,18 @@ class BrowserResponse(object):
     status_code: int
     reason: str
     response_headers: Dict[str, str]
-    content: str
+    # the body as received, or the text for browsers which only provide it decoded
+    content: bytes | str
     timestamp_start: datetime
     elapsed: timedelta
+    meta: Dict = field(default_factory=dict)
+    # set instead of content, if the browser parsed the document while downloading it
+    tree: Any = None
+    # wall time, CPU time and peak allocation of the browser's stages, see `sq_browse.instrumentation.Timer`
+    timings: Dict[str, Dict] = field(default_factory=dict)
+    # declared encoding of a bytes content, None if the document declares none
+    encoding: str = None
+
+    def text(self) -> str:
+        """The content decoded to text."""
+        return decode(self.content, self.encoding) if isinstance(self.content, bytes) else self.content
@@ -0,0 +1,141 @@
+import base64
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+from sq_browse.archive_browser import ArchiveBrowser, WarcArchive
+from sq_browse.browser import registry
+
+
+def warc_record(url: str, date: str, http: bytes, record_type: str = "response", *fields: str) -> bytes:
+    return (
+        f"WARC/1.1\r\nWARC-Type: {record_type}\r\nWARC-Target-URI: {url}\r\nWARC-Date: {date}\r\n"
+        + "".join(f"{field}\r\n" for field in fields) +
+        f"Content-Type: application/http; msgtype=response\r\nContent-Length: {len(http)}\r\n\r\n"
+    ).encode("utf-8") + http + b"\r\n\r\n"
+
+
+def http_response(body: bytes, *headers: str, status: str = "200 OK") -> bytes:
+    return "\r\n".join([f"HTTP/1.1 {status}", *headers, "", ""]).encode("latin-1") + body
+
+
+class TestArchiveBrowser(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.tmp_dir.name, "cache")})
+        self.env.start()
+        chunked = b"5\r\n<p>Gr\r\n9\r\n\xc3\xbc\xc3\x9fe</p>\r\n0\r\n\r\n"
+        self.records = [
+            warc_record("http://example.com/", "2024-01-01T00:00:00Z", http_response(b"<p>old</p>")),
+            warc_record("http://example.com/", "2024-02-01T00:00:00Z", http_response(
+                gzip.compress(b"<p>new</p>"), "Content-Type: text/html; charset=utf-8", "Content-Encoding: gzip",
+            )),
+            warc_record("http://example.com/chunked", "2024-01-01T00:00:00Z", http_response(
+                chunked, "Content-Type: text/html; charset=utf-8", "Transfer-Encoding: chunked",
+            )),
+            warc_record("http://example.com/moved", "2024-01-01T00:00:00Z", http_response(
+                b"", "Location: /chunked", status="301 Moved Permanently",
+            )),
+            warc_record("http://example.com/ignored", "2024-01-01T00:00:00Z", b"GET / HTTP/1.1\r\n\r\n", "request"),
+        ]
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmp_dir.name, name)
+
+        with open(path, "wb") as f:
+            f.write(data)
+
+        return path
+
+    def assert_archive(self, path: str):
+        browser = registry.get_browser("archive", archives=[path])
+
+        response = browser.browse("example.com")
+        self.assertEqual(b"<p>new</p>", response.content)
+        self.assertEqual("utf-8", response.encoding)
+        self.assertEqual("http://example.com", response.requested_url)
+
+        response = browser.browse("http://example.com/moved")
+        self.assertEqual("http://example.com/chunked", response.url)
+        self.assertEqual("<p>Grüße</p>", response.text())
+
+        with self.assertRaises(IOError):
+            browser.browse("http://example.com/ignored")
+
+    def test_warc(self):
+        self.assert_archive(self.write("plain.warc", b"".join(self.records)))
+
+    def test_compressed_warc(self):
+        self.assert_archive(self.write("compressed.warc.gz", b"".join(gzip.compress(r) for r in self.records)))
+
+    def test_cached_index(self):
+        path = self.write("cached.warc", b"".join(self.records))
+        records = WarcArchive(path).records
+
+        with patch.object(WarcArchive, "scan", side_effect=AssertionError("scanned again")):
+            self.assertEqual(json.loads(json.dumps(records)), WarcArchive(path).records)
+
+    def test_revisits(self):
+        digest = "WARC-Payload-Digest: sha1:ORIGINAL"
+        records = [
+            warc_record("http://example.com/a", "2024-01-01T00:00:00Z", http_response(
+                gzip.compress(b"<p>a</p>"), "Content-Encoding: gzip",
+            ), "response", digest),
+            warc_record("http://example.com/b", "2024-02-01T00:00:00Z", http_response(
+                b"", "Content-Type: text/html; charset=utf-8", "Content-Encoding: gzip",
+            ), "revisit", digest),
+            warc_record("http://example.com/a", "2024-03-01T00:00:00Z", http_response(
+                b"", status="304 Not Modified",
+            ), "revisit", "WARC-Refers-To-Target-URI: http://example.com/a"),
+            warc_record("http://example.com/lost", "2024-01-01T00:00:00Z", http_response(b""), "revisit",
+                        "WARC-Payload-Digest: sha1:ELSEWHERE"),
+        ]
+        browser = ArchiveBrowser(archives=[self.write("revisits.warc", b"".join(records))])
+
+        response = browser.browse("http://example.com/b")
+        self.assertEqual((200, b"<p>a</p>", "utf-8"), (response.status_code, response.content, response.encoding))
+        self.assertEqual("http://example.com/b", response.url)
+
+        response = browser.browse("http://example.com/a")
+        self.assertEqual((200, b"<p>a</p>"), (response.status_code, response.content))
+        self.assertEqual(datetime(2024, 3, 1), response.timestamp_start)
+
+        with self.assertRaises(IOError):
+            browser.browse("http://example.com/lost")
+
+    def test_har(self):
+        entries = [
+            {
+                "startedDateTime": "2024-01-01T00:00:00.000Z",
+                "time": 120,
+                "request": {"url": "https://example.com/"},
+                "response": {
+                    "status": 200,
+                    "statusText": "OK",
+                    "headers": [{"name": "Content-Type", "value": "text/html; charset=iso-8859-1"}],
+                    "content": {"text": "<p>Grüße</p>"},
+                },
+            },
+            {
+                "startedDateTime": "2024-01-01T00:00:01.000Z",
+                "request": {"url": "https://example.com/binary"},
+                "response": {"status": 200, "content": {"text": base64.b64encode(b"<p>x</p>").decode(),
+                                                        "encoding": "base64"}},
+            },
+        ]
+        path = self.write("archive.har", json.dumps({"log": {"entries": entries}}).encode("utf-8"))
+        browser = ArchiveBrowser(archives=[path])
+
+        response = browser.browse("https://example.com")
+        self.assertEqual("<p>Grüße</p>", response.text())
+        self.assertEqual(0.12, response.elapsed.total_seconds())
+        self.assertEqual(b"<p>x</p>", browser.browse("https://example.com/binary").content)
@@ -0,0 +1,81 @@
+import asyncio
+from unittest import TestCase, IsolatedAsyncioTestCase
+
+from sq_browse.browser import AiohttpBrowser, AsyncBrowser, registry
+from sq_browse.structs import BrowserResponse
+from sq_browse.tests.utils import StandInHandler, StandInServerMixin
+
+
+class TestAiohttpBrowser(StandInServerMixin, IsolatedAsyncioTestCase):
+
+    async def test_abrowse(self):
+        browser = AiohttpBrowser()
+
+        try:
+            response = await browser.abrowse(f"{self.base_url}/page")
+        finally:
+            await browser.aclose()
+
+        self.assertIsInstance(response, BrowserResponse)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(f"{self.base_url}/page", response.url)
+        self.assertIn(b"<p>/page</p>", response.content)
+        self.assertEqual("text/html; charset=utf-8", response.response_headers["content-type"])
+
+    async def test_per_host_limit(self):
+        browser = AiohttpBrowser(max_per_host=3)
+        urls = [f"{self.base_url}/{i}" for i in range(12)]
+
+        try:
+            results = [result async for result in browser.abrowse_many(urls)]
+        finally:
+            await browser.aclose()
+
+        self.assertEqual(sorted(urls), sorted(url for url, _ in results))
+        self.assertTrue(all(isinstance(response, BrowserResponse) for _, response in results))
+        self.assertLessEqual(StandInHandler.max_in_flight, 3)
+        self.assertGreater(StandInHandler.max_in_flight, 1)
+
+
+class TestRace(IsolatedAsyncioTestCase):
+
+    async def test_head_start(self):
+        cancelled = []
+
+        async def fetch(url):
+            try:
+                await asyncio.sleep({"https": 10, "http": 0.05}[url])
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+
+            return url
+
+        start = asyncio.get_running_loop().time()
+
+        self.assertEqual("http", await AsyncBrowser.arace(["https", "http"], fetch, head_start=0.1))
+        self.assertLess(asyncio.get_running_loop().time() - start, 1)
+        await asyncio.sleep(0)
+        self.assertEqual(["https"], cancelled)
+
+    async def test_failure_without_head_start(self):
+        async def fetch(url):
+            if url == "https":
+                raise ConnectionError(url)
+
+            return url
+
+        self.assertEqual("http", await AsyncBrowser.arace(["https", "http"], fetch))
+
+        with self.assertRaises(IOError):
+            await AsyncBrowser.arace(["https"], fetch)
+
+
+class TestAiohttpBrowserSync(StandInServerMixin, TestCase):
+
+    def test_browse_via_registry(self):
+        browser = registry.get_browser("aiohttp")
+        response = browser.browse(f"{self.base_url}/sync")
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b"<p>/sync</p>", response.content)
@@ -0,0 +1,32 @@
+import pickle
+from unittest import TestCase
+
+from sq_browse.batch import BatchRunner, SharedContent
+from sq_browse.browser import RequestsBrowser
+from sq_browse.tests.utils import StandInServerMixin
+
+
+class TestSharedContent(TestCase):
+
+    def test_only_name_is_pickled(self):
+        content = SharedContent("<p>" + "ä" * 10000 + "</p>")
+
+        try:
+            payload = pickle.dumps(content)
+            self.assertLess(len(payload), 200)
+            self.assertEqual("<p>" + "ä" * 10000 + "</p>", pickle.loads(payload).read())
+        finally:
+            content.unlink()
+
+
+class TestBatchRunner(StandInServerMixin, TestCase):
+
+    def test_ordered(self):
+        runner = BatchRunner(RequestsBrowser, workers=2, fetchers=4, ordered=True)
+        urls = [f"{self.base_url}/{i}" for i in range(8)] + ["http://127.0.0.1:1/unreachable"]
+
+        results = list(runner.run(urls))
+
+        self.assertEqual(urls, [url for url, _ in results])
+        self.assertEqual([f"/{i}" for i in range(8)], [data["content"]["text"] for _, data in results[:-1]])
+        self.assertIsInstance(results[-1][1], IOError)
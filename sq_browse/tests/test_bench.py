@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+from sq_browse.bench import Benchmark, compare, percentile, huge_table_page, many_links_page
+from sq_browse.postprocessing import pipeline
+
+
+class TestBenchmark(TestCase):
+
+    def test_percentile(self):
+        self.assertEqual(2.5, percentile([1, 2, 3, 4], 0.5))
+        self.assertEqual(4, percentile([1, 2, 3, 4], 1.0))
+        self.assertEqual(1, percentile([1], 0.99))
+
+    def test_run(self):
+        corpus = {"table": huge_table_page(rows=10), "links": many_links_page(links=10)}
+        results = Benchmark(pipeline, corpus, repeat=2, warmup=0, processors=["table"]).run()
+
+        self.assertEqual(["table/pipeline", "table/table", "links/pipeline", "links/table"], list(results.keys()))
+        self.assertEqual(2, results["table/table"]["runs"])
+        self.assertGreater(results["table/table"]["p50"], 0)
+
+    def test_compare(self):
+        baseline = {"a/pipeline": {"p50": 1.0}, "b/pipeline": {"p50": 1.0}}
+        results = {"a/pipeline": {"p50": 1.1}, "b/pipeline": {"p50": 1.5}, "c/pipeline": {"p50": 9.0}}
+
+        regressions = compare(results, baseline, tolerance=0.2)
+
+        self.assertEqual(1, len(regressions))
+        self.assertTrue(regressions[0].startswith("b/pipeline"))
@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from sq_browse.browser import RequestsBrowser
+from sq_browse.cache import ResponseCache, CachingBrowser
+from sq_browse.postprocessing import pipeline
+from sq_browse.tests.utils import StandInServerMixin
+
+
+class TestCachingBrowser(StandInServerMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.cache_dir.name)
+        self.browser = CachingBrowser(RequestsBrowser(), self.cache)
+
+    def tearDown(self):
+        self.browser.close()
+        self.cache_dir.cleanup()
+
+    def test_revalidation(self):
+        first = self.browser.browse(f"{self.base_url}/page")
+        second = self.browser.browse(f"{self.base_url}/page")
+
+        self.assertEqual("miss", first.meta["cache"])
+        self.assertEqual("hit", second.meta["cache"])
+        self.assertEqual(200, second.status_code)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual("hit", pipeline.run(second)["meta"]["cache"])
+
+    def test_size_eviction(self):
+        self.cache.max_size = 100
+
+        for i in range(5):
+            self.browser.browse(f"{self.base_url}/{i}")
+
+        self.assertLessEqual(self.cache.size(), 100)
+        self.assertIsNone(self.cache.get(f"{self.base_url}/0"))
+        self.assertIsNotNone(self.cache.get(f"{self.base_url}/4"))
+
+    def test_age_eviction(self):
+        self.browser.browse(f"{self.base_url}/page")
+        self.cache.max_age = -1
+
+        self.assertIsNone(self.cache.get(f"{self.base_url}/page"))
+        self.assertEqual([], os.listdir(self.cache_dir.name))
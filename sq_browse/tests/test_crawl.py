@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import wait
+from unittest import TestCase
+from unittest.mock import patch
+
+from sq_browse.crawl import BloomFilter, Crawler, Frontier, canonicalize_url
+from sq_browse.postprocessing import Pipeline, pipeline
+from sq_browse.requests_browser import RequestsBrowser
+from sq_browse.tests.utils import StandInHandler, StandInServerMixin, StaticBrowser
+
+
+class TestCanonicalization(TestCase):
+
+    def test_canonicalize_url(self):
+        self.assertEqual("https://example.com/?a=1&b=2", canonicalize_url("HTTPS://Example.COM:443?b=2&a=1#top"))
+        self.assertEqual("http://example.com:8080/path", canonicalize_url("http://example.com:8080/path"))
+        self.assertIsNone(canonicalize_url("mailto:a@example.com"))
+        self.assertIsNone(canonicalize_url("http://example.com:port/"))
+        self.assertEqual("http://[::1]:8080/", canonicalize_url("http://[::1]:8080"))
+        self.assertEqual("https://[2001:db8::1]/", canonicalize_url("https://[2001:DB8::1]:443/"))
+
+
+class TestBloomFilter(TestCase):
+
+    def test_membership(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        urls = [f"https://example.com/{i}" for i in range(1000)]
+
+        # a new item may already collide with the earlier ones
+        self.assertGreater(sum(bloom.add(url) for url in urls), 980)
+        self.assertFalse(bloom.add(urls[0]))
+        self.assertTrue(all(url in bloom for url in urls))
+
+        false_positives = sum(f"https://example.org/{i}" in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+
+class TestFrontier(TestCase):
+
+    def test_per_host_limits(self):
+        frontier = Frontier(max_per_host=1, rate=10)
+
+        for path in ["a", "b"]:
+            frontier.push(f"https://one.example/{path}", 0, "one")
+            frontier.push(f"https://two.example/{path}", 0, "two")
+
+        first = [frontier.pop(), frontier.pop()]
+        self.assertEqual({"https://one.example/a", "https://two.example/a"}, {url for url, _, _ in first})
+        # both hosts have a request in flight
+        self.assertIsNone(frontier.pop())
+
+        frontier.release("https://one.example/a")
+        self.assertGreater(frontier.wait_time(), 0)
+        time.sleep(frontier.wait_time())
+        self.assertEqual("https://one.example/b", frontier.pop()[0])
+        self.assertEqual(1, len(frontier))
+
+
+class TestCrawler(StandInServerMixin, TestCase):
+
+    def test_crawl(self):
+        test_pipeline = Pipeline()
+
+        for name in ["lxml", "text", "links"]:
+            test_pipeline.add_component(name, pipeline.components[name])
+
+        crawler = Crawler(RequestsBrowser, test_pipeline, max_depth=1, rate=0)
+        results = dict(crawler.run([f"{self.base_url}/site", f"{self.base_url}/site"]))
+
+        self.assertEqual(
+            {f"{self.base_url}/site", f"{self.base_url}/site/imprint", f"{self.base_url}/site/contact?a=1&b=2"},
+            set(results.keys()),
+        )
+        self.assertEqual(1, StandInHandler.max_in_flight)
+        self.assertEqual({"depth": 1, "seed": f"{self.base_url}/site"},
+                         results[f"{self.base_url}/site/imprint"]["meta"]["crawl"])
+
+    def test_max_pages(self):
+        test_pipeline = Pipeline()
+
+        for name in ["lxml", "links"]:
+            test_pipeline.add_component(name, pipeline.components[name])
+
+        crawler = Crawler(RequestsBrowser, test_pipeline, max_depth=2, max_pages=2, rate=0)
+
+        self.assertEqual(2, len(list(crawler.run([f"{self.base_url}/site"]))))
+
+    def test_busy_fetchers_block(self):
+        class SlowBrowser(StaticBrowser):
+            def browse(self, url, headers=None):
+                time.sleep(0.1)
+                return super().browse(url, headers)
+
+        test_pipeline = Pipeline()
+        test_pipeline.add_component("lxml", pipeline.components["lxml"])
+        test_pipeline.add_component("links", pipeline.components["links"])
+        crawler = Crawler(lambda: SlowBrowser("<p>Text</p>"), test_pipeline, fetchers=1, rate=0)
+
+        with patch("sq_browse.crawl.wait", wraps=wait) as waits:
+            results = list(crawler.run([f"https://{host}.example/" for host in "abcd"]))
+
+        self.assertEqual(4, len(results))
+        # one wait per completed fetch, not a busy loop while urls are ready
+        self.assertLessEqual(waits.call_count, 8)
@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+from sq_browse.encoding import declared_encoding, detect_encoding
+from sq_browse.postprocessing import pipeline
+from sq_browse.tests.utils import mock_response
+
+
+class TestEncoding(TestCase):
+
+    def test_declared_encoding(self):
+        self.assertEqual("utf-8", declared_encoding({"content-type": "text/html; charset=UTF-8"}, b""))
+        self.assertEqual("cp1252", declared_encoding({"content-type": "text/html; charset=iso-8859-1"}, b""))
+        self.assertEqual("shift_jis", declared_encoding({}, b"<html><head><meta charset='Shift_JIS'>"))
+        self.assertEqual(
+            "koi8-r",
+            declared_encoding({}, b'<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">'),
+        )
+        self.assertEqual("utf-8", declared_encoding({}, b'<?xml version="1.0" encoding="utf-8"?><html>'))
+        self.assertEqual("utf-8", declared_encoding({"content-type": "text/html; charset=cp1251"}, b"\xef\xbb\xbf<p>"))
+        self.assertIsNone(declared_encoding({"content-type": "text/html; charset=bogus"}, b"<p>"))
+        self.assertIsNone(declared_encoding({}, b"<meta charset='hex'>"))
+        self.assertIsNone(declared_encoding({}, b"<meta charset='rot13'>"))
+        self.assertEqual("utf-8", declared_encoding({}, b"<meta charset='utf-16'>"))
+        self.assertEqual("utf-8", declared_encoding({}, b"<meta charset='UTF-32LE'>"))
+
+    def test_detect_encoding(self):
+        # cut within a character, as in truncated bodies
+        self.assertEqual("utf-8", detect_encoding("<p>äöü</p>".encode("utf-8")[:-6]))
+        self.assertNotEqual("utf-8", detect_encoding("<p>Grüße aus Köln, schöne Straße</p>".encode("cp1252")))
+
+    def test_parse_bytes(self):
+        documents = [
+            ("<html><head><meta charset='windows-1252'></head><body><p>Grüße</p></body></html>", "cp1252", None),
+            ("<?xml version='1.0' encoding='utf-8'?><html><body><p>Grüße</p></body></html>", "utf-8", "utf-8"),
+            ("<html><body><p>Grüße</p></body></html>", "utf-8", None),
+            ("<html><body><p>Grüße</p></body></html>", "cp1252", "cp1252"),
+            ("<html><body><p>Grüße</p></body></html>", "utf-8-sig", "utf-8"),
+            ("<!DOCTYPE html><html><body><p>Grüße</p></body></html>", "utf-16", "utf-16-le"),
+            ("<html><head><meta charset='hex'></head><body><p>Grüße</p></body></html>", "utf-8", "hex"),
+            ("<html><head><meta charset='rot13'></head><body><p>Grüße</p></body></html>", "utf-8", "rot13"),
+        ]
+
+        for document, encoding, declared in documents:
+            with self.subTest(document=document, encoding=encoding, declared=declared):
+                response = mock_response(document.encode(encoding))
+                response.encoding = declared
+                data = pipeline.run(response, only=["text"])
+
+                self.assertIn("Grüße", data["content"]["text"])
+
+    def test_parse_declared_wide_encoding(self):
+        body = "<html><head><meta charset='utf-16'></head><body><p>Grüße</p></body></html>".encode("utf-8")
+        response = mock_response(body)
+        response.encoding = declared_encoding({}, body)
+        data = pipeline.run(response, only=["text"])
+
+        self.assertIn("Grüße", data["content"]["text"])
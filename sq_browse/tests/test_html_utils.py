@@ -0,0 +1,37 @@
+import glob
+import json
+import os
+from unittest import TestCase
+
+from lxml import etree, html
+
+from sq_browse.html_utils import get_text
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "text")
+
+
+class TestGetText(TestCase):
+
+    def test_fixture_corpus(self):
+        """The text of every element has to match the output recorded with the recursive implementation."""
+        for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))):
+            with self.subTest(fixture=os.path.basename(path)):
+                with open(path, "rb") as f:
+                    tree = html.fromstring(f.read())
+
+                with open(path[:-len(".html")] + ".json", encoding="utf-8") as f:
+                    expected = json.load(f)
+
+                self.assertEqual(expected, [get_text(elem) for elem in tree.iter(etree.Element)])
+
+    def test_deep_nesting(self):
+        body = etree.Element("body")
+        elem = body
+
+        for i in range(20000):
+            elem = etree.SubElement(elem, "b" if i % 2 else "div")
+
+        elem.text = "deep"
+        elem.tail = " tail"
+
+        self.assertEqual("deep tail", get_text(body).strip())
@@ -0,0 +1,112 @@
+import tempfile
+from unittest import TestCase
+
+from sq_browse.batch import BatchRunner
+from sq_browse.incremental import IncrementalBrowsing, ResultStore, apply_diff, diff
+from sq_browse.postprocessing import BaseProcessor, Pipeline, pipeline
+from sq_browse.requests_browser import RequestsBrowser
+from sq_browse.tests.utils import StandInServerMixin, StaticBrowser
+
+
+class TestDiff(TestCase):
+    OLD = {
+        "metadata": {"title": "Old", "description": "Same", "a/b": 1},
+        "links": [{"href": "/a", "title": "A"}, {"href": "/b", "title": "B"}],
+        "tables": [{"rows": [["1", "2"], ["3", "4"]]}],
+        "text": "first line\nsecond line\nthird line",
+    }
+
+    def test_round_trip(self):
+        new = {
+            "metadata": {"title": "New", "description": "Same", "keywords": "k"},
+            "links": [{"href": "/b", "title": "B"}, {"href": "/c", "title": "C"}],
+            "tables": [{"rows": [["1", "2"], ["3", "5"], ["6", "7"]]}],
+            "text": "first line\nchanged line\nthird line\nfourth line",
+        }
+        patch = diff(self.OLD, new)
+
+        self.assertEqual(new, apply_diff(self.OLD, patch))
+        self.assertIn({"op": "replace", "path": "/metadata/title", "value": "New"}, patch)
+        self.assertIn({"op": "remove", "path": "/metadata/a~1b"}, patch)
+        self.assertEqual([], diff(self.OLD, self.OLD))
+
+    def test_lines(self):
+        new = {**self.OLD, "text": self.OLD["text"].replace("second", "2nd")}
+
+        self.assertEqual(
+            [{"op": "lines", "path": "/text", "edits": [[1, 2, ["2nd line\n"]]]}],
+            diff(self.OLD, new),
+        )
+
+
+class TestIncrementalBrowsing(StandInServerMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pipeline = Pipeline()
+
+        for name in ["lxml", "text", "links"]:
+            self.pipeline.add_component(name, pipeline.components[name])
+
+        self.incremental = IncrementalBrowsing(ResultStore(self.tmp_dir.name), self.pipeline)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_not_modified(self):
+        browser = RequestsBrowser()
+        first = self.incremental.run(browser, f"{self.base_url}/page")
+        second = self.incremental.run(browser, f"{self.base_url}/page")
+
+        self.assertEqual("new", first["meta"]["incremental"])
+        self.assertEqual("/page", first["content"]["text"])
+        self.assertEqual("unchanged", second["meta"]["incremental"])
+        self.assertEqual(304, second["raw"]["status_code"])
+        self.assertEqual({}, second["content"])
+
+        # other components cannot reuse the stored result
+        third = self.incremental.run(browser, f"{self.base_url}/page", only=["lxml"])
+        self.assertEqual("new", third["meta"]["incremental"])
+
+    def test_changed_content(self):
+        page = "<html><body><p>Hello</p><p>World</p><a href='/a'>A</a></body></html>"
+        self.incremental.run(StaticBrowser(page), "https://example.com")
+
+        same = self.incremental.run(StaticBrowser(page), "https://example.com")
+        self.assertEqual("unchanged", same["meta"]["incremental"])
+
+        changed = self.incremental.run(StaticBrowser(page.replace("World", "Moon")), "https://example.com")
+        self.assertEqual("changed", changed["meta"]["incremental"])
+        self.assertEqual([("lines", "/text")], [(op["op"], op["path"]) for op in changed["content"]])
+
+    def test_failures_are_retried(self):
+        class FlakyProcessor(BaseProcessor):
+            failures = 1
+
+            def process(self, data):
+                if self.failures:
+                    self.failures -= 1
+                    raise ValueError("transient")
+
+                data["content"]["flaky"] = True
+                return data
+
+        self.pipeline.add_component("flaky", FlakyProcessor())
+        page = "<html><body><p>Hello</p></body></html>"
+
+        failed = self.incremental.run(StaticBrowser(page), "https://example.com")
+        self.assertEqual({"flaky": "ValueError"}, failed["meta"]["failed_stages"])
+
+        retried = self.incremental.run(StaticBrowser(page), "https://example.com")
+        self.assertEqual("changed", retried["meta"]["incremental"])
+        self.assertEqual([{"op": "add", "path": "/flaky", "value": True}], retried["content"])
+        unchanged = self.incremental.run(StaticBrowser(page), "https://example.com")
+        self.assertEqual("unchanged", unchanged["meta"]["incremental"])
+
+    def test_batch(self):
+        runner = BatchRunner(RequestsBrowser, workers=1, fetchers=2, only=["text"], incremental=self.incremental)
+        urls = [f"{self.base_url}/{i}" for i in range(3)]
+
+        self.assertEqual({"new"}, {data["meta"]["incremental"] for _, data in runner.run(urls)})
+        self.assertEqual({"unchanged"}, {data["meta"]["incremental"] for _, data in runner.run(urls)})
@@ -0,0 +1,98 @@
+import os
+import time
+from unittest import TestCase
+
+from sq_browse.errors import UnprocessableError
+from sq_browse.isolation import IsolatedProcessor
+from sq_browse.postprocessing import BaseProcessor, Pipeline, pipeline
+from sq_browse.tests.utils import mock_response
+
+
+class HeadingProcessor(BaseProcessor):
+    dependencies = ["lxml"]
+    consumes = ["_tree"]
+
+    def process(self, data):
+        data["content"]["heading"] = data["_tree"].findtext(".//h1")
+        data["content"]["pid"] = os.getpid()
+
+        if data["content"]["heading"] == "slow":
+            time.sleep(10)
+        elif data["content"]["heading"] == "crash":
+            os._exit(1)
+
+        return data
+
+
+class LinkCountProcessor(BaseProcessor):
+    """A plugin which does not declare what it consumes."""
+    dependencies = ["index", "links"]
+
+    def process(self, data):
+        data["content"]["link_count"] = len(list(data["_links"]))
+        return data
+
+
+class TestIsolatedProcessor(TestCase):
+
+    def setUp(self):
+        self.pipeline = Pipeline()
+        self.pipeline.add_component("lxml", pipeline.components["lxml"])
+        self.pipeline.add_component("heading", HeadingProcessor())
+        self.pipeline.configure(time_budget=2, isolate=["heading"])
+        self.processor = self.pipeline.components["heading"]
+
+    def tearDown(self):
+        self.processor.close()
+
+    def run_pipeline(self, heading: str, **kwargs):
+        response = mock_response(f"<html><body><h1>{heading}</h1></body></html>")
+
+        return self.pipeline.run(response, **kwargs)
+
+    def test_process(self):
+        self.assertIsInstance(self.processor, IsolatedProcessor)
+        data = self.run_pipeline("Title")
+
+        self.assertEqual("Title", data["content"]["heading"])
+        self.assertNotEqual(os.getpid(), data["content"]["pid"])
+        # the worker is reused
+        self.assertEqual(data["content"]["pid"], self.run_pipeline("Again")["content"]["pid"])
+
+    def test_timeout(self):
+        self.processor.time_budget = 0.5
+        started_at = time.monotonic()
+        data = self.run_pipeline("slow")
+
+        self.assertLess(time.monotonic() - started_at, 5)
+        self.assertEqual({"heading": "timeout"}, data["meta"]["skipped_stages"])
+        self.assertNotIn("heading", data["content"])
+
+        with self.assertRaises(UnprocessableError):
+            self.run_pipeline("slow", fail_save=False)
+
+        # a new worker takes over
+        self.assertEqual("Title", self.run_pipeline("Title")["content"]["heading"])
+
+    def test_crash(self):
+        with self.assertRaises(UnprocessableError):
+            self.run_pipeline("crash", fail_save=False)
+
+        self.assertEqual("Title", self.run_pipeline("Title")["content"]["heading"])
+
+    def test_default_consumes(self):
+        for name in ["index", "links"]:
+            self.pipeline.add_component(name, pipeline.components[name])
+
+        self.pipeline.add_component("link_count", LinkCountProcessor())
+        self.pipeline.isolate_component("link_count")
+        html = "<html><body><h1>Title</h1><a href='/a'>A</a><a href='/b'>B</a></body></html>"
+
+        try:
+            for low_memory in [False, True]:
+                response = mock_response(html)
+                data = self.pipeline.run(response, fail_save=False, low_memory=low_memory)
+
+                self.assertEqual(2, data["content"]["link_count"])
+        finally:
+            self.pipeline.components["link_count"].close()
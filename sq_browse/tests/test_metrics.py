@@ -0,0 +1,99 @@
+import os
+import tempfile
+from unittest import TestCase
+from urllib.request import urlopen
+
+from sq_browse.metrics import Counter, Histogram, Metrics
+from sq_browse.postprocessing import BaseProcessor, Pipeline, pipeline
+from sq_browse.requests_browser import RequestsBrowser
+from sq_browse.tests.utils import mock_response, StandInServerMixin
+
+
+class TestMetricTypes(TestCase):
+
+    def test_counter(self):
+        counter = Counter("errors_total", "Errors.", ("exception",))
+        counter.inc(1, "ValueError")
+        counter.inc(2, 'Quoted"Error')
+
+        self.assertEqual(['errors_total{exception="ValueError"} 1', 'errors_total{exception="Quoted\\"Error"} 2'],
+                         counter.samples())
+
+    def test_histogram(self):
+        histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value)
+
+        self.assertEqual(
+            ['latency_seconds_bucket{le="0.1"} 2', 'latency_seconds_bucket{le="1"} 3',
+             'latency_seconds_bucket{le="+Inf"} 4', "latency_seconds_sum 3.65", "latency_seconds_count 4"],
+            histogram.samples(),
+        )
+
+
+class TestMetrics(StandInServerMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pipeline = Pipeline()
+
+        for name in ["lxml", "text"]:
+            self.pipeline.add_component(name, pipeline.components[name])
+
+        self.metrics = Metrics(self.pipeline)
+
+    def tearDown(self):
+        self.metrics.close()
+
+    def browse(self, urls):
+        browser = self.metrics.wrap(RequestsBrowser())
+
+        for url in urls:
+            try:
+                self.metrics.observe_result(self.pipeline.run(browser.browse(url), fail_save=False))
+            except Exception as e:
+                self.metrics.observe_failure(e)
+
+    def test_render(self):
+        self.browse([f"{self.base_url}/a", f"{self.base_url}/b", "http://127.0.0.1:1/unreachable"])
+        text = self.metrics.render()
+
+        self.assertIn("sq_browse_urls_processed_total 2\n", text)
+        self.assertIn('sq_browse_failures_total{exception="OSError"} 1\n', text)
+        self.assertIn("sq_browse_fetch_duration_seconds_count 2\n", text)
+        self.assertIn('sq_browse_processor_duration_seconds_count{processor="lxml"} 2\n', text)
+        self.assertIn("# TYPE sq_browse_downloaded_bytes_total counter\n", text)
+        self.assertNotIn('processor="fetch"', text)
+
+    def test_endpoint_and_file(self):
+        self.browse([f"{self.base_url}/a"])
+        host, port = self.metrics.serve(port=0)
+
+        with urlopen(f"http://{host}:{port}/metrics") as response:
+            self.assertIn(b"sq_browse_urls_processed_total 1", response.read())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "metrics.prom")
+            self.metrics.write_periodically(path, interval=60)
+            self.metrics.close()
+
+            with open(path) as f:
+                self.assertEqual(self.metrics.render(), f.read())
+
+        self.assertEqual([], self.pipeline.timing_hooks)
+
+    def test_failure_label_and_received_bytes(self):
+        class FailingProcessor(BaseProcessor):
+            def process(self, data):
+                raise ValueError("broken")
+
+        self.pipeline.add_component("failing", FailingProcessor())
+        self.browse([f"{self.base_url}/a"])
+        response = mock_response(b"<p>cached</p>")
+        response.meta["cache"] = "hit"
+        self.metrics.observe_response(response, 0.1)
+        text = self.metrics.render()
+
+        self.assertIn('sq_browse_failures_total{exception="ValueError"} 1\n', text)
+        self.assertIn(f"sq_browse_downloaded_bytes_total {len(b'<html><body><p>/a</p></body></html>')}\n", text)
@@ -0,0 +1,191 @@
+import time
+import tracemalloc
+from typing import List
+from unittest import TestCase
+from unittest.mock import patch
+
+from sq_browse.errors import DeadlineExceededError, MemoryBudgetExceededError
+from sq_browse.instrumentation import Instrumentation
+from sq_browse.postprocessing import BaseProcessor, Pipeline, build_index, pipeline
+from sq_browse.tests.utils import mock_response
+
+
+class TestSelectivePipeline(TestCase):
+    HTML = ("<html><head><title>Title</title></head>"
+            "<body><a href='/imprint'>Imprint</a><table><tr><td>1</td></tr></table></body></html>")
+
+    def test_dependency_closure(self):
+        self.assertEqual(["lxml", "links", "semantic_links"], pipeline.sorted_components(only=["semantic_links"]))
+
+    def test_only(self):
+        response = mock_response(self.HTML)
+        data = pipeline.run(response, only=["metadata", "semantic_links"])
+
+        self.assertEqual({"metadata", "links"}, set(data["content"].keys()))
+        self.assertEqual("Title", data["content"]["metadata"]["title"])
+        self.assertEqual({"Imprint": "https://localhost/imprint"}, data["content"]["links"])
+
+    def test_unknown_processor(self):
+        self.assertRaises(ValueError, pipeline.sorted_components, only=["unknown"])
+
+
+class TestTimings(TestCase):
+
+    def test_timings(self):
+        response = mock_response("<html><body><p>Text</p></body></html>")
+        response.timings["fetch"] = {"wall": 0.5, "cpu": 0.1}
+        measured = []
+        pipeline.timing_hooks.append(lambda name, timing: measured.append(name))
+
+        try:
+            data = pipeline.run(response, only=["text"], timings=True)
+        finally:
+            pipeline.timing_hooks.clear()
+
+        self.assertEqual(["fetch", "lxml", "text"], list(data["meta"]["timings"].keys()))
+        self.assertEqual(["fetch", "lxml", "text"], measured)
+        self.assertEqual({"wall", "cpu"}, set(data["meta"]["timings"]["text"].keys()))
+
+    def test_no_timings_by_default(self):
+        response = mock_response("<html><body><p>Text</p></body></html>")
+
+        self.assertNotIn("timings", pipeline.run(response)["meta"])
+
+    def test_nested_peak_memory(self):
+        instrumentation = Instrumentation()
+        tracemalloc.start()
+
+        try:
+            with instrumentation.measure("outer"):
+                allocated = bytearray(1_000_000)
+                del allocated
+
+                with instrumentation.measure("inner"):
+                    pass
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(instrumentation.timings["inner"]["peak_memory"], 100_000)
+        self.assertGreaterEqual(instrumentation.timings["outer"]["peak_memory"], 1_000_000)
+
+
+class TestLowMemory(TestCase):
+    HTML = ("<html><head><title>Title</title></head><body><p>Text</p>"
+            "<a href='/imprint'>Imprint</a><table><tr><th>a</th></tr><tr><td>1</td></tr></table></body></html>")
+
+    def test_same_result(self):
+        expected = pipeline.run(mock_response(self.HTML))
+        data = pipeline.run(mock_response(self.HTML), low_memory=True)
+
+        self.assertEqual(expected, data)
+
+    def test_releases_intermediate_data(self):
+        seen = {}
+
+        class SpyProcessor(BaseProcessor):
+            dependencies = ["semantic_links"]
+            consumes = []
+
+            def process(self, data):
+                seen.update(keys=set(data.keys()), content="content" in data["raw"])
+                return data
+
+        test_pipeline = Pipeline()
+
+        for name in ["lxml", "links", "semantic_links"]:
+            test_pipeline.add_component(name, pipeline.components[name])
+
+        test_pipeline.add_component("spy", SpyProcessor())
+        response = mock_response(self.HTML)
+        test_pipeline.run(response, low_memory=True)
+
+        self.assertEqual({"meta", "raw", "content", "_instrumentation", "_low_memory"}, seen["keys"])
+        self.assertFalse(seen["content"])
+        self.assertIsNone(response.content)
+
+    def test_unknown_consumers_keep_data(self):
+        test_pipeline = Pipeline()
+        test_pipeline.add_component("lxml", pipeline.components["lxml"])
+        test_pipeline.add_component("unknown", BaseProcessor())
+
+        self.assertEqual([None, set()], test_pipeline.consumed_later(["lxml", "unknown"]))
+
+    def test_memory_budget(self):
+        response = mock_response(self.HTML * 100)
+
+        with self.assertRaises(MemoryBudgetExceededError):
+            pipeline.run(response, memory_budget=1000)
+
+        response = mock_response(self.HTML)
+        self.assertIn("text", pipeline.run(response, memory_budget=1024 ** 3)["content"])
+
+
+class SlowProcessor(BaseProcessor):
+
+    def __init__(self, seconds: float, dependencies: List[str], optional: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.seconds = seconds
+        self.dependencies = dependencies
+        self.optional = optional
+
+    def process(self, data):
+        time.sleep(self.seconds)
+        data["content"].setdefault("slow", []).append(self.seconds)
+        return data
+
+
+class TestDeadline(TestCase):
+
+    def setUp(self):
+        self.pipeline = Pipeline()
+        self.pipeline.add_component("lxml", pipeline.components["lxml"])
+        self.pipeline.add_component("slow", SlowProcessor(0.1, ["lxml"]))
+        self.pipeline.add_component("extra", SlowProcessor(0, ["slow"], optional=True))
+
+        class DependentProcessor(BaseProcessor):
+            dependencies = ["extra"]
+
+        self.pipeline.add_component("dependent", DependentProcessor())
+
+    def test_optional_skipped(self):
+        data = self.pipeline.run(mock_response("<p>Text</p>"), deadline=0.05)
+
+        self.assertEqual([0.1], data["content"]["slow"])
+        self.assertEqual({"extra": "deadline", "dependent": "dependency"}, data["meta"]["skipped_stages"])
+
+    def test_required_fails(self):
+        self.pipeline.components["extra"].optional = False
+
+        with self.assertRaises(DeadlineExceededError):
+            self.pipeline.run(mock_response("<p>Text</p>"), deadline=0.05)
+
+    def test_within_deadline(self):
+        data = self.pipeline.run(mock_response("<p>Text</p>"), deadline=10)
+
+        self.assertEqual([0.1, 0], data["content"]["slow"])
+        self.assertNotIn("skipped_stages", data["meta"])
+
+    def test_over_budget(self):
+        self.pipeline.configure(time_budget=0.05)
+        data = self.pipeline.run(mock_response("<p>Text</p>"))
+
+        self.assertEqual(["slow"], list(data["meta"]["over_budget"]))
+        self.assertGreater(data["meta"]["over_budget"]["slow"], 0.05)
+
+
+class TestIndex(TestCase):
+
+    def test_single_walk(self):
+        response = mock_response("<html><head><title>Title</title></head></html>")
+
+        with patch("sq_browse.postprocessing.build_index", wraps=build_index) as mock_build_index:
+            for order in [["lxml", "metadata", "index"], ["lxml", "index", "metadata"]]:
+                with self.subTest(order=order):
+                    mock_build_index.reset_mock()
+                    data = {"meta": {"url": response.url}, "raw": {"content": response.content}, "content": {}}
+
+                    for name in order:
+                        data = pipeline.components[name].process(data)
+
+                    self.assertEqual("Title", data["content"]["metadata"]["title"])
+                    self.assertEqual(1, mock_build_index.call_count)
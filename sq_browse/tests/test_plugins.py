@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch
+
+from sq_browse import plugins
+from sq_browse.browser import BrowserRegistry
+from sq_browse.postprocessing import BaseProcessor, Pipeline, TextProcessor
+
+
+class TestPluginCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp_dir.name})
+        self.env.start()
+        os.environ.pop("SQ_BROWSE_NO_PLUGIN_CACHE", None)
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_cached_discovery(self):
+        discovered = {"sq_browse.browser": [("fake", "fake_module:FakeBrowser")], "sq_browse.processor": []}
+
+        with patch.object(plugins, "scan_entry_points", return_value=discovered) as scan:
+            self.assertEqual(discovered, plugins.discover_entry_points())
+            self.assertEqual(discovered, plugins.discover_entry_points())
+
+        self.assertEqual(1, scan.call_count)
+        self.assertTrue(os.path.exists(plugins.cache_path()))
+
+    def test_invalidated_by_installs(self):
+        discovered = {"sq_browse.browser": [], "sq_browse.processor": []}
+
+        with patch.object(plugins, "scan_entry_points", return_value=discovered) as scan:
+            plugins.discover_entry_points()
+
+            with patch.object(plugins, "environment_fingerprint", return_value="changed"):
+                plugins.discover_entry_points()
+
+        self.assertEqual(2, scan.call_count)
+
+
+class YieldingList(list):
+
+    def __iter__(self):
+        # lets other threads run while the dependencies are iterated
+        time.sleep(0)
+        return super().__iter__()
+
+
+class YieldingProcessor(BaseProcessor):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.dependencies = YieldingList()
+
+
+class TestLazyRegistries(TestCase):
+
+    def test_lazy_browser(self):
+        registry = BrowserRegistry()
+        registry.register("lazy", "sq_browse.requests_browser:RequestsBrowser", {"timeout": 7})
+
+        self.assertEqual("sq_browse.requests_browser.RequestsBrowser", registry.describe("lazy"))
+        self.assertEqual(7, registry.get_browser("lazy").timeout)
+
+    def test_lazy_processor(self):
+        pipeline = Pipeline()
+        pipeline.add_lazy_component("lxml", "sq_browse.postprocessing:LxmlProcessor")
+        pipeline.add_component("text", TextProcessor())
+        pipeline.add_lazy_component("unused", "sq_browse.not_installed:Processor")
+
+        self.assertEqual(["lxml", "text"], pipeline.sorted_components(only=["text"]))
+        self.assertIn("unused", pipeline.lazy_components)
+
+    def test_concurrent_resolution(self):
+        pipeline = Pipeline()
+        pipeline.add_component("proc", YieldingProcessor())
+
+        for i in range(200):
+            pipeline.add_lazy_component(f"proc{i}", "sq_browse.tests.test_plugins:YieldingProcessor")
+
+        # a run needing other components sorts them while the first full run resolves the rest
+        with ThreadPoolExecutor(2) as executor:
+            partial = executor.submit(lambda: [pipeline.sorted_components(only=["proc"]) for _ in range(20)])
+            complete = executor.submit(pipeline.sorted_components)
+
+            self.assertEqual(201, len(complete.result()))
+            self.assertEqual([["proc"]] * 20, partial.result())
+
+    def test_startup_imports(self):
+        code = ("import sys, sq_browse.cmd; "
+                "print(sorted({'requests', 'asyncio', 'aiohttp', 'lxml', 'sq_browse.postprocessing'} & set(sys.modules)))")
+        output = subprocess.check_output([sys.executable, "-c", code], text=True)
+
+        self.assertEqual("[]", output.strip())
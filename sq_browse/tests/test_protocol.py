@@ -0,0 +1,105 @@
+import io
+import json
+import subprocess
+import sys
+from unittest import TestCase
+
+from sq_browse.protocol import SubprocessProtocol
+from sq_browse.tests.utils import StandInServerMixin, StaticBrowser
+
+
+class TestSubprocessProtocol(StandInServerMixin, TestCase):
+
+    def run_subprocess(self, requests, *args):
+        lines = "".join(line + "\n" for line in requests)
+        process = subprocess.run(
+            [sys.executable, "-m", "sq_browse.cmd", "run-subprocess", *args],
+            input=lines,
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+
+        return process.returncode, [json.loads(line) for line in process.stdout.splitlines()]
+
+    def test_out_of_order_replies(self):
+        requests = [
+            json.dumps({"id": "slow", "url": f"{self.base_url}/slow", "only": ["lxml"]}),
+            json.dumps({"id": "fast", "url": f"{self.base_url}/fast", "only": ["text"]}),
+            json.dumps({"id": 3, "url": "http://127.0.0.1:1/unreachable", "timeout": 0.5}),
+            json.dumps({"id": 4, "url": f"{self.base_url}/other", "browser": "unknown"}),
+            "not json",
+        ]
+        returncode, replies = self.run_subprocess(requests, "--protocol", "2")
+        replies_by_id = {reply["id"]: reply for reply in replies}
+
+        self.assertEqual(0, returncode)
+        self.assertEqual(5, len(replies))
+        self.assertEqual("slow", replies[-1]["id"])
+        self.assertEqual("/fast", replies_by_id["fast"]["result"]["content"]["text"])
+        self.assertEqual("OSError", replies_by_id[3]["error"]["type"])
+        self.assertEqual("ValueError", replies_by_id[4]["error"]["type"])
+        self.assertEqual("JSONDecodeError", replies_by_id[None]["error"]["type"])
+
+    def test_v1_stops_at_eof(self):
+        returncode, replies = self.run_subprocess([f"{self.base_url}/page"])
+
+        self.assertEqual(0, returncode)
+        self.assertEqual(["/page"], [reply["content"]["text"] for reply in replies])
+
+
+class BrokenWriter(object):
+
+    def write(self, data):
+        raise BrokenPipeError()
+
+
+class ListWriter(list):
+
+    def write(self, data):
+        self.append(data)
+
+
+class TestBrokenPipe(TestCase):
+
+    def test_stops_reading(self):
+        browsed = []
+
+        def browser_factory(name, **config):
+            browser = StaticBrowser("<html><body><p>Text</p></body></html>")
+            browser.browse = lambda url, headers=None, browse=browser.browse: browsed.append(url) or browse(url)
+            return browser
+
+        protocol = SubprocessProtocol(browser_factory, BrokenWriter(), "static", concurrency=1, only=["text"])
+        requests = "".join(json.dumps({"id": i, "url": f"https://example.com/{i}"}) + "\n" for i in range(100))
+
+        with self.assertRaises(BrokenPipeError):
+            protocol.serve(io.StringIO(requests))
+
+        self.assertLess(len(browsed), 10)
+
+
+class TestTimeouts(TestCase):
+
+    def test_one_browser_per_thread(self):
+        browsers, timeouts = [], []
+
+        def browser_factory(name, **config):
+            browser = StaticBrowser("<html><body><p>Text</p></body></html>", **config)
+            browser.timeout = 3
+            browser.browse = lambda url, headers=None, browse=browser.browse: timeouts.append(browser.timeout) or \
+                browse(url)
+            browsers.append(browser)
+            return browser
+
+        writer = ListWriter()
+        protocol = SubprocessProtocol(browser_factory, writer, "static", concurrency=1, only=["text"])
+        requests = [{"id": 1, "url": "https://example.com/", "timeout": 0.5},
+                    {"id": 2, "url": "https://example.com/", "timeout": 1.5},
+                    {"id": 3, "url": "https://example.com/"}]
+        protocol.serve(io.StringIO("".join(json.dumps(request) + "\n" for request in requests)))
+
+        self.assertEqual([1, 2, 3], sorted(reply["id"] for reply in writer))
+        self.assertEqual(1, len(browsers))
+        self.assertEqual([0.5, 1.5, 3], timeouts)
+        self.assertEqual(3, browsers[0].timeout)
@@ -0,0 +1,165 @@
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+import requests
+
+from sq_browse.browser import RequestsBrowser, Deadline, SchemeMemory, registry
+from sq_browse.errors import ResponseTooLargeError
+from sq_browse.postprocessing import pipeline
+from sq_browse.tests.utils import StandInHandler, StandInServerMixin
+
+
+class TestRequestsBrowser(StandInServerMixin, TestCase):
+
+    def test_connection_is_reused(self):
+        browser = RequestsBrowser()
+
+        try:
+            for i in range(5):
+                response = browser.browse(f"{self.base_url}/{i}")
+                self.assertEqual(200, response.status_code)
+                self.assertIn(f"<p>/{i}</p>".encode(), response.content)
+        finally:
+            browser.close()
+
+        self.assertEqual(1, len(StandInHandler.client_ports))
+
+    def test_pool_config_from_registry(self):
+        registry.register("pooled", RequestsBrowser, {"pool_maxsize": 32, "max_retries": 2})
+
+        try:
+            browser = registry.get_browser("pooled")
+        finally:
+            del registry.browsers["pooled"]
+            del registry.browser_configs["pooled"]
+
+        adapter = browser.session.get_adapter("https://localhost/")
+        self.assertEqual(32, adapter._pool_maxsize)
+        self.assertEqual(2, adapter.max_retries.total)
+
+    def test_deadline_in_threads(self):
+        browser = RequestsBrowser(timeout=0.3)
+
+        def browse_slow(i):
+            start = time.monotonic()
+
+            with self.assertRaises(IOError):
+                browser.browse(f"{self.base_url}/slow/{i}")
+
+            return time.monotonic() - start
+
+        with ThreadPoolExecutor(4) as executor:
+            durations = list(executor.map(browse_slow, range(4)))
+
+        browser.close()
+        self.assertTrue(all(duration < 1.0 for duration in durations), durations)
+
+    def test_body_errors_raise_io_error(self):
+        # the body stalls beyond the timeout, or ends before its declared length
+        for timeout in [0.3, 3]:
+            with self.subTest(timeout=timeout):
+                browser = RequestsBrowser(timeout=timeout)
+
+                try:
+                    with self.assertRaises(IOError):
+                        browser.browse(f"{self.base_url}/stall")
+                finally:
+                    browser.close()
+
+    def test_max_bytes_truncate(self):
+        browser = RequestsBrowser(max_bytes=10)
+        response = browser.browse(f"{self.base_url}/page")
+        browser.close()
+
+        self.assertEqual(b"<html><bod", response.content)
+        self.assertTrue(response.meta["truncated"])
+
+    def test_max_bytes_abort(self):
+        browser = RequestsBrowser(max_bytes=10, truncate=False)
+
+        with self.assertRaises(ResponseTooLargeError):
+            browser.browse(f"{self.base_url}/page")
+
+        browser.close()
+
+    def test_stream_parse(self):
+        browser = RequestsBrowser(stream_parse=True)
+        response = browser.browse(f"{self.base_url}/page")
+        browser.close()
+
+        self.assertEqual(b"", response.content)
+        self.assertEqual("/page", pipeline.run(response)["content"]["text"])
+
+    def test_stream_parse_unknown_charset(self):
+        browser = RequestsBrowser(stream_parse=True)
+        browser.close()
+
+        for charset in ["utf8mb4", "x-user-defined", "utf-8"]:
+            with self.subTest(charset=charset):
+                response = requests.Response()
+                response.headers["content-type"] = f"text/html; charset={charset}"
+                response.url = "https://localhost/"
+                tree = browser.parse_content(response, [b"<html><body><p>Text</p>", b"</body></html>"])
+
+                self.assertEqual("Text", tree.findtext(".//p"))
+
+    def test_race_head_start(self):
+        # accepts connections but never answers, like a dead https endpoint behind a firewall
+        silent = socket.socket()
+        silent.bind(("127.0.0.1", 0))
+        silent.listen(8)
+        browser = RequestsBrowser(timeout=3)
+
+        try:
+            start = time.monotonic()
+            url, response, _ = browser.race(
+                [f"http://127.0.0.1:{silent.getsockname()[1]}/", f"{self.base_url}/page"], head_start=0.1
+            )
+            response.close()
+        finally:
+            browser.close()
+            silent.close()
+
+        self.assertEqual(f"{self.base_url}/page", url)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_scheme_memory(self):
+        browser = RequestsBrowser()
+        ambiguous_url = f"{self.base_url.split('://')[1]}/page"
+
+        try:
+            self.assertEqual("https", next(browser.possible_urls(ambiguous_url)).split(":")[0])
+            # the stand-in server does not speak TLS
+            self.assertEqual(f"{self.base_url}/page", browser.browse(ambiguous_url).url)
+            self.assertEqual(f"{self.base_url}/page", next(browser.possible_urls(ambiguous_url)))
+            self.assertIsNone(browser.race_head_start(list(browser.possible_urls(ambiguous_url)), 0.25))
+        finally:
+            browser.close()
+
+
+class TestSchemeMemory(TestCase):
+
+    def test_bounded(self):
+        memory = SchemeMemory(max_domains=2)
+        memory.remember("a.example", "http")
+        memory.remember("b.example", "https")
+        memory.get("a.example")
+        memory.remember("c.example", "https")
+
+        self.assertEqual("http", memory.get("a.example"))
+        self.assertIsNone(memory.get("b.example"))
+
+
+class TestDeadline(TestCase):
+
+    def test_sub_second_budget(self):
+        deadline = Deadline(0.05)
+        deadline.check()
+        self.assertLessEqual(deadline.remaining(), 0.05)
+
+        time.sleep(0.06)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(0.0, deadline.remaining())
+        self.assertRaises(TimeoutError, deadline.check)
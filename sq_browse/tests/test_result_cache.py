@@ -0,0 +1,88 @@
+import tempfile
+from unittest import TestCase
+
+from sq_browse.postprocessing import Pipeline, pipeline
+from sq_browse.result_cache import ResultCache, SimhashIndex, simhash
+from sq_browse.tests.utils import mock_response
+
+
+class TestSimhash(TestCase):
+    TEXT = " ".join(f"word{i}" for i in range(300))
+
+    def test_sampled(self):
+        text = " ".join(f"word{i % 5000}" for i in range(50_000))
+        changed = text.replace("word150 ", "other ", 1)
+
+        self.assertLessEqual((simhash(text) ^ simhash(changed)).bit_count(), 3)
+
+    def test_near_duplicates(self):
+        changed = self.TEXT.replace("word150", "other")
+
+        self.assertLessEqual((simhash(self.TEXT) ^ simhash(changed)).bit_count(), 8)
+        self.assertGreater((simhash(self.TEXT) ^ simhash("completely different text here")).bit_count(), 8)
+
+    def test_index(self):
+        index = SimhashIndex(max_entries=2, max_distance=3)
+        index.add(0b1011, "a")
+        index.add(0xF << 60, "b")
+
+        self.assertEqual(("a", 1), index.find(0b1010))
+        self.assertIsNone(index.find(0b1010, exclude="a"))
+
+        index.add(0, "c")
+        self.assertEqual(("c", 2), index.find(0b11))
+        self.assertEqual(2, len(index.entries))
+
+
+class TestResultCache(TestCase):
+    HTML = "<html><head><title>Title</title></head><body><p>Text</p><a href='/imprint'>Imprint</a></body></html>"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        pipeline.result_cache = ResultCache(max_entries=2, cache_dir=self.tmp_dir.name, near_duplicates=True)
+
+    def tearDown(self):
+        pipeline.result_cache = None
+        self.tmp_dir.cleanup()
+
+    def run_pipeline(self, url="https://localhost/", only=None):
+        response = mock_response(self.HTML)
+        response.url = url
+
+        return pipeline.run(response, only=only)
+
+    def test_hit(self):
+        first = self.run_pipeline()
+        second = self.run_pipeline()
+
+        self.assertEqual("miss", first["meta"]["result_cache"])
+        self.assertEqual("hit", second["meta"]["result_cache"])
+        self.assertEqual(first["content"], second["content"])
+        self.assertIn("simhash", first["meta"])
+        self.assertNotIn("simhash", second["meta"])
+
+    def test_near_duplicates_require_cache(self):
+        with self.assertRaises(ValueError):
+            Pipeline().configure(near_duplicates=True)
+
+        test_pipeline = Pipeline()
+        test_pipeline.configure(result_cache_size=2, near_duplicates=True)
+        self.assertIsNotNone(test_pipeline.result_cache.simhashes)
+
+    def test_url_dependent_components(self):
+        self.run_pipeline("https://one.localhost/")
+        mirror = self.run_pipeline("https://two.localhost/")
+
+        self.assertEqual("miss", mirror["meta"]["result_cache"])
+        self.assertEqual({"url": "https://one.localhost/", "distance": 0}, mirror["meta"]["near_duplicate"])
+
+        self.run_pipeline("https://one.localhost/", only=["text"])
+        self.assertEqual("hit", self.run_pipeline("https://two.localhost/", only=["text"])["meta"]["result_cache"])
+
+    def test_disk_tier(self):
+        first = self.run_pipeline()
+        pipeline.result_cache = ResultCache(max_entries=2, cache_dir=self.tmp_dir.name)
+        second = self.run_pipeline()
+
+        self.assertEqual("hit", second["meta"]["result_cache"])
+        self.assertEqual(first["content"], second["content"])
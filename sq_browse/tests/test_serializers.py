@@ -0,0 +1,57 @@
+import io
+import json
+import time
+from datetime import datetime
+from unittest import TestCase, skipUnless
+
+from sq_browse.serializers import OutputWriter, serializers
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class TestSerializers(TestCase):
+    DATA = {
+        "meta": {"timestamp": datetime(1970, 1, 1, 12, 30, 15, 500)},
+        "content": {"tables": [{"rows": [("Anton", "1")]}], "text": "Über"},
+    }
+    EXPECTED = {
+        "meta": {"timestamp": "1970-01-01T12:30:15.000500"},
+        "content": {"tables": [{"rows": [["Anton", "1"]]}], "text": "Über"},
+    }
+
+    def test_json(self):
+        for name in ("json", "json-stdlib"):
+            with self.subTest(serializer=name):
+                serializer = serializers.get_serializer(name)
+                self.assertEqual(self.EXPECTED, json.loads(serializer.dumps(self.DATA)))
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        serializer = serializers.get_serializer("msgpack")
+        self.assertEqual(self.EXPECTED, msgpack.unpackb(serializer.dumps(self.DATA)))
+
+    def test_writer_batches(self):
+        stream = io.BytesIO()
+        writer = OutputWriter(stream, serializers.get_serializer("json"), buffer_size=1024, flush_interval=60)
+
+        writer.write(self.DATA)
+        writer.write(self.DATA)
+        self.assertEqual(b"", stream.getvalue())
+
+        writer.flush()
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([self.EXPECTED, self.EXPECTED], [json.loads(line) for line in lines])
+
+    def test_writer_flushes_on_timer(self):
+        stream = io.BytesIO()
+        writer = OutputWriter(stream, serializers.get_serializer("json"), buffer_size=1024, flush_interval=0.1)
+        writer.write(self.DATA)
+        deadline = time.monotonic() + 5
+
+        while not stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        self.assertEqual([self.EXPECTED], [json.loads(line) for line in stream.getvalue().splitlines()])
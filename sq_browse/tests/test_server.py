@@ -0,0 +1,143 @@
+import http.client
+import json
+import os
+import re
+import subprocess
+import socket
+import sys
+import threading
+import time
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from sq_browse.errors import WorkersFailingError
+from sq_browse.server import PreforkServer, WorkerHTTPServer
+from sq_browse.tests.utils import StandInServerMixin
+
+
+@skipUnless(hasattr(os, "fork"), "the server requires os.fork")
+class TestPreforkServer(StandInServerMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "sq_browse.cmd", "serve", "--port", "0", "--workers", "2", "--max-jobs", "2"],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        match = re.search(r"http://([\d.]+):(\d+)", self.process.stderr.readline())
+        self.address = match.group(1), int(match.group(2))
+
+    def tearDown(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+        self.process.stderr.close()
+
+    def post(self, path, request):
+        connection = http.client.HTTPConnection(*self.address, timeout=10)
+
+        try:
+            connection.request("POST", path, body=json.dumps(request), headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            return response.status, response.getheader("X-Worker-Pid"), json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_browse_and_recycle(self):
+        pids = set()
+
+        for i in range(6):
+            status, pid, data = self.post("/browse", {"url": f"{self.base_url}/{i}", "only": ["text"]})
+            pids.add(pid)
+
+            self.assertEqual(200, status)
+            self.assertEqual(f"/{i}", data["content"]["text"])
+            self.assertEqual({"text"}, set(data["content"].keys()))
+
+        # two workers with two jobs each have to be replaced at least once
+        self.assertGreater(len(pids), 2)
+
+    def test_batch(self):
+        urls = [f"{self.base_url}/a", "http://127.0.0.1:1/unreachable", f"{self.base_url}/b"]
+        status, _, data = self.post("/batch", {"urls": urls})
+
+        self.assertEqual(200, status)
+        self.assertEqual(urls, [item["url"] for item in data])
+        self.assertEqual("/a", data[0]["result"]["content"]["text"])
+        self.assertEqual("OSError", data[1]["error"]["type"])
+        self.assertEqual("/b", data[2]["result"]["content"]["text"])
+
+    def test_connection_closed(self):
+        connection = http.client.HTTPConnection(*self.address, timeout=10)
+
+        try:
+            connection.request("GET", "/health")
+            response = connection.getresponse()
+            response.read()
+
+            # an idle client does not keep the worker waiting for its next request
+            self.assertEqual("close", response.getheader("Connection"))
+        finally:
+            connection.close()
+
+    def test_request_not_an_object(self):
+        status, _, data = self.post("/browse", [1])
+
+        self.assertEqual(400, status)
+        self.assertEqual("ValueError", data["error"]["type"])
+
+    def test_browse_error(self):
+        status, _, data = self.post("/browse", {"url": "http://127.0.0.1:1/unreachable"})
+
+        self.assertEqual(502, status)
+        self.assertEqual("OSError", data["error"]["type"])
+
+
+class TestWorkerHTTPServer(TestCase):
+
+    def test_accept_without_connection(self):
+        sock = PreforkServer.bind(port=0)
+        server = WorkerHTTPServer(sock, browser_factory=None)
+
+        try:
+            # as for a worker which lost the connection to another one after both were woken
+            thread = threading.Thread(target=server._handle_request_noblock, daemon=True)
+            thread.start()
+            thread.join(timeout=5)
+
+            self.assertFalse(thread.is_alive())
+        finally:
+            sock.close()
+
+
+class TestRespawn(TestCase):
+
+    def setUp(self):
+        self.socket = socket.socket()
+        self.server = PreforkServer(self.socket, workers=1, max_failures=4)
+
+    def tearDown(self):
+        self.socket.close()
+
+    def exit(self, status: int, uptime: float = 0):
+        self.server.children[1] = time.monotonic() - uptime
+        self.server.respawn_delay(1, status)
+
+    def test_backoff_and_give_up(self):
+        with patch("time.sleep") as sleep:
+            for _ in range(3):
+                self.exit(1)
+
+            self.assertEqual([0.1, 0.2, 0.4], [call.args[0] for call in sleep.call_args_list])
+
+            with self.assertRaises(WorkersFailingError):
+                self.exit(1)
+
+    def test_reset_by_healthy_worker(self):
+        with patch("time.sleep") as sleep:
+            self.exit(1)
+            self.exit(1, uptime=PreforkServer.MIN_UPTIME)
+            self.exit(0)
+            self.exit(1)
+
+            self.assertEqual([0.1, 0.1], [call.args[0] for call in sleep.call_args_list])
@@ -1,8 +1,7 @@
-from datetime import timedelta, datetime
 from unittest import TestCase
 
 from sq_browse.postprocessing import Pipeline, TableProcessor, LxmlProcessor
-from sq_browse.structs import BrowserResponse
+from sq_browse.tests.utils import mock_response
 
 
 class TestTableProcessor(TestCase):
@@ -57,21 +56,68 @@ class TestTableProcessor(TestCase):
     def test_examples(self):
         for name, example, true_value in self.EXAMPLES:
             with self.subTest(name=name):
-                response = self.build_mock_response(example)
+                response = mock_response(example)
                 pipeline_result = self.pipeline.run(response)
 
                 self.assertEqual(1, len(pipeline_result["content"]["tables"]))
                 self.assertEqual(true_value, pipeline_result["content"]["tables"][0])
 
-    @staticmethod
-    def build_mock_response(content):
-        return BrowserResponse(
-            url="https://localhost/",
-            requested_url="https://localhost/",
-            status_code=200,
-            reason="OK",
-            response_headers={"Content-Type": "text/html"},
-            content=content,
-            timestamp_start=datetime(1970, 1, 1),
-            elapsed=timedelta(seconds=1),
-        )
\ No newline at end of file
+    def test_nested_tables(self):
+        response = mock_response(
+            "<table><tr><th>Name</th><th>Detail</th></tr>"
+            "<tr><td>Anton</td><td><table><tr><td>a</td><td>1</td></tr></table></td></tr></table>"
+        )
+        tables = self.pipeline.run(response)["content"]["tables"]
+
+        self.assertEqual([{"Name": "Anton", "Detail": "a1"}], tables[0]["rows"])
+        self.assertEqual({"rows": [("a", "1")]}, tables[1])
+
+    def test_columnar(self):
+        self.pipeline.components["table"].columnar = True
+        response = mock_response(
+            "<table><tr><th>Name</th><th>Number</th></tr><tr><td>Anton</td><td>1</td></tr>"
+            "<tr><td>Berta</td><td>2</td></tr><tr><td>odd</td></tr></table>"
+            "<table><tr><td>a</td></tr><tr><td>b</td><td>2</td></tr></table>"
+        )
+        tables = self.pipeline.run(response)["content"]["tables"]
+
+        self.assertEqual({"columns": {"Name": ["Anton", "Berta"], "Number": ["1", "2"]}, "rows": [("odd",)]},
+                         tables[0])
+        self.assertEqual({"columns": {"0": ["a", "b"], "1": [None, "2"]}}, tables[1])
+
+    def test_empty_rows(self):
+        cells = "<tr><td>a</td><td>b</td></tr><tr><td>1</td><td>2</td></tr>"
+        response = mock_response(
+            f"<table><tr></tr>{cells}</table>"
+            f"<table><tr><th>a</th><th>b</th></tr><tr></tr>{cells}</table>"
+        )
+        tables = self.pipeline.run(response)["content"]["tables"]
+
+        # a single row without cells is dropped, it does not name the columns
+        self.assertEqual({"rows": [("a", "b"), ("1", "2")]}, tables[0])
+        # rows without cells prevent naming the columns, so rows equal to the header row are kept
+        self.assertEqual({"rows": [("a", "b"), (), ("a", "b"), ("1", "2")]}, tables[1])
+
+    def test_max_rows(self):
+        self.pipeline.components["table"].max_rows = 2
+        rows = "".join(f"<tr><td>{i}</td><td>{i}</td></tr>" for i in range(5))
+        response = mock_response(f"<table><tr><th>a</th><th>b</th></tr>{rows}</table>")
+        table = self.pipeline.run(response)["content"]["tables"][0]
+
+        self.assertEqual([{"a": "0", "b": "0"}, {"a": "1", "b": "1"}], table["rows"])
+        self.assertTrue(table["truncated"])
+        self.assertEqual(5, table["total_rows"])
+
+    def test_max_rows_header_row_past_limit(self):
+        self.pipeline.components["table"].max_rows = 1
+        tables = [
+            "<table><tr><td>c</td><th>b</th><th></th></tr><tr><th>1</th></tr><tr><td>1</td></tr></table>",
+            "<table><tr><td>b</td></tr><tr><th>b</th></tr><tr><td>c</td></tr><tr><td>d</td></tr></table>",
+        ]
+        response = mock_response("".join(tables))
+        tables = self.pipeline.run(response)["content"]["tables"]
+
+        # the row past the limit equals the row naming the columns, nothing was cut
+        self.assertEqual({"rows": [("c", "b", "")]}, tables[0])
+        # rows equal to the row naming the columns do not count towards the limit
+        self.assertEqual({"rows": [{"b": "c"}], "truncated": True, "total_rows": 2}, tables[1])
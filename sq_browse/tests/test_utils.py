@@ -0,0 +1,44 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from sq_browse.browser import ThreadLocalBrowsers
+from sq_browse.tests.utils import StaticBrowser
+from sq_browse.utils import atomic_write
+
+
+class TestAtomicWrite(TestCase):
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "file")
+            atomic_write(path, "text")
+            atomic_write(path, b"bytes")
+
+            with open(path, "rb") as f:
+                self.assertEqual(b"bytes", f.read())
+
+            self.assertEqual(["file"], os.listdir(directory))
+
+    def test_failure_leaves_no_temporary_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(TypeError):
+                atomic_write(os.path.join(directory, "file"), None)
+
+            self.assertEqual([], os.listdir(directory))
+
+
+class TestThreadLocalBrowsers(TestCase):
+    def test_browser_per_thread_and_arguments(self):
+        browsers = ThreadLocalBrowsers(lambda content="": StaticBrowser(content))
+        browser = browsers.get()
+
+        self.assertIs(browser, browsers.get())
+        self.assertIsNot(browser, browsers.get(content="other"))
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(browsers.get()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(browser, other[0])
@@ -0,0 +1,127 @@
+import threading
+import time
+from contextlib import suppress
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from sq_browse.bench import fake_response
+from sq_browse.browser import Browser
+from sq_browse.structs import BrowserResponse
+
+
+def mock_response(content: bytes | str, url: str = "https://localhost/") -> BrowserResponse:
+    """A successful response with the content, as the benchmarks use it."""
+    return fake_response(content, url)
+
+
+class StaticBrowser(Browser):
+    """Returns the same content for every url."""
+
+    def __init__(self, content: str, **config):
+        super().__init__(**config)
+        self.content = content
+
+    def browse(self, url, headers=None) -> BrowserResponse:
+        return BrowserResponse(url, url, 200, "OK", {}, self.content, datetime.now(), timedelta(0))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves a small HTML page with an ETag after a short delay and tracks how many requests are in flight."""
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    client_ports = set()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):
+        cls = self.__class__
+
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.client_ports.add(self.client_address[1])
+
+        try:
+            if self.path.startswith("/slow"):
+                return self.send_slowly()
+
+            if self.path.startswith("/stall"):
+                return self.send_partially()
+
+            time.sleep(0.05)
+            etag = f'"{self.path}"'
+
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            links = ""
+
+            # pages of a small site for crawling
+            if self.path.startswith("/site"):
+                links = ("<a href='/site/imprint#top'>Imprint</a><a href='/site/contact?b=2&a=1'>Contact</a>"
+                         "<a href='/site/other'>Other</a><a href='mailto:a@localhost'>Contact</a>")
+
+            body = f"<html><body><p>{self.path}</p>{links}</body></html>".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def send_slowly(self):
+        """Send a body in small pieces, so that every single read is fast but the whole response takes 2 seconds."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", "20")
+        self.end_headers()
+
+        with suppress(ConnectionError):
+            for _ in range(20):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(0.1)
+
+    def send_partially(self):
+        """Send the headers and the start of the body, then stall for a second and close the connection."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", "20")
+        self.end_headers()
+
+        with suppress(ConnectionError):
+            self.wfile.write(b"<p>")
+            self.wfile.flush()
+            time.sleep(1)
+
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServerMixin(object):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        super().setUp()
+        StandInHandler.in_flight = 0
+        StandInHandler.max_in_flight = 0
+        StandInHandler.client_ports = set()
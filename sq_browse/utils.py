@@ -0,0 +1,56 @@
+import os
+import threading
+from contextlib import suppress
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str | None:
+    """Normalize an absolute http(s) url, such that equivalent urls are equal. Other urls yield None."""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+
+    # IPv6 addresses keep their brackets
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def cache_dir() -> str:
+    """Directory for caches of sq_browse in the user's cache directory."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(cache_home, "sq_browse")
+
+
+def atomic_write(path: str, data: bytes | str):
+    """Write the file through a temporary file, so that concurrent readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+
+        raise